@@ -0,0 +1,245 @@
+"""
+Admission control for the audio endpoints.
+
+Every audio request takes a token from two buckets: one per user, sized by
+subscription tier, and one global bucket that stands for our OpenAI rate
+limit. When either is empty the request is turned away with a wait time
+(sent as 429 + Retry-After) instead of being queued into upstream 429s that
+would also fail the work already in flight.
+
+The global refill rate adapts to OpenAI: every upstream 429 halves it
+(multiplicative decrease, at most once per cooldown) and successful calls
+slowly restore it (additive increase). A Retry-After from OpenAI pauses
+admissions for that long.
+
+Buckets live in process memory by default. RedisBucketStore keeps them in
+Redis instead, so several uvicorn workers share one budget. The adaptive
+factor stays per process; every worker sees the same upstream 429s and
+backs off alike.
+"""
+
+import math
+import os
+import time
+from collections import OrderedDict
+
+# Default (burst, requests per minute) per subscription tier
+DEFAULT_TIER_BUCKETS = {"free": (2, 2.0), "basic": (5, 10.0), "pro": (10, 30.0)}
+
+
+def tier_buckets_from_env():
+    return {
+        tier: (
+            int(os.environ.get(f"ADMISSION_BURST_{tier.upper()}", burst)),
+            float(os.environ.get(f"ADMISSION_RATE_{tier.upper()}", rate))
+        )
+        for tier, (burst, rate) in DEFAULT_TIER_BUCKETS.items()
+    }
+
+
+class MemoryBucketStore:
+    """Token buckets in a size-bounded dict; only safe within one event loop."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+
+    async def take(self, buckets: list, cost: int = 1) -> list:
+        """Take `cost` tokens from every (key, capacity, rate_per_second) bucket, or from none.
+
+        Returns the seconds each bucket needs before it can pay; all zeros
+        means the tokens were taken. A cost above a bucket's capacity is
+        admitted once the bucket is full and leaves it in debt.
+        """
+        now = time.monotonic()
+        states = []
+        waits = []
+        for key, capacity, rate in buckets:
+            state = self._buckets.get(key)
+            if state is None:
+                state = [float(capacity), now]
+            tokens = min(capacity, state[0] + (now - state[1]) * rate)
+            needed = min(cost, capacity)
+            states.append((key, tokens))
+            waits.append(0.0 if tokens >= needed else (needed - tokens) / rate)
+        if any(waits):
+            return waits
+        for key, tokens in states:
+            self._buckets[key] = [tokens - cost, now]
+            self._buckets.move_to_end(key)
+        # A forgotten bucket comes back full, so eviction only ever errs towards admitting
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return waits
+
+    async def aclose(self):
+        pass
+
+
+# Same algorithm as MemoryBucketStore.take, run atomically inside Redis
+_TAKE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local waits = {}
+local blocked = false
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local available = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated) * rate)
+    local needed = math.min(cost, capacity)
+    tokens[i] = available
+    if available < needed then
+        blocked = true
+        waits[i] = tostring((needed - available) / rate)
+    else
+        waits[i] = '0'
+    end
+end
+if not blocked then
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[2 * i])
+        local rate = tonumber(ARGV[2 * i + 1])
+        redis.call('HSET', key, 'tokens', tostring(tokens[i] - cost), 'updated', tostring(now))
+        redis.call('PEXPIRE', key, math.ceil((capacity + cost) / rate * 1000) + 1000)
+    end
+end
+return waits
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared between processes through Redis (needs the redis package)."""
+
+    def __init__(self, url: str, prefix: str = "admission:"):
+        import redis.asyncio as redis
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(_TAKE_SCRIPT)
+
+    async def take(self, buckets: list, cost: int = 1) -> list:
+        keys = [self.prefix + key for key, _, _ in buckets]
+        args = [cost]
+        for _, capacity, rate in buckets:
+            args.extend([capacity, rate])
+        return [float(wait) for wait in await self._take(keys=keys, args=args)]
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+
+class AdaptiveRate:
+    """AIMD factor applied to the global refill rate, driven by OpenAI responses."""
+
+    def __init__(self, min_factor: float = 0.1, decrease: float = 0.5, increase: float = 0.05,
+                 cooldown: float = 10.0, increase_interval: float = 1.0, max_pause: float = 60.0):
+        self.min_factor = min_factor
+        self.decrease = decrease
+        self.increase = increase
+        self.cooldown = cooldown
+        self.increase_interval = increase_interval
+        self.max_pause = max_pause
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self.rate_limited_count = 0
+        self._last_decrease = float("-inf")
+        self._last_increase = float("-inf")
+
+    def rate_limited(self, retry_after: float = None):
+        """Record an upstream 429."""
+        now = time.monotonic()
+        self.rate_limited_count += 1
+        # One burst of concurrent 429s is a single signal, not many
+        if now - self._last_decrease >= self.cooldown:
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+            self._last_decrease = now
+            self._last_increase = now
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + min(retry_after, self.max_pause))
+
+    def succeeded(self):
+        """Record a successful upstream call."""
+        if self.factor >= 1.0:
+            return
+        now = time.monotonic()
+        if now - self._last_increase >= self.increase_interval:
+            self.factor = min(1.0, self.factor + self.increase)
+            self._last_increase = now
+
+    def pause_remaining(self) -> float:
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "factor": round(self.factor, 3),
+            "paused_seconds": round(self.pause_remaining(), 2),
+            "rate_limited": self.rate_limited_count,
+        }
+
+
+class AdmissionController:
+    """Per-user and global token buckets in front of the audio pipeline.
+
+    `tier_buckets` maps tier -> (burst, requests per minute); unknown tiers
+    get the free tier's bucket. A store that fails (Redis down) admits the
+    request rather than taking the API down with it.
+    """
+
+    def __init__(self, store=None, tier_buckets: dict = None, global_burst: int = 20,
+                 global_rate: float = 60.0, adaptive: AdaptiveRate = None):
+        self.store = store or MemoryBucketStore()
+        self.tier_buckets = dict(tier_buckets or DEFAULT_TIER_BUCKETS)
+        self.global_burst = global_burst
+        self.global_rate = global_rate
+        self.adaptive = adaptive or AdaptiveRate()
+        self.admitted = 0
+        self.rejected = {"user": 0, "global": 0, "upstream": 0}
+        self.store_errors = 0
+
+    async def admit(self, user_id: str, tier: str = "free", cost: int = 1):
+        """Return (retry_after_seconds, scope); (0.0, None) when admitted."""
+        pause = self.adaptive.pause_remaining()
+        if pause > 0:
+            self.rejected["upstream"] += 1
+            return pause, "upstream"
+
+        burst, per_minute = self.tier_buckets.get(tier, self.tier_buckets["free"])
+        buckets = [
+            (f"user:{user_id}", burst, per_minute / 60),
+            ("global", self.global_burst, self.global_rate * self.adaptive.factor / 60),
+        ]
+        try:
+            waits = await self.store.take(buckets, cost)
+        except Exception as e:
+            print(f"Error checking admission buckets: {str(e)}")
+            self.store_errors += 1
+            self.admitted += 1
+            return 0.0, None
+
+        if not any(waits):
+            self.admitted += 1
+            return 0.0, None
+        scope = "user" if waits[0] >= waits[1] else "global"
+        self.rejected[scope] += 1
+        return max(waits), scope
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "store_errors": self.store_errors,
+            "global_rate_per_minute": round(self.global_rate * self.adaptive.factor, 2),
+            **self.adaptive.stats(),
+        }
+
+    async def aclose(self):
+        await self.store.aclose()
+
+
+def retry_after_header(seconds: float) -> str:
+    # Retry-After takes whole seconds; round up so a prompt retry isn't turned away again
+    return str(max(1, math.ceil(seconds)))
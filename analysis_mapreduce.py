@@ -0,0 +1,277 @@
+"""
+Map-reduce analysis for transcripts too long for a single GPT-4 prompt.
+
+The transcript is split on sentence boundaries into chunks of at most
+`chunk_tokens` tokens that overlap by `overlap_tokens`. Each chunk is
+analyzed on its own (the map step, with bounded concurrency). The partial
+key points, pain points, objections and next steps are then merged by one
+more model call (the reduce step) into an analysis in the same format as
+the single-prompt path, so analysis_parser reads it unchanged.
+
+Map results are cached by chunk content, so retrying a conversation after a
+partial failure only re-runs the chunks that failed. Token counts use
+tiktoken when it is installed and fall back to a characters/4 estimate.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+
+from analysis_parser import LIST_FIELDS, parse_analysis
+
+# Bump when the map prompt changes so stale cached partials aren't reused
+MAP_PROMPT_VERSION = "1"
+
+MAP_INSTRUCTIONS = (
+    "This is part {index} of {total} of a sales call transcript between a rep and a doctor or medspa "
+    "owner in the aesthetic or dental industry. Parts overlap slightly.\n\n{chunk}\n\n"
+    "List only what appears in this part:\n1. Key points discussed\n2. Customer pain points\n"
+    "3. Objections raised\n4. Next steps\n5. Overall sentiment"
+)
+
+REDUCE_INSTRUCTIONS = (
+    "Below are analyses of consecutive parts of one sales call with a doctor or medspa owner in the "
+    "aesthetic or dental industry. Merge them into a single analysis of the whole call, combining "
+    "duplicates and keeping the most specific wording.\n\n{partials}\n\nProvide insights on:\n"
+    "1. Key points discussed\n2. Customer pain points\n3. Objections raised\n4. Next steps\n5. Overall sentiment"
+)
+
+JSON_INSTRUCTION = (
+    "\n\nRespond with a JSON object with the keys key_points, pain_points, objections and next_steps "
+    "(arrays of strings) and sentiment (positive, negative or neutral)."
+)
+
+_FIELD_TITLES = {
+    "key_points": "Key points discussed",
+    "pain_points": "Customer pain points",
+    "objections": "Objections raised",
+    "next_steps": "Next steps",
+}
+
+# Sentence ends and speaker turns are the preferred places to cut
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+class MapReduceConfig:
+    def __init__(self, threshold_tokens: int = 6000, chunk_tokens: int = 3000, overlap_tokens: int = 200,
+                 reduce_tokens: int = 6000, parallelism: int = 4, model: str = "gpt-4"):
+        self.threshold_tokens = threshold_tokens
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        self.reduce_tokens = reduce_tokens
+        self.parallelism = max(1, parallelism)
+        self.model = model
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            threshold_tokens=int(os.environ.get("ANALYSIS_MAPREDUCE_THRESHOLD_TOKENS", "6000")),
+            chunk_tokens=int(os.environ.get("ANALYSIS_CHUNK_TOKENS", "3000")),
+            overlap_tokens=int(os.environ.get("ANALYSIS_CHUNK_OVERLAP_TOKENS", "200")),
+            reduce_tokens=int(os.environ.get("ANALYSIS_REDUCE_TOKENS", "6000")),
+            parallelism=int(os.environ.get("ANALYSIS_MAP_PARALLELISM", "4")),
+        )
+
+
+def token_counter(model: str = "gpt-4"):
+    """Return (count_tokens, name) using tiktoken when available."""
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(model)
+        return (lambda text: len(encoding.encode(text, disallowed_special=()))), "tiktoken"
+    except Exception:
+        return (lambda text: (len(text) + 3) // 4), "estimate"
+
+
+def split_transcript(text: str, chunk_tokens: int, overlap_tokens: int, count_tokens):
+    """Split `text` into chunks of at most `chunk_tokens`, overlapping by about `overlap_tokens`."""
+    units = []
+    for sentence in _SENTENCE.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        tokens = count_tokens(sentence)
+        if tokens <= chunk_tokens:
+            units.append((sentence, tokens))
+            continue
+        # A single run-on "sentence" longer than a chunk is cut by characters
+        step = max(1, len(sentence) * chunk_tokens // tokens)
+        for i in range(0, len(sentence), step):
+            piece = sentence[i:i + step]
+            units.append((piece, count_tokens(piece)))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for unit in units:
+        if current and current_tokens + unit[1] > chunk_tokens:
+            chunks.append(" ".join(sentence for sentence, _ in current))
+            # Carry the tail of this chunk into the next one
+            carried, carried_tokens = [], 0
+            for previous in reversed(current):
+                if carried_tokens + previous[1] > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous[1]
+            current, current_tokens = carried, carried_tokens
+        current.append(unit)
+        current_tokens += unit[1]
+    if current:
+        chunks.append(" ".join(sentence for sentence, _ in current))
+    return chunks
+
+
+def chunk_cache_key(chunk: str, model: str, json_mode: bool) -> str:
+    digest = hashlib.sha256(chunk.encode()).hexdigest()
+    return f"{model}-{MAP_PROMPT_VERSION}-{'json' if json_mode else 'text'}-{digest}"
+
+
+def build_map_messages(system_prompt: str, chunk: str, index: int, total: int, json_mode: bool):
+    prompt = MAP_INSTRUCTIONS.format(index=index + 1, total=total, chunk=chunk)
+    if json_mode:
+        prompt += JSON_INSTRUCTION
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+
+
+def render_partials(partials: list) -> str:
+    sections = []
+    for number, parsed in enumerate(partials, 1):
+        lines = [f"Part {number}:"]
+        for field in LIST_FIELDS:
+            if parsed[field]:
+                lines.append(f"{_FIELD_TITLES[field]}:")
+                lines.extend(f"- {item}" for item in parsed[field])
+        lines.append(f"Overall sentiment: {parsed['sentiment']}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def build_reduce_messages(system_prompt: str, partials: list, json_mode: bool):
+    prompt = REDUCE_INSTRUCTIONS.format(partials=render_partials(partials))
+    if json_mode:
+        prompt += JSON_INSTRUCTION
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+
+
+def dedupe_partials(partials: list) -> list:
+    """Drop items repeated verbatim in later partials (mostly from chunk overlaps)."""
+    seen = set()
+    deduped = []
+    for parsed in partials:
+        kept = dict(parsed)
+        for field in LIST_FIELDS:
+            items = []
+            for item in parsed[field]:
+                key = (field, " ".join(item.lower().split()))
+                if key not in seen:
+                    seen.add(key)
+                    items.append(item)
+            kept[field] = items
+        deduped.append(kept)
+    return deduped
+
+
+def _messages_tokens(messages: list, count_tokens) -> int:
+    # Roughly 4 tokens of framing per message
+    return sum(count_tokens(message["content"]) + 4 for message in messages)
+
+
+class MapReduceAnalyzer:
+    """Runs the map and reduce steps against an OpenAIClient.
+
+    `cache` is any object with get(key) and set(key, value), e.g. a TTLCache.
+    """
+
+    def __init__(self, client, config: MapReduceConfig, cache=None):
+        self.client = client
+        self.config = config
+        self.cache = cache
+        self.count_tokens, self.token_counter_name = token_counter(config.model)
+
+    def needs_map_reduce(self, transcription: str) -> bool:
+        return self.count_tokens(transcription) > self.config.threshold_tokens
+
+    async def map(self, transcription: str, system_prompt: str, tier: str = "free", json_mode: bool = False,
+                  **options):
+        """Analyze every chunk and return (partials, stats).
+
+        Successful chunks are cached before any failure is raised, so a retry
+        only re-runs the chunks that failed.
+        """
+        start = time.perf_counter()
+        chunks = split_transcript(transcription, self.config.chunk_tokens, self.config.overlap_tokens, self.count_tokens)
+        semaphore = asyncio.Semaphore(self.config.parallelism)
+        stats = {
+            "transcript_tokens": self.count_tokens(transcription),
+            "chunks": len(chunks),
+            "cached_chunks": 0,
+            "map_prompt_tokens": 0,
+            "map_completion_tokens": 0,
+        }
+
+        async def run_chunk(index: int, chunk: str):
+            key = chunk_cache_key(chunk, self.config.model, json_mode)
+            if self.cache is not None:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    stats["cached_chunks"] += 1
+                    return parse_analysis(cached)
+            messages = build_map_messages(system_prompt, chunk, index, len(chunks), json_mode)
+            async with semaphore:
+                text = await self.client.chat(messages, tier=tier, **{"model": self.config.model, **options})
+            stats["map_prompt_tokens"] += _messages_tokens(messages, self.count_tokens)
+            stats["map_completion_tokens"] += self.count_tokens(text)
+            if self.cache is not None:
+                self.cache.set(key, text)
+            return parse_analysis(text)
+
+        outcomes = await asyncio.gather(*(run_chunk(i, chunk) for i, chunk in enumerate(chunks)), return_exceptions=True)
+        stats["map_seconds"] = round(time.perf_counter() - start, 3)
+        failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+        if failures:
+            stats["failed_chunks"] = len(failures)
+            raise RuntimeError(f"{len(failures)} of {len(chunks)} transcript chunks failed: {str(failures[0])}") from failures[0]
+        return dedupe_partials(outcomes), stats
+
+    async def reduce_groups(self, partials: list, system_prompt: str, tier: str = "free", json_mode: bool = False,
+                            stats: dict = None, **options):
+        """Pre-merge groups of partials until one reduce prompt fits in `reduce_tokens`.
+
+        Very long calls can produce more partial output than one prompt holds;
+        those are merged in rounds. Returns the partials for the final reduce.
+        """
+        stats = stats if stats is not None else {}
+        while len(partials) > 1 and _messages_tokens(build_reduce_messages(system_prompt, partials, json_mode), self.count_tokens) > self.config.reduce_tokens:
+            groups, group = [], []
+            for parsed in partials:
+                if group and _messages_tokens(build_reduce_messages(system_prompt, group + [parsed], json_mode), self.count_tokens) > self.config.reduce_tokens:
+                    groups.append(group)
+                    group = []
+                group.append(parsed)
+            groups.append(group)
+            if len(groups) == len(partials):
+                # Every partial is too big to pair with another; the final reduce will have to take them as is
+                break
+            texts = await asyncio.gather(*(self._reduce(group, system_prompt, tier, json_mode, stats, **options) for group in groups))
+            partials = [parse_analysis(text) for text in texts]
+            stats["reduce_rounds"] = stats.get("reduce_rounds", 0) + 1
+        return partials
+
+    async def _reduce(self, partials: list, system_prompt: str, tier: str, json_mode: bool, stats: dict, **options):
+        messages = build_reduce_messages(system_prompt, partials, json_mode)
+        text = await self.client.chat(messages, tier=tier, **{"model": self.config.model, **options})
+        stats["reduce_prompt_tokens"] = stats.get("reduce_prompt_tokens", 0) + _messages_tokens(messages, self.count_tokens)
+        stats["reduce_completion_tokens"] = stats.get("reduce_completion_tokens", 0) + self.count_tokens(text)
+        return text
+
+    async def analyze(self, transcription: str, system_prompt: str, tier: str = "free", json_mode: bool = False,
+                      **options):
+        """Map, then reduce. Returns {"text": analysis_text, "stats": {...}}."""
+        partials, stats = await self.map(transcription, system_prompt, tier, json_mode, **options)
+        start = time.perf_counter()
+        partials = await self.reduce_groups(partials, system_prompt, tier, json_mode, stats, **options)
+        text = await self._reduce(partials, system_prompt, tier, json_mode, stats, **options)
+        stats["reduce_seconds"] = round(time.perf_counter() - start, 3)
+        stats["token_counter"] = self.token_counter_name
+        return {"text": text, "stats": stats}
@@ -0,0 +1,268 @@
+"""
+Structured parsing of GPT-4 sales call analyses.
+
+The model's answer is read in a single pass, and the parser remembers which
+section header ("Key points discussed", "3. Objections raised",
+"**Next Steps:**", ...) it is under, so bullet points land in the section
+they belong to rather than wherever a keyword happens to appear. JSON-mode
+output is accepted as well.
+
+Most lines are "- item", "1. item" or "Label: value", and those are handled
+with string methods and a dict lookup of the label. A regex only runs on the
+few lines that start with other decoration ("## ", "(a) ", "**") or look like
+a header of some other section.
+"""
+
+import itertools
+import json
+import re
+
+LIST_FIELDS = ("key_points", "pain_points", "objections", "next_steps")
+
+# Leading list/markdown decoration: headings, bullets, numbering, bold markers
+_DECORATION = re.compile(r"^(?:#{1,6}\s*|[-*•>]\s+|\(?(?:\d{1,2}|[a-zA-Z])[.)]\s+|\*\*|__)+")
+
+_DECORATION_START = frozenset("#-*•>(_0123456789")
+_BULLETS = frozenset("-*•>")
+_NUMBERING = (". ", ") ")
+
+
+def _label_table():
+    """Every section label spelling, lower-cased, mapped to its field."""
+    spellings = {
+        "key_points": (("key ",), ("point", "points", "takeaway", "takeaways", "topic", "topics"), ("", " discussed", " covered")),
+        "pain_points": (("", "customer ", "client ", "prospect ", "prospect's "), ("pain point", "pain points"), ("", " identified", " raised")),
+        "objections": (("", "customer ", "client "), ("objection", "objections"), ("", " raised")),
+        "next_steps": (("", "recommended "), ("next step", "next steps")),
+        "sentiment": (("", "overall "), ("sentiment",)),
+    }
+    return {"".join(parts): field for field, words in spellings.items() for parts in itertools.product(*words)}
+
+
+# A label is either the whole line (a section header) or followed by a separator and a value
+_LABELS = _label_table()
+# A separator further in than this (allowing for a little whitespace) can't follow a label
+_LABEL_WINDOW = max(len(label) for label in _LABELS) + 3
+_LABEL_PREFIXES = ("key ", "pain ", "customer ", "client ", "prospect", "objection", "recommended ", "next step", "overall ", "sentiment")
+_LABEL_PREFIX_LENGTH = max(len(prefix) for prefix in _LABEL_PREFIXES)
+_LABEL_DASHES = ("-", "–", "—")
+
+# Any other header ("6. Recommendations:", "## Summary") ends the current section
+_OTHER_HEADER = re.compile(r"^(?:#{1,6}\s+.+|\*\*[^*]{1,60}\*\*:?|(?:\d{1,2}[.)]\s+)?[A-Z][\w '/&-]{0,50}:)\s*$")
+
+_POLARITY = re.compile(r"\b(positive|negative|neutral)\b", re.IGNORECASE)
+
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+# Accepted JSON keys for each field
+_JSON_KEYS = {
+    "key_points": ("key_points", "keyPoints", "key_points_discussed"),
+    "pain_points": ("pain_points", "painPoints", "customer_pain_points"),
+    "objections": ("objections", "objections_raised"),
+    "next_steps": ("next_steps", "nextSteps"),
+    "sentiment": ("sentiment", "overall_sentiment", "overallSentiment"),
+}
+
+
+def empty_analysis():
+    return {
+        "key_points": [],
+        "pain_points": [],
+        "objections": [],
+        "next_steps": [],
+        "sentiment": "neutral",
+    }
+
+
+def _polarity(text: str):
+    match = _POLARITY.search(text)
+    return match.group(1).lower() if match else None
+
+
+class AnalysisParser:
+    """Incremental parser; feed it complete lines in order, then read `parsed`."""
+
+    def __init__(self):
+        self.parsed = empty_analysis()
+        self.section = None
+        self._sentiment_set = False
+
+    def feed_text(self, text: str):
+        """Parse one or more complete lines and return the (field, value) pairs they contributed."""
+        insights = []
+        parsed = self.parsed
+        section = self.section
+        emphasis = "**" in text or "__" in text
+        for stripped in map(str.strip, text.split("\n")):
+            if not stripped:
+                continue
+            # Plain bullets and numbering are sliced off; anything else that may be decoration goes to the regex
+            first = stripped[0]
+            if first in _BULLETS and stripped[1:2] == " ":
+                cleaned = stripped[2:].lstrip()
+            elif first.isdigit() and stripped[1:3] in _NUMBERING:
+                cleaned = stripped[3:].lstrip()
+            elif first in _DECORATION_START or stripped[1:2] in (".", ")"):
+                decoration = _DECORATION.match(stripped)
+                cleaned = stripped[decoration.end():].lstrip() if decoration else stripped
+            else:
+                cleaned = stripped
+            if emphasis and ("**" in cleaned or "__" in cleaned):
+                cleaned = cleaned.replace("**", "").replace("__", "").strip()
+            if not cleaned:
+                continue
+
+            # A label is the whole line or what comes before its first ":" (or a dash before that)
+            if cleaned[:_LABEL_PREFIX_LENGTH].lower().startswith(_LABEL_PREFIXES):
+                head, _, value = cleaned.partition(":")
+                field = _LABELS.get(head.rstrip().lower())
+                if field is None:
+                    cuts = [index for index in (head.find(dash, 0, _LABEL_WINDOW) for dash in _LABEL_DASHES) if index != -1]
+                    if cuts:
+                        cut = min(cuts)
+                        field = _LABELS.get(cleaned[:cut].rstrip().lower())
+                        value = cleaned[cut + 1:]
+            else:
+                field = None
+            if field is not None:
+                section = field
+                value = value.strip()
+                if section == "sentiment":
+                    self._sentiment_set = False
+                    insight = self._add_sentiment(value)
+                    if insight:
+                        insights.append(insight)
+                elif value:
+                    parsed[section].append(value)
+                    insights.append((section, value))
+                continue
+
+            if section is None:
+                continue
+            if (stripped[-1] == ":" or first == "#" or stripped.startswith("**")) and _OTHER_HEADER.match(stripped):
+                section = None
+            elif section == "sentiment":
+                insight = self._add_sentiment(cleaned)
+                if insight:
+                    insights.append(insight)
+            else:
+                parsed[section].append(cleaned)
+                insights.append((section, cleaned))
+        self.section = section
+        return insights
+
+    def _add_sentiment(self, value: str):
+        # The first polarity stated in a sentiment section wins
+        if self._sentiment_set:
+            return None
+        polarity = _polarity(value)
+        if not polarity:
+            return None
+        self._sentiment_set = True
+        self.parsed["sentiment"] = polarity
+        return "sentiment", polarity
+
+
+def _as_text(item):
+    if isinstance(item, dict):
+        for key in ("text", "point", "description", "value", "summary"):
+            if isinstance(item.get(key), str):
+                return item[key].strip()
+        return json.dumps(item)
+    return str(item).strip()
+
+
+def parse_json_analysis(data: dict):
+    """Normalize a JSON-mode analysis into the structured fields."""
+    parsed = empty_analysis()
+    for field, keys in _JSON_KEYS.items():
+        value = next((data[key] for key in keys if key in data), None)
+        if value is None:
+            continue
+        if field == "sentiment":
+            if isinstance(value, dict):
+                value = value.get("overall") or value.get("label") or json.dumps(value)
+            parsed["sentiment"] = _polarity(str(value)) or "neutral"
+        else:
+            items = value if isinstance(value, list) else [value]
+            parsed[field] = [text for text in (_as_text(item) for item in items) if text]
+    return parsed
+
+
+def _try_json(text: str):
+    candidate = text.strip()
+    if candidate[:1] not in ("{", "`"):
+        return None
+    candidate = _JSON_FENCE.sub("", candidate)
+    if not candidate.startswith("{"):
+        return None
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_analysis(analysis_text: str):
+    """Extract key points, pain points, objections, next steps and sentiment."""
+    data = _try_json(analysis_text)
+    if data is not None:
+        return parse_json_analysis(data)
+    parser = AnalysisParser()
+    parser.feed_text(analysis_text)
+    return parser.parsed
+
+
+class AnalysisStreamParser:
+    """Parses analysis text as it streams in, one complete line at a time.
+
+    Feeding the whole text in any number of pieces and then calling close()
+    leaves `parsed` equal to parse_analysis() of the same text. JSON-mode
+    output can only be parsed once complete, so its insights arrive on close().
+    """
+
+    def __init__(self):
+        self._parser = AnalysisParser()
+        self._buffer = ""
+        self._text = []
+        self._json = None
+
+    @property
+    def parsed(self):
+        return self._parser.parsed
+
+    def feed(self, text: str):
+        """Add streamed text and return the insights from any lines it completed."""
+        if self._json is None:
+            self._text.append(text)
+            start = "".join(self._text).lstrip()
+            if not start:
+                return []
+            self._json = start.startswith("{") or start.startswith("`")
+            if not self._json:
+                text = "".join(self._text)
+                self._text = []
+        elif self._json:
+            self._text.append(text)
+        if self._json:
+            return []
+        self._buffer += text
+        if "\n" not in text:
+            return []
+        lines, _, self._buffer = self._buffer.rpartition("\n")
+        return self._parser.feed_text(lines)
+
+    def close(self):
+        if self._json:
+            full_text = "".join(self._text)
+            data = _try_json(full_text)
+            if data is None:
+                # Not valid JSON after all; fall back to line parsing
+                self._parser.feed_text(full_text)
+            else:
+                self._parser.parsed = parse_json_analysis(data)
+            parsed = self._parser.parsed
+            return [(field, value) for field in LIST_FIELDS for value in parsed[field]] + [("sentiment", parsed["sentiment"])]
+        insights = self._parser.feed_text(self._buffer)
+        self._buffer = ""
+        return insights
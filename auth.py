@@ -0,0 +1,139 @@
+"""
+Verification of Supabase access tokens.
+
+Tokens are checked against the project's JWT secret (HS256) when
+SUPABASE_JWT_SECRET is set, otherwise against the project's JWKS, whose keys
+are fetched once and cached. A token signed with a key id that isn't in the
+cached set triggers a refetch (keys are rotated), but at most once every
+`jwks_refresh_interval` seconds, so tokens with made-up key ids can't turn
+into a stream of JWKS requests. Verified tokens are memoized in a bounded
+LRU until their `exp`, so repeated requests from the same session skip the
+signature check entirely. Anything that fails verification is rejected and
+never cached.
+
+verify() may block on a JWKS fetch; async callers check cached() first and
+on a miss run verify(token, check_cache=False) in a worker thread, so the
+cache is looked up once.
+"""
+
+import hashlib
+import threading
+import time
+from typing import Optional
+
+import jwt
+from pydantic import BaseModel
+
+from cache import TTLCache
+
+
+class AuthError(Exception):
+    pass
+
+
+class Principal(BaseModel):
+    user_id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    expires_at: int
+    claims: dict = {}
+
+
+class JWTVerifier:
+    def __init__(self, secret: str = None, jwks_url: str = None, audience: str = "authenticated",
+                 cache_size: int = 10000, jwks_lifespan: int = 3600, leeway: int = 0,
+                 jwks_refresh_interval: float = 60):
+        if not secret and not jwks_url:
+            raise ValueError("A JWT secret or a JWKS URL is required")
+        self.secret = secret
+        self.audience = audience or None
+        self.leeway = leeway
+        self._jwks = None
+        self.jwks_refresh_interval = jwks_refresh_interval
+        self._refresh_lock = threading.Lock()
+        self._last_refresh = None
+        if not secret:
+            self._jwks = jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=jwks_lifespan)
+        self._cache = TTLCache(maxsize=cache_size, ttl=None)
+
+    def _key_for(self, token: str):
+        if self.secret:
+            return self.secret, ["HS256"]
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256":
+            # Projects still on the legacy shared secret need SUPABASE_JWT_SECRET set
+            raise jwt.InvalidTokenError("Token is signed with the project's JWT secret (HS256), which is not configured")
+        kid = header.get("kid")
+        signing_key = self._find_key(self._jwks.get_signing_keys(), kid)
+        if signing_key is None:
+            with self._refresh_lock:
+                now = time.monotonic()
+                if self._last_refresh is None or now - self._last_refresh >= self.jwks_refresh_interval:
+                    # Counted before fetching, so a failing endpoint is not retried per request either
+                    self._last_refresh = now
+                    keys = self._jwks.get_signing_keys(refresh=True)
+                else:
+                    # Another request may have refreshed while this one waited
+                    keys = self._jwks.get_signing_keys()
+            signing_key = self._find_key(keys, kid)
+        if signing_key is None:
+            raise jwt.PyJWKClientError(f'Unable to find a signing key that matches: "{kid}"')
+        return signing_key.key, ["RS256", "ES256"]
+
+    @staticmethod
+    def _find_key(keys, kid):
+        return next((key for key in keys if key.key_id == kid), None)
+
+    def _decode(self, token: str) -> dict:
+        key, algorithms = self._key_for(token)
+        return jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"], "verify_aud": self.audience is not None}
+        )
+
+    @staticmethod
+    def _cache_key(token: str) -> bytes:
+        # Keyed by digest so the cache doesn't hold bearer tokens
+        return hashlib.sha256(token.encode()).digest()
+
+    def cached(self, token: str) -> Optional[Principal]:
+        """Return the memoized principal for an already verified token, or None. Never blocks."""
+        return self._cache.get(self._cache_key(token))
+
+    def verify(self, token: str, check_cache: bool = True) -> Principal:
+        """Return the token's principal, raising AuthError if it does not verify.
+
+        Pass check_cache=False when cached() has just missed for the same token.
+        """
+        cache_key = self._cache_key(token)
+        if check_cache:
+            principal = self._cache.get(cache_key)
+            if principal is not None:
+                return principal
+        try:
+            claims = self._decode(token)
+        except (jwt.PyJWTError, ValueError) as e:
+            raise AuthError(str(e))
+        principal = Principal(
+            user_id=claims["sub"],
+            email=claims.get("email"),
+            role=claims.get("role"),
+            expires_at=int(claims["exp"]),
+            claims=claims
+        )
+        remaining = principal.expires_at + self.leeway - time.time()
+        if remaining > 0:
+            self._cache.set(cache_key, principal, ttl=remaining)
+        return principal
+
+    def warm(self):
+        """Fetch the JWKS ahead of the first request (blocking)."""
+        if self._jwks is not None:
+            self._jwks.get_signing_keys()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
@@ -1,15 +1,32 @@
 from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 import os
-import stripe
-import jwt
-from supabase import create_client, Client
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
-import openai
-from pydantic import BaseModel
+import asyncio
+import time
+from pydantic import BaseModel, ValidationError, field_validator
+from typing import List, Optional
 import uuid
+import tempfile
+from urllib.parse import urlparse
+from job_queue import JobQueue
+from cache import TTLCache
+from transcript_cache import TranscriptCache
+from chunked_transcription import ChunkingConfig, transcribe_chunked, single_transcript
+from analysis_parser import parse_analysis, AnalysisStreamParser
+from analysis_mapreduce import MapReduceConfig, MapReduceAnalyzer, build_reduce_messages
+from write_behind import WriteBehindBuffer
+from stripe_events import StripeEventProcessor
+from auth import JWTVerifier, Principal, AuthError
+from metrics import Registry, MetricsMiddleware, timed, current_request_id, set_request_id, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from storage import SupabaseStorage, MultipartFileReader, UploadStream, UploadError, StorageError, FileTooLarge, upload_path
+from openai_client import OpenAIClient, HTTPOpenAIBackend, tier_concurrency_from_env
+from rollups import RollupService, team_scope, user_scope, first_week, etag_matches
+from search import search_params, search_results, SearchError, NotTeamMember
+from clients import LazyClient, DeepHealthCheck, supabase_factory, stripe_factory
+from admission import AdmissionController, AdaptiveRate, MemoryBucketStore, RedisBucketStore, tier_buckets_from_env, retry_after_header
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -20,32 +37,159 @@ app.add_middleware(
     allow_origins=["https://muilinguistics.netlify.app", "http://localhost:5173"],
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS", "DELETE", "PATCH", "PUT"],
-    allow_headers=["Content-Type", "Authorization", "X-User-ID"],
+    allow_headers=["Content-Type", "Authorization", "X-User-ID", "X-Request-ID", "If-None-Match"],
+    expose_headers=["X-Request-ID", "ETag"],
 )
 
-# Initialize Supabase client
+# Metrics, served from /metrics
+metrics_registry = Registry()
+http_requests_total = metrics_registry.counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+http_request_seconds = metrics_registry.histogram("http_request_seconds", "HTTP request latency", ["method", "route"])
+stage_seconds = metrics_registry.histogram("pipeline_stage_seconds", "Latency of each pipeline stage", ["stage"])
+stage_errors_total = metrics_registry.counter("pipeline_stage_errors_total", "Failed pipeline stages", ["stage"])
+supabase_write_seconds = metrics_registry.histogram("supabase_write_seconds", "Latency of Supabase writes", ["table"])
+supabase_write_errors_total = metrics_registry.counter("supabase_write_errors_total", "Failed Supabase writes", ["table"])
+slow_stage_seconds = float(os.environ.get("SLOW_STAGE_SECONDS", "30"))
+
+def stage_timer(stage: str):
+    return timed(stage_seconds, stage_errors_total, stage, slow_seconds=slow_stage_seconds)
+
+def supabase_write_timer(table: str):
+    return timed(supabase_write_seconds, supabase_write_errors_total, table, slow_seconds=slow_stage_seconds)
+
+# Outermost, so the request id is set before anything else runs
+app.add_middleware(MetricsMiddleware, requests_total=http_requests_total, request_seconds=http_request_seconds)
+
+# Supabase and Stripe SDKs are imported and their clients built on first use
+# (or by the startup hook), not when this module is imported
 supabase_url = os.environ.get("SUPABASE_URL")
 supabase_key = os.environ.get("SUPABASE_KEY")
-supabase = create_client(supabase_url, supabase_key)
+supabase = LazyClient("supabase", supabase_factory(supabase_url, supabase_key))
 
-# Initialize Stripe (for subscriptions)
-stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
+# Stripe (for subscriptions)
+stripe_secret_key = os.environ.get("STRIPE_SECRET_KEY")
+stripe = LazyClient("stripe", stripe_factory(stripe_secret_key))
 stripe_webhook_secret = os.environ.get("STRIPE_WEBHOOK_SECRET")
 
-# Initialize OpenAI
-openai.api_key = os.environ.get("OPENAI_API_KEY")
+# OpenAI 429s shrink the global admission rate; successful calls restore it
+openai_rate = AdaptiveRate(
+    min_factor=float(os.environ.get("ADMISSION_MIN_FACTOR", "0.1")),
+    cooldown=float(os.environ.get("ADMISSION_DECREASE_COOLDOWN", "10"))
+)
 
-# Initialize Supabase client
-supabase_url = os.environ.get("SUPABASE_URL")
-supabase_key = os.environ.get("SUPABASE_KEY")
-supabase_client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
+# Initialize OpenAI (non-blocking client with pooled connections and per-tier caps)
+openai_api_key = os.environ.get("OPENAI_API_KEY")
+openai_client = OpenAIClient(
+    HTTPOpenAIBackend(openai_api_key, timeout=float(os.environ.get("OPENAI_TIMEOUT", "120"))),
+    tier_concurrency=tier_concurrency_from_env(),
+    max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", "3")),
+    on_rate_limited=openai_rate.rate_limited,
+    on_success=openai_rate.succeeded
+)
+
+# Token buckets per user (by tier) and globally in front of the audio endpoints.
+# Set ADMISSION_REDIS_URL to share the buckets between uvicorn workers.
+admission_enabled = os.environ.get("ADMISSION_ENABLED", "true").lower() == "true"
+admission_redis_url = os.environ.get("ADMISSION_REDIS_URL")
+admission_store = None
+if admission_redis_url:
+    try:
+        admission_store = RedisBucketStore(admission_redis_url)
+    except Exception as e:
+        print(f"Error connecting admission buckets to Redis, using in-process buckets: {str(e)}")
+admission = AdmissionController(
+    admission_store or MemoryBucketStore(),
+    tier_buckets=tier_buckets_from_env(),
+    global_burst=int(os.environ.get("ADMISSION_GLOBAL_BURST", "20")),
+    global_rate=float(os.environ.get("ADMISSION_GLOBAL_RATE", "60")),
+    adaptive=openai_rate
+)
+admission_rejections_total = metrics_registry.counter("admission_rejections_total", "Audio requests turned away with 429", ["scope"])
+
+# In-process cache of user_limits rows, invalidated on subscription changes
+limits_cache = TTLCache(
+    maxsize=int(os.environ.get("LIMITS_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("LIMITS_CACHE_TTL", "60"))
+)
+
+# Transcripts keyed by audio content hash (memory LRU + local disk; set TRANSCRIPT_CACHE_DIR="" for memory only)
+transcript_cache = TranscriptCache(
+    memory_items=int(os.environ.get("TRANSCRIPT_CACHE_ITEMS", "256")),
+    directory=os.environ.get("TRANSCRIPT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "transcript_cache")),
+    max_disk_bytes=int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", "500000000"))
+)
+
+# Long recordings are split at silences and transcribed in parallel segments
+chunking_config = ChunkingConfig.from_env()
+
+# Ask GPT-4 for JSON-mode output (only for models that support response_format)
+analysis_json_mode = os.environ.get("ANALYSIS_JSON_MODE", "false").lower() == "true"
+
+# Transcripts longer than the model's context budget are analyzed in overlapping chunks
+chunk_analysis_cache = TTLCache(
+    maxsize=int(os.environ.get("ANALYSIS_CHUNK_CACHE_ITEMS", "2048")),
+    ttl=float(os.environ.get("ANALYSIS_CHUNK_CACHE_TTL", "86400"))
+)
+mapreduce_analyzer = MapReduceAnalyzer(openai_client, MapReduceConfig.from_env(), chunk_analysis_cache)
+openai_tokens_total = metrics_registry.counter("openai_tokens_total", "Estimated GPT-4 tokens by analysis phase", ["phase", "kind"])
+
+# Batch uploads: items per request and concurrent pipelines per batch
+max_batch_size = int(os.environ.get("MAX_BATCH_SIZE", "50"))
+batch_parallelism = int(os.environ.get("BATCH_PARALLELISM", "4"))
+
+# Status transitions and usage rows are written behind the request path
+@supabase_write_timer("repspheres_conversations")
+def write_status_group(payload: dict, conversation_ids: list):
+    supabase.table('repspheres_conversations').update(payload).in_('id', conversation_ids).execute()
+
+@supabase_write_timer("user_usage")
+def write_usage_rows(rows: list):
+    supabase.table("user_usage").insert(rows).execute()
+
+write_behind = WriteBehindBuffer(
+    write_status_group,
+    write_usage_rows,
+    max_pending=int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "200")),
+    flush_interval=float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+)
+
+# Uploaded audio is streamed straight into Supabase Storage
+audio_storage = SupabaseStorage(
+    supabase_url,
+    supabase_key,
+    bucket=os.environ.get("AUDIO_UPLOAD_BUCKET", "audio-uploads")
+)
+upload_chunk_size = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Team analytics rollups, updated as conversations complete and read with ETags
+rollup_service = RollupService(
+    supabase,
+    version_ttl=float(os.environ.get("ROLLUP_VERSION_TTL", "5")),
+    cache_size=int(os.environ.get("ROLLUP_CACHE_SIZE", "1000"))
+)
+team_membership_cache = TTLCache(maxsize=10000, ttl=float(os.environ.get("TEAM_MEMBERSHIP_CACHE_TTL", "60")))
+rollup_responses_total = metrics_registry.counter("rollup_responses_total", "Analytics reads by how they were served", ["result"])
+
+# Background worker pool for the audio pipeline; jobs are taken highest tier
+# first, and a tier never holds more workers than it has OpenAI slots
+job_queue = JobQueue(
+    concurrency=int(os.environ.get("WORKER_CONCURRENCY", "4")),
+    tier_limits=openai_client.tier_concurrency
+)
 
 # Define models
 class AudioRequest(BaseModel):
     filename: str
-    transcription_url: str = None
-    duration_seconds: int = None
-    conversation_id: str = None
+    transcription_url: Optional[str] = None
+    duration_seconds: Optional[int] = None
+    conversation_id: Optional[str] = None
+    skip_transcript_cache: bool = False
+
+    @field_validator("conversation_id")
+    @classmethod
+    def conversation_id_is_uuid(cls, value):
+        # The column is a uuid, and one malformed id would fail a whole buffered batch write
+        return str(uuid.UUID(value)) if value is not None else value
 
 class UserLimit(BaseModel):
     tier: str = "free"
@@ -54,104 +198,234 @@ class UserLimit(BaseModel):
     usage_reset_date: datetime = None
 
 # User authentication middleware
-async def get_current_user(authorization: str = Header(None)):
+# Verifies with the project's JWT secret when set, otherwise with its JWKS
+if not os.environ.get("SUPABASE_JWT_SECRET"):
+    print("SUPABASE_JWT_SECRET is not set; verifying tokens with the project's JWKS. "
+          "Projects that still sign tokens with the legacy JWT secret (HS256) must set it.")
+jwt_verifier = JWTVerifier(
+    secret=os.environ.get("SUPABASE_JWT_SECRET"),
+    jwks_url=f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None,
+    audience=os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated"),
+    cache_size=int(os.environ.get("AUTH_CACHE_SIZE", "10000")),
+    leeway=int(os.environ.get("SUPABASE_JWT_LEEWAY", "0")),
+    jwks_refresh_interval=float(os.environ.get("SUPABASE_JWKS_REFRESH_INTERVAL", "60"))
+)
+
+async def get_principal(authorization: str = Header(None)) -> Principal:
     if not authorization:
         raise HTTPException(status_code=401, detail="Authorization header missing")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    token = token.strip()
     try:
-        # Parse JWT token
-        token = authorization.split(" ")[1]
-        payload = jwt.decode(token, options={"verify_signature": False})
-        user_id = payload.get("sub")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user_id
-    except Exception as e:
+        with stage_timer("auth"):
+            principal = jwt_verifier.cached(token)
+            if principal is None:
+                # Signature checks (and any JWKS fetch) stay off the event loop
+                principal = await asyncio.to_thread(jwt_verifier.verify, token, False)
+            return principal
+    except AuthError as e:
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
 
+async def get_current_user(principal: Principal = Depends(get_principal)):
+    return principal.user_id
+
 # Usage tracking functions
+@stage_timer("get_user_limits")
 async def get_user_limits(user_id: str):
+    cached = limits_cache.get(user_id)
+    if cached is not None:
+        return cached
     try:
-        response = supabase.table("user_limits").select("*").eq("user_id", user_id).execute()
+        response = await asyncio.to_thread(
+            lambda: supabase.table("user_limits").select("*").eq("user_id", user_id).execute()
+        )
         if response.data and len(response.data) > 0:
+            limits_cache.set(user_id, response.data[0])
             return response.data[0]
         else:
             # Create default limits for new user
             default_limits = UserLimit()
             default_limits.usage_reset_date = datetime.now() + timedelta(days=30)
-            response = supabase.table("user_limits").insert({
-                "user_id": user_id,
-                "tier": default_limits.tier,
-                "monthly_quota": default_limits.monthly_quota,
-                "max_file_size": default_limits.max_file_size,
-                "usage_reset_date": default_limits.usage_reset_date.isoformat()
-            }).execute()
-            return response.data[0] if response.data else default_limits.dict()
+            response = await asyncio.to_thread(
+                lambda: supabase.table("user_limits").insert({
+                    "user_id": user_id,
+                    "tier": default_limits.tier,
+                    "monthly_quota": default_limits.monthly_quota,
+                    "max_file_size": default_limits.max_file_size,
+                    "usage_reset_date": default_limits.usage_reset_date.isoformat()
+                }).execute()
+            )
+            if response.data:
+                limits_cache.set(user_id, response.data[0])
+                return response.data[0]
+            return default_limits.dict()
     except Exception as e:
+        stage_errors_total.inc("get_user_limits")
         print(f"Error getting user limits: {str(e)}")
         return UserLimit().dict()
 
+def usage_period_expired(reset_date):
+    if not reset_date:
+        return False
+    if isinstance(reset_date, str):
+        reset_date = datetime.fromisoformat(reset_date.replace("Z", "+00:00"))
+    if reset_date.tzinfo is None:
+        reset_date = reset_date.replace(tzinfo=timezone.utc)
+    return reset_date <= datetime.now(timezone.utc)
+
+@stage_timer("get_current_usage")
 async def get_current_usage(user_id: str):
+    """Approximate usage for display and early rejection; only the reservation RPC enforces the quota.
+
+    Reservations made through this instance update the cached counter, but
+    ones made elsewhere show up only once the cached row expires (LIMITS_CACHE_TTL).
+    """
     try:
-        # Get reset date
-        limits_response = supabase.table("user_limits").select("usage_reset_date").eq("user_id", user_id).execute()
-        reset_date = None
-        if limits_response.data and len(limits_response.data) > 0:
-            reset_date = limits_response.data[0].get("usage_reset_date")
-        
-        # Count usage since reset date
-        query = supabase.table("user_usage").select("id", count="exact").eq("user_id", user_id)
-        if reset_date:
-            query = query.gte("created_at", reset_date)
-        
-        response = query.execute()
-        return response.count if hasattr(response, 'count') else 0
+        # Served from the same cached user_limits row as get_user_limits
+        limits = await get_user_limits(user_id)
+        # The counter is only rolled over on the next reservation
+        if usage_period_expired(limits.get("usage_reset_date")):
+            return 0
+        return limits.get("usage_count") or 0
     except Exception as e:
+        stage_errors_total.inc("get_current_usage")
         print(f"Error getting current usage: {str(e)}")
         return 0
 
-async def log_usage(user_id: str, request_type: str, file_size: int = 0):
-    try:
-        response = supabase.table("user_usage").insert({
-            "user_id": user_id,
-            "request_type": request_type,
-            "file_size": file_size,
-            "created_at": datetime.now().isoformat()
-        }).execute()
-        return True
-    except Exception as e:
-        print(f"Error logging usage: {str(e)}")
-        return False
+@stage_timer("reserve_usage")
+async def reserve_usage(user_id: str, request_type: str, file_size: int = 0, enforce_quota: bool = True,
+                        record_usage: bool = True):
+    """Check the quota and record the usage in one atomic step.
 
-async def update_user_limits(user_id: str, limits: dict):
+    With record_usage=False only the counter is bumped, and the caller queues the
+    user_usage row through record_usage_row() once it knows the outcome.
+    Returns a dict with allowed/current_usage/quota/reset_date, or None on error.
+    """
     try:
-        response = supabase.table("user_limits").upsert({
-            "user_id": user_id,
-            **limits
-        }).execute()
-        return True
+        response = await asyncio.to_thread(
+            lambda: supabase.rpc("reserve_usage_slot", {
+                "p_user_id": user_id,
+                "p_request_type": request_type,
+                "p_file_size": file_size,
+                "p_enforce_quota": enforce_quota,
+                "p_record_usage": record_usage
+            }).execute()
+        )
+        reservation = response.data[0] if response.data else None
+        sync_cached_usage(user_id, reservation)
+        return reservation
     except Exception as e:
-        print(f"Error updating user limits: {str(e)}")
-        return False
+        stage_errors_total.inc("reserve_usage")
+        print(f"Error reserving usage: {str(e)}")
+        return None
 
-# Helper functions for subscriptions
-def get_tier_from_stripe_product(product_id: str):
+@stage_timer("reserve_usage_batch")
+async def reserve_usage_batch(user_id: str, request_type: str, file_sizes: list, record_usage: bool = True):
+    """Reserve quota for a whole batch in one atomic step.
+
+    Returns a dict with granted/current_usage/quota/reset_date, where `granted`
+    is how many of the leading items fit in the remaining quota, or None on error.
+    """
     try:
-        product = stripe.Product.retrieve(product_id)
-        return product.metadata.get("tier", "free")
+        response = await asyncio.to_thread(
+            lambda: supabase.rpc("reserve_usage_slots", {
+                "p_user_id": user_id,
+                "p_request_type": request_type,
+                "p_file_sizes": file_sizes,
+                "p_record_usage": record_usage
+            }).execute()
+        )
+        reservation = response.data[0] if response.data else None
+        sync_cached_usage(user_id, reservation)
+        return reservation
     except Exception as e:
-        print(f"Error getting tier from product: {str(e)}")
-        return "free"
+        stage_errors_total.inc("reserve_usage_batch")
+        print(f"Error reserving batch usage: {str(e)}")
+        return None
 
-def get_user_id_from_stripe_customer(customer_id: str):
+@stage_timer("release_usage")
+async def release_usage(user_id: str, count: int = 1):
+    """Give back slots reserved with record_usage=False for requests that failed before being queued."""
     try:
-        # Query Supabase for the user_id associated with this customer
-        response = supabase.table("stripe_customers").select("user_id").eq("customer_id", customer_id).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0].get("user_id")
-        return None
+        response = await asyncio.to_thread(
+            lambda: supabase.rpc("release_usage_slots", {
+                "p_user_id": user_id,
+                "p_count": count
+            }).execute()
+        )
+        sync_cached_usage(user_id, response.data[0] if response.data else None)
     except Exception as e:
-        print(f"Error getting user from customer: {str(e)}")
-        return None
+        stage_errors_total.inc("release_usage")
+        print(f"Error releasing usage: {str(e)}")
+
+def sync_cached_usage(user_id: str, reservation: dict):
+    # Keep the cached counter in step with the authoritative one, without extending its TTL
+    cached = limits_cache.peek(user_id)
+    if reservation and cached is not None:
+        cached.update({
+            "usage_count": reservation["current_usage"],
+            "monthly_quota": reservation["quota"],
+            "usage_reset_date": reservation["reset_date"]
+        })
+
+def record_usage_row(user_id: str, request_type: str, file_size: int, conversation_id: str = None,
+                     successful: bool = True, created_at: datetime = None):
+    # The slot was already counted by the reservation; this is the audit row, written behind
+    write_behind.log_usage({
+        "user_id": user_id,
+        "request_type": request_type,
+        "file_size": file_size,
+        "conversation_id": conversation_id,
+        "request_successful": successful,
+        "created_at": (created_at or datetime.now()).isoformat()
+    })
+
+async def update_user_limits(user_id: str, limits: dict):
+    # Errors propagate so the Stripe event processor retries the event
+    limits_cache.invalidate(user_id)
+    with supabase_write_timer("user_limits"):
+        await asyncio.to_thread(
+            lambda: supabase.table("user_limits").upsert({
+                "user_id": user_id,
+                **limits
+            }).execute()
+        )
+    # Drop anything cached while the upsert was in flight
+    limits_cache.invalidate(user_id)
+
+# Helper functions for subscriptions
+# product -> tier is refreshed by product.updated events; customer -> user never changes
+product_tier_cache = TTLCache(maxsize=1000, ttl=float(os.environ.get("STRIPE_PRODUCT_CACHE_TTL", "3600")))
+customer_user_cache = TTLCache(maxsize=int(os.environ.get("STRIPE_CUSTOMER_CACHE_SIZE", "10000")), ttl=None)
+
+async def get_tier_from_stripe_product(product_id: str):
+    tier = product_tier_cache.get(product_id)
+    if tier is not None:
+        return tier
+    # A failed lookup raises rather than guessing "free", which would downgrade a paying user
+    product = await asyncio.to_thread(stripe.Product.retrieve, product_id)
+    # StripeObject is not a dict in current SDKs, so no .get()
+    metadata = product["metadata"]
+    tier = metadata["tier"] if "tier" in metadata else "free"
+    product_tier_cache.set(product_id, tier)
+    return tier
+
+async def get_user_id_from_stripe_customer(customer_id: str):
+    user_id = customer_user_cache.get(customer_id)
+    if user_id is not None:
+        return user_id
+    # Query Supabase for the user_id associated with this customer; None only when there is none
+    response = await asyncio.to_thread(
+        lambda: supabase.table("stripe_customers").select("user_id").eq("customer_id", customer_id).execute()
+    )
+    if response.data and len(response.data) > 0:
+        user_id = response.data[0].get("user_id")
+        if user_id:
+            customer_user_cache.set(customer_id, user_id)
+        return user_id
+    return None
 
 # Subscription event handlers
 async def handle_subscription_created(event):
@@ -162,15 +436,16 @@ async def handle_subscription_created(event):
     if items and len(items) > 0:
         price = items[0]["price"]
         product_id = price["product"]
-        tier = get_tier_from_stripe_product(product_id)
-        user_id = get_user_id_from_stripe_customer(customer_id)
+        tier = await get_tier_from_stripe_product(product_id)
+        user_id = await get_user_id_from_stripe_customer(customer_id)
         
         if user_id:
             limits = {
                 "tier": tier,
                 "monthly_quota": 10 if tier == "free" else 50 if tier == "basic" else 250,
                 "max_file_size": 25000000 if tier == "free" else 50000000 if tier == "basic" else 100000000,
-                "usage_reset_date": datetime.now().isoformat()
+                "usage_reset_date": datetime.now().isoformat(),
+                "usage_count": 0
             }
             await update_user_limits(user_id, limits)
 
@@ -180,171 +455,973 @@ async def handle_subscription_updated(event):
 async def handle_subscription_deleted(event):
     subscription = event["data"]["object"]
     customer_id = subscription["customer"]
-    user_id = get_user_id_from_stripe_customer(customer_id)
+    user_id = await get_user_id_from_stripe_customer(customer_id)
     
     if user_id:
         limits = {
             "tier": "free",
             "monthly_quota": 10,
             "max_file_size": 25000000,
-            "usage_reset_date": datetime.now().isoformat()
+            "usage_reset_date": datetime.now().isoformat(),
+            "usage_count": 0
         }
         await update_user_limits(user_id, limits)
 
+async def handle_product_updated(event):
+    product = event["data"]["object"]
+    product_tier_cache.set(product["id"], (product.get("metadata") or {}).get("tier", "free"))
+
+def save_failed_stripe_event(event: dict, error: str):
+    supabase.table("stripe_failed_events").upsert({
+        "event_id": event["id"],
+        "event_type": event["type"],
+        "payload": event,
+        "last_error": error[:1000],
+        "updated_at": datetime.now().isoformat()
+    }).execute()
+
+def clear_failed_stripe_event(event_id: str):
+    supabase.table("stripe_failed_events").delete().eq("event_id", event_id).execute()
+
+async def load_failed_stripe_events():
+    try:
+        response = await asyncio.to_thread(
+            lambda: supabase.table("stripe_failed_events").select("payload").order("created_at").execute()
+        )
+        return [row["payload"] for row in response.data or []]
+    except Exception as e:
+        print(f"Error loading failed Stripe events: {str(e)}")
+        return []
+
+# Stripe webhooks are acknowledged immediately and processed in the background;
+# events that keep failing are stored in stripe_failed_events and retried until they succeed
+stripe_processor = StripeEventProcessor(
+    {
+        "customer.subscription.created": handle_subscription_created,
+        "customer.subscription.updated": handle_subscription_updated,
+        "customer.subscription.deleted": handle_subscription_deleted,
+        "product.updated": handle_product_updated
+    },
+    retry_backoff=float(os.environ.get("STRIPE_RETRY_BACKOFF", "60")),
+    max_retry_delay=float(os.environ.get("STRIPE_MAX_RETRY_DELAY", "3600")),
+    save_failed=save_failed_stripe_event,
+    clear_failed=clear_failed_stripe_event
+)
+
+# Audio pipeline stages (run by the job queue workers)
+def update_conversation_status(conversation_id: str, status: str, **fields):
+    # Coalesced per conversation and flushed in the background
+    write_behind.update_status(conversation_id, status, **fields)
+
+# Cached transcripts are JSON {"text", "segments"}; the key suffix keeps them apart from older text-only entries
+TRANSCRIPT_CACHE_MODEL = "whisper-1-segments"
+
+async def cached_transcript(cache_key: str):
+    cached = await asyncio.to_thread(transcript_cache.get, cache_key)
+    return json.loads(cached) if cached is not None else None
+
+def audio_url(request: AudioRequest):
+    # The filename should be a URL to the audio file in Supabase storage
+    return request.transcription_url or request.filename
+
+async def transcribe_audio(request: AudioRequest, tier: str = "free", audio_sha256: str = None, max_bytes: int = None):
+    """Transcribe the request's audio; returns {"text", "segments"}.
+
+    Segment timestamps are seconds from the start of the recording, whether
+    or not it was split for parallel transcription. The download is aborted
+    once it passes `max_bytes`.
+    """
+    url = audio_url(request)
+    # Audio is only ever fetched from the project's own storage
+    if not audio_storage.owns(url):
+        raise ValueError("The audio file must be stored in this project's Supabase Storage")
+    # Uploads were hashed on the way in, so a cached transcript doesn't need the download
+    if audio_sha256 and not request.skip_transcript_cache:
+        cached = await cached_transcript(transcript_cache.key_for_digest(audio_sha256, TRANSCRIPT_CACHE_MODEL))
+        if cached is not None:
+            print(f"Using cached transcript for {request.filename}")
+            return cached
+    with stage_timer("fetch_audio"):
+        audio = await openai_client.fetch_audio(url, max_bytes=max_bytes)
+    
+    # Identical audio has already been transcribed, unless the caller asked to bypass the cache
+    cache_key = transcript_cache.key_for(audio, TRANSCRIPT_CACHE_MODEL)
+    if not request.skip_transcript_cache:
+        cached = await cached_transcript(cache_key)
+        if cached is not None:
+            print(f"Using cached transcript for {request.filename}")
+            return cached
+    
+    name = os.path.basename(urlparse(url).path) or "audio.mp3"
+    with stage_timer("whisper"):
+        if len(audio) > chunking_config.threshold_bytes:
+            print(f"Transcribing {name} in parallel segments ({len(audio)} bytes)")
+            transcript = await transcribe_chunked(openai_client, audio, name, chunking_config, tier=tier)
+        else:
+            result = await openai_client.transcribe(audio, name, tier=tier, model="whisper-1", response_format="verbose_json")
+            transcript = single_transcript(result)
+    await asyncio.to_thread(transcript_cache.set, cache_key, json.dumps(transcript))
+    return transcript
+
+ANALYSIS_SYSTEM_PROMPT = "You are an expert sales conversation analyzer specializing in medical device and aesthetic product sales to healthcare practitioners."
+
+def build_analysis_messages(transcription: str):
+    analysis_prompt = f"Analyze the following conversation transcript for a sales call with a doctor or medspa owner in the aesthetic or dental industry:\n\n{transcription}\n\nProvide insights on:"
+    analysis_prompt += "\n1. Key points discussed\n2. Customer pain points\n3. Objections raised\n4. Next steps\n5. Overall sentiment"
+    if analysis_json_mode:
+        analysis_prompt += "\n\nRespond with a JSON object with the keys key_points, pain_points, objections and next_steps (arrays of strings) and sentiment (positive, negative or neutral)."
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": analysis_prompt}
+    ]
+
+@stage_timer("gpt4")
+async def analyze_transcription(transcription: str, tier: str = "free"):
+    """Return (analysis_text, stats); long transcripts go through map-reduce."""
+    if mapreduce_analyzer.needs_map_reduce(transcription):
+        result = await mapreduce_analyzer.analyze(transcription, ANALYSIS_SYSTEM_PROMPT, tier, analysis_json_mode, **analysis_options())
+        return result["text"], record_analysis_stats({"mode": "map_reduce", **result["stats"]})
+    start = time.perf_counter()
+    messages = build_analysis_messages(transcription)
+    analysis_text = await openai_client.chat(messages, tier=tier, **analysis_options())
+    return analysis_text, record_analysis_stats(single_pass_stats(transcription, messages, analysis_text, time.perf_counter() - start))
+
+def single_pass_stats(transcription: str, messages: list, analysis_text: str, seconds: float):
+    count_tokens = mapreduce_analyzer.count_tokens
+    return {
+        "mode": "single",
+        "transcript_tokens": count_tokens(transcription),
+        "prompt_tokens": sum(count_tokens(message["content"]) + 4 for message in messages),
+        "completion_tokens": count_tokens(analysis_text),
+        "seconds": round(seconds, 3),
+        "token_counter": mapreduce_analyzer.token_counter_name
+    }
+
+def record_analysis_stats(stats: dict):
+    # Per-conversation token counts and phase latencies go to the log and the metrics
+    if stats["mode"] == "map_reduce":
+        stage_seconds.observe(stats["map_seconds"], "gpt4_map")
+        if "reduce_seconds" in stats:
+            stage_seconds.observe(stats["reduce_seconds"], "gpt4_reduce")
+        for phase in ("map", "reduce"):
+            openai_tokens_total.inc(phase, "prompt", amount=stats.get(f"{phase}_prompt_tokens", 0))
+            openai_tokens_total.inc(phase, "completion", amount=stats.get(f"{phase}_completion_tokens", 0))
+    else:
+        openai_tokens_total.inc("single", "prompt", amount=stats["prompt_tokens"])
+        openai_tokens_total.inc("single", "completion", amount=stats["completion_tokens"])
+    print(f"[{current_request_id()}] Analysis stats: {json.dumps(stats)}")
+    return stats
+
+def analysis_options():
+    options = {"model": "gpt-4"}
+    if analysis_json_mode:
+        options["response_format"] = {"type": "json_object"}
+    return options
+
+def build_linguistics_row(conversation_id: str, transcript: dict, analysis_text: str, parsed: dict):
+    return {
+        'conversation_id': conversation_id,
+        'transcription': transcript["text"],
+        'transcript_segments': transcript["segments"],
+        **parsed,
+        'full_analysis': analysis_text,
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+@supabase_write_timer("repspheres_linguistics_results")
+def store_analysis_results(conversation_id: str, transcript: dict, analysis_text: str, parsed: dict):
+    # Store results in the repspheres_linguistics_results table
+    linguistics_data = build_linguistics_row(conversation_id, transcript, analysis_text, parsed)
+    supabase.table('repspheres_linguistics_results').insert(linguistics_data).execute()
+
+async def apply_rollups(conversation_ids: list, durations: list = None):
+    """Count completed conversations in the team analytics rollups.
+
+    The RPC only counts conversations stored as 'completed', so their queued
+    status updates are written first. Failures are only logged;
+    backfill_rollups.py picks up anything missed.
+    """
+    if not conversation_ids:
+        return
+    try:
+        with stage_timer("rollup"):
+            await write_behind.flush_statuses(conversation_ids)
+            await asyncio.to_thread(rollup_service.apply, conversation_ids, durations)
+    except Exception as e:
+        print(f"[{current_request_id()}] Error updating rollups for {len(conversation_ids)} conversations: {str(e)}")
+
+def update_conversations_status(conversation_ids: list, status: str, **fields):
+    # Identical transitions are grouped into one bulk update when flushed
+    for conversation_id in conversation_ids:
+        write_behind.update_status(conversation_id, status, **fields)
+
+async def process_audio_job(job, request: AudioRequest, tier: str = "free", file_size: int = 0, audio_sha256: str = None,
+                            max_file_size: int = None):
+    set_request_id(job.request_id)
+    conversation_id = request.conversation_id
+    successful = False
+    try:
+        # Step 1: Transcribe the audio using OpenAI's Whisper API
+        job.set_stage("transcribing", 10)
+        if conversation_id:
+            update_conversation_status(conversation_id, 'transcribing')
+        print(f"Transcribing audio file: {request.filename}")
+        transcript = await transcribe_audio(request, tier, audio_sha256, max_file_size)
+        transcription = transcript["text"]
+        
+        # Step 2: Analyze the transcription using OpenAI's GPT-4
+        job.set_stage("analyzing", 50)
+        if conversation_id:
+            update_conversation_status(conversation_id, 'analyzing')
+        print("Analyzing transcription with GPT-4")
+        analysis_text, analysis_stats = await analyze_transcription(transcription, tier)
+        with stage_timer("parse"):
+            parsed = parse_analysis(analysis_text)
+        
+        # Step 3: Store the results in Supabase
+        job.set_stage("storing", 90)
+        if conversation_id:
+            await asyncio.to_thread(store_analysis_results, conversation_id, transcript, analysis_text, parsed)
+            update_conversation_status(
+                conversation_id,
+                'completed',
+                duration_seconds=request.duration_seconds if request.duration_seconds else 0
+            )
+            await apply_rollups([conversation_id], [request.duration_seconds or 0])
+        successful = True
+    except BaseException as e:
+        # Also reached when the job is cancelled at shutdown, so the conversation isn't left mid-pipeline
+        message = str(e) or type(e).__name__
+        print(f"[{job.request_id}] Error processing audio job {job.id}: {message}")
+        if conversation_id:
+            update_conversation_status(
+                conversation_id,
+                'error',
+                error_message=f"Error in {job.stage} stage: {message}"
+            )
+        raise
+    finally:
+        record_usage_row(job.user_id, "audio_analysis", file_size, conversation_id, successful, job.created_at)
+    
+    return {
+        "conversation_id": conversation_id,
+        "transcription": transcription[:100] + "...",  # Truncated for response
+        "transcript_segments": len(transcript["segments"]),
+        "analysis_summary": analysis_text[:100] + "...",  # Truncated for response
+        "analysis_stats": analysis_stats
+    }
+
+async def process_audio_batch_job(job, requests: List[AudioRequest], tier: str = "free", file_sizes: list = None,
+                                  indexes: list = None, max_file_size: int = None):
+    """Run a batch through the pipeline with bounded parallelism and bulk Supabase writes.
+
+    Failures are reported per item; one bad file doesn't fail the batch.
+    `indexes` are the items' positions in the submitted batch.
+    """
+    set_request_id(job.request_id)
+    conversation_ids = [r.conversation_id for r in requests if r.conversation_id]
+    job.set_stage("transcribing", 0)
+    update_conversations_status(conversation_ids, 'transcribing')
+    
+    # Conversations whose final status has been queued
+    settled = set()
+    try:
+        semaphore = asyncio.Semaphore(batch_parallelism)
+        finished = 0
+        
+        async def run_item(request: AudioRequest):
+            nonlocal finished
+            async with semaphore:
+                try:
+                    transcript = await transcribe_audio(request, tier, max_bytes=max_file_size)
+                    if request.conversation_id:
+                        update_conversation_status(request.conversation_id, 'analyzing')
+                    analysis_text, analysis_stats = await analyze_transcription(transcript["text"], tier)
+                    with stage_timer("parse"):
+                        parsed = parse_analysis(analysis_text)
+                    return transcript, analysis_text, parsed, analysis_stats
+                finally:
+                    finished += 1
+                    job.set_stage("analyzing", int(90 * finished / len(requests)))
+        
+        outcomes = await asyncio.gather(*(run_item(r) for r in requests), return_exceptions=True)
+        
+        # Bulk insert the results of every item that made it through the OpenAI stages
+        job.set_stage("storing", 90)
+        rows = [
+            build_linguistics_row(request.conversation_id, *outcome[:3])
+            for request, outcome in zip(requests, outcomes)
+            if request.conversation_id and not isinstance(outcome, Exception)
+        ]
+        store_error = None
+        if rows:
+            try:
+                await asyncio.to_thread(
+                    supabase_write_timer("repspheres_linguistics_results")(
+                        lambda: supabase.table('repspheres_linguistics_results').insert(rows).execute()
+                    )
+                )
+            except Exception as e:
+                print(f"Error storing batch results: {str(e)}")
+                store_error = e
+        
+        items = []
+        completed_by_duration = {}
+        for index, (request, outcome) in enumerate(zip(requests, outcomes)):
+            item = {"index": indexes[index] if indexes else index, "filename": request.filename, "conversation_id": request.conversation_id}
+            error = outcome if isinstance(outcome, Exception) else (store_error if request.conversation_id else None)
+            if error:
+                item.update({"status": "failed", "error": str(error)})
+                if request.conversation_id:
+                    update_conversation_status(request.conversation_id, 'error', error_message=f"Error processing audio: {str(error)}")
+                    settled.add(request.conversation_id)
+            else:
+                transcript, analysis_text, _, analysis_stats = outcome
+                item.update({
+                    "status": "completed",
+                    "transcription": transcript["text"][:100] + "...",  # Truncated for response
+                    "transcript_segments": len(transcript["segments"]),
+                    "analysis_summary": analysis_text[:100] + "...",  # Truncated for response
+                    "analysis_stats": analysis_stats
+                })
+                if request.conversation_id:
+                    completed_by_duration.setdefault(request.duration_seconds or 0, []).append(request.conversation_id)
+            items.append(item)
+            record_usage_row(
+                job.user_id,
+                "audio_analysis",
+                file_sizes[index] if file_sizes else 0,
+                request.conversation_id,
+                item["status"] == "completed",
+                job.created_at
+            )
+        
+        # One status update per distinct duration (usually just one)
+        for duration_seconds, ids in completed_by_duration.items():
+            update_conversations_status(ids, 'completed', duration_seconds=duration_seconds)
+            settled.update(ids)
+        await apply_rollups(
+            [conversation_id for ids in completed_by_duration.values() for conversation_id in ids],
+            [duration_seconds for duration_seconds, ids in completed_by_duration.items() for _ in ids]
+        )
+    except BaseException as e:
+        # Also reached when the job is cancelled at shutdown; unfinished conversations are marked as failed
+        message = str(e) or type(e).__name__
+        print(f"[{job.request_id}] Error processing batch job {job.id}: {message}")
+        update_conversations_status(
+            [conversation_id for conversation_id in conversation_ids if conversation_id not in settled],
+            'error',
+            error_message=f"Error in {job.stage} stage: {message}"
+        )
+        raise
+    
+    return {
+        "items": items,
+        "completed": sum(1 for item in items if item["status"] == "completed"),
+        "failed": sum(1 for item in items if item["status"] == "failed")
+    }
+
+def sse_event(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def process_audio_stream_job(job, request: AudioRequest, tier: str = "free", file_size: int = 0,
+                                   events: asyncio.Queue = None, max_file_size: int = None):
+    """Run the pipeline, putting analysis tokens and parsed insights on `events` as server-sent events.
+
+    Runs on the worker pool like process_audio_job, so the conversation is
+    finished (or marked as failed) even if the client stops reading. The
+    queue ends with None.
+    """
+    set_request_id(job.request_id)
+    emit = events.put_nowait
+    conversation_id = request.conversation_id
+    successful = False
+    try:
+        job.set_stage("transcribing", 10)
+        if conversation_id:
+            update_conversation_status(conversation_id, 'transcribing')
+        emit(sse_event("status", {"stage": job.stage, "job_id": job.id}))
+        transcript = await transcribe_audio(request, tier, max_bytes=max_file_size)
+        transcription = transcript["text"]
+        
+        job.set_stage("analyzing", 50)
+        if conversation_id:
+            update_conversation_status(conversation_id, 'analyzing')
+        emit(sse_event("status", {"stage": job.stage, "job_id": job.id}))
+        messages = build_analysis_messages(transcription)
+        analysis_stats = {"mode": "single"}
+        if mapreduce_analyzer.needs_map_reduce(transcription):
+            # Chunks are analyzed up front; only the reduce step is streamed
+            partials, analysis_stats = await mapreduce_analyzer.map(transcription, ANALYSIS_SYSTEM_PROMPT, tier, analysis_json_mode, **analysis_options())
+            emit(sse_event("status", {"stage": job.stage, "job_id": job.id, "chunks": analysis_stats["chunks"], "cached_chunks": analysis_stats["cached_chunks"]}))
+            reduce_started = time.perf_counter()
+            partials = await mapreduce_analyzer.reduce_groups(partials, ANALYSIS_SYSTEM_PROMPT, tier, analysis_json_mode, analysis_stats, **analysis_options())
+            messages = build_reduce_messages(ANALYSIS_SYSTEM_PROMPT, partials, analysis_json_mode)
+            analysis_stats = {"mode": "map_reduce", **analysis_stats}
+        parser = AnalysisStreamParser()
+        tokens = []
+        stream_started = time.perf_counter()
+        with stage_timer("gpt4_stream"):
+            async for token in openai_client.chat_stream(messages, tier=tier, **analysis_options()):
+                tokens.append(token)
+                emit(sse_event("token", {"text": token}))
+                for field, value in parser.feed(token):
+                    emit(sse_event("insight", {"field": field, "value": value}))
+        for field, value in parser.close():
+            emit(sse_event("insight", {"field": field, "value": value}))
+        
+        # Parse the full text exactly as the non-streaming path does, so the stored row is identical
+        analysis_text = "".join(tokens)
+        stream_seconds = time.perf_counter() - stream_started
+        if analysis_stats["mode"] == "map_reduce":
+            count_tokens = mapreduce_analyzer.count_tokens
+            analysis_stats["reduce_prompt_tokens"] = analysis_stats.get("reduce_prompt_tokens", 0) + sum(count_tokens(m["content"]) + 4 for m in messages)
+            analysis_stats["reduce_completion_tokens"] = analysis_stats.get("reduce_completion_tokens", 0) + count_tokens(analysis_text)
+            analysis_stats["reduce_seconds"] = round(time.perf_counter() - reduce_started, 3)
+            analysis_stats["token_counter"] = mapreduce_analyzer.token_counter_name
+        else:
+            analysis_stats = single_pass_stats(transcription, messages, analysis_text, stream_seconds)
+        record_analysis_stats(analysis_stats)
+        with stage_timer("parse"):
+            parsed = parse_analysis(analysis_text)
+        
+        job.set_stage("storing", 90)
+        if conversation_id:
+            await asyncio.to_thread(store_analysis_results, conversation_id, transcript, analysis_text, parsed)
+            update_conversation_status(
+                conversation_id,
+                'completed',
+                duration_seconds=request.duration_seconds if request.duration_seconds else 0
+            )
+            await apply_rollups([conversation_id], [request.duration_seconds or 0])
+        successful = True
+        result = {"conversation_id": conversation_id, **parsed, "analysis_stats": analysis_stats}
+        emit(sse_event("done", result))
+        return result
+    except BaseException as e:
+        # Also reached when the job is cancelled at shutdown, so the conversation isn't left mid-pipeline
+        message = str(e) or type(e).__name__
+        print(f"[{job.request_id}] Error streaming analysis for job {job.id}: {message}")
+        if conversation_id:
+            update_conversation_status(
+                conversation_id,
+                'error',
+                error_message=f"Error in {job.stage} stage: {message}"
+            )
+        emit(sse_event("error", {"stage": job.stage, "job_id": job.id, "message": message}))
+        raise
+    finally:
+        record_usage_row(job.user_id, "audio_analysis", file_size, conversation_id, successful, job.created_at)
+        emit(None)
+
+async def relay_job_events(events: asyncio.Queue):
+    """Yield a streaming job's events until it ends. Returning early (the client
+    went away) leaves the job running."""
+    while True:
+        event = await events.get()
+        if event is None:
+            return
+        yield event
+
+def file_too_large_response(max_file_size: int):
+    return JSONResponse(
+        status_code=413,
+        content={"message": f"File exceeds your plan's maximum size of {max_file_size} bytes. Please upgrade your plan."}
+    )
+
+async def audio_file_size(request: AudioRequest):
+    """The audio file's size from a storage HEAD request (None if unavailable).
+
+    This only screens requests at admission; the plan's max_file_size is
+    enforced on the bytes actually downloaded in transcribe_audio.
+    """
+    return await audio_storage.object_size(audio_url(request))
+
+FOREIGN_FILE_MESSAGE = "The audio file must be stored in this project's Supabase Storage."
+
+def foreign_file_response():
+    return JSONResponse(status_code=400, content={"message": FOREIGN_FILE_MESSAGE})
+
+def unreadable_file_response():
+    return JSONResponse(
+        status_code=400,
+        content={"message": "Could not read the audio file's size. Check that the file URL is reachable."}
+    )
+
+async def check_admission(user_id: str, tier: str, cost: int = 1):
+    """Take tokens from the user's and the global bucket; returns a 429 response when either is empty."""
+    if not admission_enabled:
+        return None
+    retry_after, scope = await admission.admit(user_id, tier, cost)
+    if not retry_after:
+        return None
+    admission_rejections_total.inc(scope)
+    seconds = retry_after_header(retry_after)
+    message = (
+        "You're sending audio faster than your plan allows." if scope == "user"
+        else "The service is busy processing other audio."
+    )
+    return JSONResponse(
+        status_code=429,
+        content={"message": f"{message} Please retry in {seconds} seconds.", "retry_after": int(seconds)},
+        headers={"Retry-After": seconds}
+    )
+
+async def admit_audio_request(user_id: str, file_size: int, check_rate: bool = True):
+    """Check limits and reserve a quota slot. Returns (limits, reservation, error_response)."""
+    # Check user limits (creates the defaults for new users)
+    limits = await get_user_limits(user_id)
+    if file_size > limits["max_file_size"]:
+        return limits, None, file_too_large_response(limits["max_file_size"])
+    
+    # Back off before touching the quota, so a 429 doesn't use up a slot
+    if check_rate:
+        error_response = await check_admission(user_id, limits["tier"])
+        if error_response:
+            return limits, None, error_response
+    
+    # Check the quota and count the usage atomically; the usage row is written behind
+    reservation = await reserve_usage(user_id, "audio_analysis", file_size, record_usage=False)
+    if reservation is None:
+        return limits, None, JSONResponse(
+            status_code=500,
+            content={"message": "Error checking usage quota. Please try again."}
+        )
+    
+    # Enforce quota limits
+    if not reservation["allowed"]:
+        return limits, reservation, JSONResponse(
+            status_code=403,
+            content={"message": "Monthly quota exceeded. Please upgrade your plan."}
+        )
+    return limits, reservation, None
+
 # API ROUTES
+# Cheapest real call to each vendor; used to warm connections and by /health?deep=true
+def ping_supabase():
+    supabase.table("user_limits").select("user_id").limit(1).execute()
+
+def ping_stripe():
+    stripe.Balance.retrieve()
+
+def vendor_checks():
+    checks = {}
+    if supabase_url and supabase_key:
+        checks["supabase"] = lambda: asyncio.to_thread(ping_supabase)
+    if openai_api_key:
+        checks["openai"] = openai_client.ping
+    if stripe_secret_key:
+        checks["stripe"] = lambda: asyncio.to_thread(ping_stripe)
+    return checks
+
+deep_health = DeepHealthCheck(
+    vendor_checks(),
+    ttl=float(os.environ.get("HEALTH_DEEP_CACHE_TTL", "30")),
+    timeout=float(os.environ.get("HEALTH_DEEP_TIMEOUT", "5"))
+)
+warm_clients_on_startup = os.environ.get("WARM_CLIENTS", "true").lower() == "true"
+
+async def warm_clients():
+    """Create the vendor clients and open their connections before the first request."""
+    start = time.perf_counter()
+    steps = {"jwks": lambda: asyncio.to_thread(jwt_verifier.warm), **vendor_checks()}
+    timeout = float(os.environ.get("CLIENT_WARM_TIMEOUT", "5"))
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(step(), timeout) for step in steps.values()),
+        return_exceptions=True
+    )
+    for name, outcome in zip(steps, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Error warming {name} client: {str(outcome) or type(outcome).__name__}")
+    print(f"Warmed {', '.join(steps)} in {time.perf_counter() - start:.2f}s")
+
+@app.on_event("startup")
+async def startup():
+    await write_behind.start()
+    await job_queue.start()
+    await stripe_processor.start(await load_failed_stripe_events())
+    if warm_clients_on_startup:
+        await warm_clients()
+
+def abandon_jobs(dropped: list):
+    """Mark the conversations of jobs that never ran before shutdown as failed."""
+    for job, handler, args in dropped:
+        requests = args[0] if handler is process_audio_batch_job else [args[0]]
+        update_conversations_status(
+            [request.conversation_id for request in requests if request.conversation_id],
+            'error',
+            error_message="Processing was interrupted by a server restart. Please submit the audio again."
+        )
+        if handler is process_audio_stream_job:
+            # Ends the client's event stream
+            args[3].put_nowait(None)
+
+@app.on_event("shutdown")
+async def shutdown():
+    abandon_jobs(await job_queue.stop())
+    await stripe_processor.stop()
+    # Flush queued status transitions and usage rows before exiting
+    await write_behind.stop()
+    await openai_client.aclose()
+    await audio_storage.aclose()
+    await admission.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "Audio Analysis API is running"}
 
 @app.get("/health")
-async def health():
-    """Health check endpoint that doesn't require authentication"""
-    return {
+async def health(deep: bool = False):
+    """Health check endpoint that doesn't require authentication.
+
+    With ?deep=true it also calls each configured vendor; that result is
+    cached for HEALTH_DEEP_CACHE_TTL seconds.
+    """
+    body = {
         "status": "ok",
         "version": "1.0.0",
-        "openai_configured": bool(openai.api_key),
+        "openai_configured": bool(openai_api_key),
         "supabase_configured": bool(supabase_url and supabase_key),
-        "stripe_configured": bool(stripe.api_key)
+        "stripe_configured": bool(stripe_secret_key),
+        "clients": {"supabase": supabase.stats(), "stripe": stripe.stats()},
+        "pending_jobs": job_queue.pending(),
+        "openai_in_flight": openai_client.stats(),
+        "limits_cache": limits_cache.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "write_behind": write_behind.stats(),
+        "stripe_events": stripe_processor.stats(),
+        "auth_cache": jwt_verifier.stats(),
+        "admission": admission.stats()
     }
+    if deep:
+        body["deep"] = await deep_health.run()
+        if not body["deep"]["ok"]:
+            body["status"] = "degraded"
+    return body
 
-@app.post("/webhook")
+# Values kept by the caches and queues themselves, read when /metrics is scraped
+def cache_counts():
+    counts = {}
+    for name, stats in (
+        ("user_limits", limits_cache.stats()),
+        ("auth", jwt_verifier.stats()),
+        ("stripe_product", product_tier_cache.stats()),
+        ("stripe_customer", customer_user_cache.stats()),
+        ("team_membership", team_membership_cache.stats()),
+        ("rollup_version", rollup_service.versions.stats()),
+        ("rollup_response", rollup_service.responses.stats())
+    ):
+        counts[name] = (stats["hits"], stats["misses"])
+    # A disk hit is also a memory miss
+    transcript = transcript_cache.stats()
+    disk_hits = transcript["disk_hits"]
+    counts["transcript"] = (transcript["memory"]["hits"] + disk_hits, transcript["memory"]["misses"] - disk_hits)
+    return counts
+
+metrics_registry.callback("cache_hits_total", "Cache hits", lambda: {(name,): hits for name, (hits, _) in cache_counts().items()}, ["cache"], type="counter")
+metrics_registry.callback("cache_misses_total", "Cache misses", lambda: {(name,): misses for name, (_, misses) in cache_counts().items()}, ["cache"], type="counter")
+metrics_registry.callback("job_queue_pending", "Jobs waiting for a worker", lambda: {(): job_queue.pending()})
+metrics_registry.callback("openai_in_flight", "OpenAI calls in flight", lambda: {(tier,): count for tier, count in openai_client.stats().items()}, ["tier"])
+metrics_registry.callback("write_behind_pending", "Buffered Supabase writes", lambda: {(): write_behind.pending()})
+metrics_registry.callback("admission_rate_factor", "Share of the global admission rate left after OpenAI 429s", lambda: {(): openai_rate.factor})
+metrics_registry.callback("openai_rate_limited_total", "429 responses from OpenAI", lambda: {(): openai_rate.rate_limited_count}, type="counter")
+metrics_registry.callback("stripe_events_pending", "Stripe events waiting to be processed", lambda: {(): stripe_processor.pending()})
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics; like /health, doesn't require authentication"""
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/webhook", status_code=202)
 async def webhook(request: AudioRequest, user_id: str = Depends(get_current_user)):
     try:
-        filename = request.filename
-        # For now, assume file size is 5MB (you should get actual size)
-        file_size = 5000000
+        if not audio_storage.owns(audio_url(request)):
+            return foreign_file_response()
+        file_size = await audio_file_size(request)
+        if file_size is None:
+            return unreadable_file_response()
         
-        # Check user limits
+        limits, reservation, error_response = await admit_audio_request(user_id, file_size)
+        if error_response:
+            return error_response
+        
+        # Hand the transcribe -> analyze -> store stages to the worker pool
+        job = job_queue.enqueue(
+            user_id, process_audio_job, request, limits["tier"], file_size, None, limits["max_file_size"],
+            request_id=current_request_id(), tier=limits["tier"]
+        )
+        
+        return {
+            "message": "Processing started",
+            "job_id": job.id,
+            "status": job.status,
+            "conversation_id": request.conversation_id,
+            "usage": {
+                "current": reservation["current_usage"],
+                "limit": reservation["quota"]
+            }
+        }
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error processing audio: {str(e)}"}
+        )
+
+@app.post("/webhook/batch", status_code=202)
+async def webhook_batch(items: List[dict], user_id: str = Depends(get_current_user)):
+    try:
+        if not items:
+            raise HTTPException(status_code=400, detail="Batch is empty")
+        if len(items) > max_batch_size:
+            raise HTTPException(status_code=400, detail=f"Batch exceeds {max_batch_size} files")
+        
+        # Items are validated one by one, so a malformed item is rejected on its own
+        requests, rejected = [], {}
+        for index, item in enumerate(items):
+            try:
+                requests.append(AudioRequest.model_validate(item))
+            except ValidationError as e:
+                requests.append(None)
+                fields = ", ".join(str(error["loc"][0]) for error in e.errors() if error["loc"])
+                rejected[index] = f"Invalid field: {fields or 'item'}"
+        
+        # Real sizes from storage; foreign, unreadable or oversized files are rejected individually
+        owned = [request is not None and audio_storage.owns(audio_url(request)) for request in requests]
+        file_sizes = await asyncio.gather(*(
+            audio_file_size(request) if own else asyncio.sleep(0) for request, own in zip(requests, owned)
+        ))
         limits = await get_user_limits(user_id)
-        current_usage = await get_current_usage(user_id)
+        for index, file_size in enumerate(file_sizes):
+            if index in rejected:
+                continue
+            if not owned[index]:
+                rejected[index] = FOREIGN_FILE_MESSAGE
+            elif file_size is None:
+                rejected[index] = "Could not read the audio file's size. Check that the file URL is reachable."
+            elif file_size > limits["max_file_size"]:
+                rejected[index] = f"File exceeds your plan's maximum size of {limits['max_file_size']} bytes. Please upgrade your plan."
+        accepted = [index for index in range(len(requests)) if index not in rejected]
+        if not accepted:
+            return JSONResponse(
+                status_code=400,
+                content={"message": "No file in the batch can be processed", "items": [
+                    {"index": index, "filename": item.get("filename"), "status": "rejected", "message": rejected[index]}
+                    for index, item in enumerate(items)
+                ]}
+            )
+        
+        # The whole batch is admitted or turned away together
+        error_response = await check_admission(user_id, limits["tier"], len(accepted))
+        if error_response:
+            return error_response
         
-        # Enforce quota limits
-        if current_usage >= limits["monthly_quota"]:
+        # Check limits and reserve quota for the whole batch at once
+        reservation = await reserve_usage_batch(user_id, "audio_analysis", [file_sizes[i] for i in accepted], record_usage=False)
+        if reservation is None:
+            return JSONResponse(
+                status_code=500,
+                content={"message": "Error checking usage quota. Please try again."}
+            )
+        granted = reservation["granted"]
+        if granted == 0:
             return JSONResponse(
                 status_code=403,
                 content={"message": "Monthly quota exceeded. Please upgrade your plan."}
             )
         
-        # Log the usage
-        await log_usage(user_id, "audio_analysis", file_size)
+        # Items beyond the remaining quota are rejected individually
+        queued = accepted[:granted]
+        for index in accepted[granted:]:
+            rejected[index] = "Monthly quota exceeded. Please upgrade your plan."
+        job = job_queue.enqueue(
+            user_id, process_audio_batch_job, [requests[i] for i in queued], limits["tier"], [file_sizes[i] for i in queued], queued,
+            limits["max_file_size"], request_id=current_request_id(), tier=limits["tier"]
+        )
+        results = [
+            {
+                "index": index,
+                "filename": item.get("filename"),
+                "conversation_id": requests[index].conversation_id if requests[index] else item.get("conversation_id"),
+                "status": "rejected" if index in rejected else "queued",
+                **({"message": rejected[index]} if index in rejected else {})
+            }
+            for index, item in enumerate(items)
+        ]
         
-        # Process the audio file with OpenAI
+        return {
+            "message": f"Processing {len(queued)} of {len(requests)} files",
+            "job_id": job.id,
+            "status": job.status,
+            "items": results,
+            "usage": {
+                "current": reservation["current_usage"],
+                "limit": reservation["quota"]
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error processing batch: {str(e)}"}
+        )
+
+@app.post("/webhook/stream")
+async def webhook_stream(request: AudioRequest, user_id: str = Depends(get_current_user)):
+    try:
+        if not audio_storage.owns(audio_url(request)):
+            return foreign_file_response()
+        file_size = await audio_file_size(request)
+        if file_size is None:
+            return unreadable_file_response()
+        
+        limits, reservation, error_response = await admit_audio_request(user_id, file_size)
+        if error_response:
+            return error_response
+        
+        # The pipeline runs as a job; this response only relays its events
+        events = asyncio.Queue()
+        job = job_queue.enqueue(
+            user_id, process_audio_stream_job, request, limits["tier"], file_size, events, limits["max_file_size"],
+            request_id=current_request_id(), tier=limits["tier"]
+        )
+        events.put_nowait(sse_event("status", {"stage": job.stage, "job_id": job.id}))
+        return StreamingResponse(
+            relay_job_events(events),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error processing audio: {str(e)}"}
+        )
+
+@app.post("/upload", status_code=202)
+async def upload_audio(request: Request, user_id: str = Depends(get_current_user)):
+    """Stream a multipart audio upload (field "file") into storage, then queue it for analysis.
+
+    Optional form fields: conversation_id, duration_seconds. The file is never
+    held in memory; the upload is aborted as soon as it passes the plan's
+    max_file_size.
+    """
+    limits = await get_user_limits(user_id)
+    max_file_size = limits["max_file_size"]
+    
+    # Reject early when the declared body is already too big or the quota is (approximately) used up;
+    # the reservation after the upload is the real check
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_file_size + 65536:  # allow for the multipart framing
+        return file_too_large_response(max_file_size)
+    if await get_current_usage(user_id) >= limits["monthly_quota"]:
+        return JSONResponse(
+            status_code=403,
+            content={"message": "Monthly quota exceeded. Please upgrade your plan."}
+        )
+    # Rate-limit before accepting the body rather than after storing it
+    error_response = await check_admission(user_id, limits["tier"])
+    if error_response:
+        return error_response
+    
+    try:
+        reader = MultipartFileReader(request.headers.get("content-type"))
+    except UploadError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    
+    stream = UploadStream(reader.file_chunks(request.stream()), max_bytes=max_file_size, chunk_size=upload_chunk_size)
+    chunks = stream.__aiter__()
+    path = None
+    # Set while a quota slot is held for this upload but no job has taken it over
+    reserved = False
+    try:
+        # Read up to the first chunk so the file part's headers (and filename) are known
         try:
-            # Step 1: Transcribe the audio using OpenAI's Whisper API
-            print(f"Transcribing audio file: {filename}")
-            
-            # The filename should be a URL to the audio file in Supabase storage
-            transcription_response = openai.Audio.transcribe(
-                model="whisper-1",
-                file=filename,
-                response_format="text"
-            )
-            
-            # Step 2: Analyze the transcription using OpenAI's GPT-4
-            print("Analyzing transcription with GPT-4")
-            analysis_prompt = f"Analyze the following conversation transcript for a sales call with a doctor or medspa owner in the aesthetic or dental industry:\n\n{transcription_response}\n\nProvide insights on:"
-            analysis_prompt += "\n1. Key points discussed\n2. Customer pain points\n3. Objections raised\n4. Next steps\n5. Overall sentiment"
-            
-            analysis_response = openai.ChatCompletion.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert sales conversation analyzer specializing in medical device and aesthetic product sales to healthcare practitioners."},
-                    {"role": "user", "content": analysis_prompt}
-                ]
+            first_chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+        if not reader.found_file or first_chunk is None:
+            return JSONResponse(status_code=400, content={"message": "Missing audio file in form field 'file'"})
+        
+        async def body():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+        
+        path = upload_path(user_id, uuid.uuid4().hex, reader.filename)
+        with stage_timer("upload"):
+            await audio_storage.upload(path, body(), reader.file_content_type)
+        file_size = stream.size
+        
+        # Form fields are checked before a quota slot is taken
+        duration = reader.fields.get("duration_seconds", "")
+        try:
+            audio_request = AudioRequest(
+                filename=reader.filename or path,
+                duration_seconds=int(duration) if duration.isdigit() else None,
+                conversation_id=reader.fields.get("conversation_id") or None
             )
-            
-            analysis_text = analysis_response.choices[0].message.content
-            
-            # Step 3: Store the results in Supabase
-            # Parse the analysis text to extract structured data
-            try:
-                # Extract key components from the analysis text
-                key_points = []
-                pain_points = []
-                objections = []
-                next_steps = []
-                sentiment = "neutral"
-                
-                # Simple parsing logic - in production you'd want more robust parsing
-                for line in analysis_text.split("\n"):
-                    if line.lower().startswith("key point") or "key points" in line.lower():
-                        key_points.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
-                    elif line.lower().startswith("pain point") or "pain points" in line.lower():
-                        pain_points.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
-                    elif line.lower().startswith("objection") or "objections" in line.lower():
-                        objections.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
-                    elif line.lower().startswith("next step") or "next steps" in line.lower():
-                        next_steps.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
-                    elif "sentiment" in line.lower():
-                        if "positive" in line.lower():
-                            sentiment = "positive"
-                        elif "negative" in line.lower():
-                            sentiment = "negative"
-                
-                # Extract conversation ID from filename if provided
-                conversation_id = None
-                if request.conversation_id:
-                    conversation_id = request.conversation_id
-                
-                # If we have a conversation ID, update its status throughout the process
-                if conversation_id:
-                    # Update to transcribing status
-                    supabase_client.table('repspheres_conversations').update({'status': 'transcribing'}).eq('id', conversation_id).execute()
-                    
-                    # After transcription, update to analyzing status
-                    supabase_client.table('repspheres_conversations').update({'status': 'analyzing'}).eq('id', conversation_id).execute()
-                    
-                    # Store results in the new repspheres_linguistics_results table
-                    linguistics_data = {
-                        'conversation_id': conversation_id,
-                        'transcription': transcription_response,
-                        'sentiment': sentiment,
-                        'key_points': key_points,
-                        'pain_points': pain_points,
-                        'objections': objections,
-                        'next_steps': next_steps,
-                        'full_analysis': analysis_text,
-                        'created_at': datetime.utcnow().isoformat()
-                    }
-                    
-                    # Insert the results
-                    linguistics_result = supabase_client.table('repspheres_linguistics_results').insert(linguistics_data).execute()
-                    
-                    # Update conversation status to completed
-                    supabase_client.table('repspheres_conversations').update({
-                        'status': 'completed',
-                        'duration_seconds': request.duration_seconds if request.duration_seconds else 0
-                    }).eq('id', conversation_id).execute()
-            except Exception as store_error:
-                print(f"Error storing analysis results: {str(store_error)}")
-                if conversation_id:
-                    # Update conversation status to error
-                    supabase_client.table('repspheres_conversations').update({
-                        'status': 'error',
-                        'error_message': f"Error storing results: {str(store_error)}"
-                    }).eq('id', conversation_id).execute()
-            
-            return {
-                "message": "Processing completed successfully",
-                "conversation_id": conversation_id,
-                "transcription": transcription_response[:100] + "...",  # Truncated for response
-                "analysis_summary": analysis_text[:100] + "...",  # Truncated for response
-                "usage": {
-                    "current": current_usage + 1,
-                    "limit": limits["monthly_quota"]
-                }
+        except ValidationError as e:
+            await audio_storage.delete(path)
+            fields = ", ".join(str(error["loc"][0]) for error in e.errors())
+            return JSONResponse(status_code=422, content={"message": f"Invalid form field: {fields}"})
+        
+        limits, reservation, error_response = await admit_audio_request(user_id, file_size, check_rate=False)
+        if error_response:
+            await audio_storage.delete(path)
+            return error_response
+        reserved = True
+        
+        audio_request.transcription_url = await audio_storage.signed_url(path)
+        job = job_queue.enqueue(
+            user_id, process_audio_job, audio_request, limits["tier"], file_size, stream.sha256, limits["max_file_size"],
+            request_id=current_request_id(), tier=limits["tier"]
+        )
+        # The job records the usage row and keeps the slot from here on
+        reserved = False
+        
+        return {
+            "message": "Upload received, processing started",
+            "job_id": job.id,
+            "status": job.status,
+            "conversation_id": audio_request.conversation_id,
+            "path": path,
+            "file_size": file_size,
+            "sha256": stream.sha256,
+            "usage": {
+                "current": reservation["current_usage"],
+                "limit": reservation["quota"]
             }
-        except Exception as e:
-            print(f"Error processing audio with OpenAI: {str(e)}")
-            return JSONResponse(
-                status_code=500,
-                content={"message": f"Error processing audio with OpenAI: {str(e)}"}
-            )
+        }
+    except FileTooLarge:
+        if path:
+            await audio_storage.delete(path)
+        return file_too_large_response(max_file_size)
+    except StorageError as e:
+        print(f"[{current_request_id()}] Error storing upload: {str(e)}")
+        if path:
+            await audio_storage.delete(path)
+        return JSONResponse(status_code=502, content={"message": "Could not store the upload. Please try again."})
+    except UploadError as e:
+        if path:
+            await audio_storage.delete(path)
+        return JSONResponse(status_code=400, content={"message": f"Upload failed: {str(e)}"})
     except Exception as e:
+        if path:
+            await audio_storage.delete(path)
         return JSONResponse(
             status_code=500,
-            content={"message": f"Error processing audio: {str(e)}"}
+            content={"message": f"Error uploading audio: {str(e)}"}
         )
+    finally:
+        if reserved:
+            await release_usage(user_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: str = Depends(get_current_user)):
+    job = job_queue.get(job_id)
+    if not job or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.dict()
 
 @app.get("/user/usage")
 async def get_usage(user_id: str = Depends(get_current_user)):
@@ -364,26 +1441,129 @@ async def get_usage(user_id: str = Depends(get_current_user)):
             content={"message": f"Error getting usage: {str(e)}"}
         )
 
+@app.get("/search")
+async def search(q: str, team_id: str = None, limit: int = 20, cursor: str = None,
+                 user_id: str = Depends(get_current_user)):
+    """Ranked full-text search over the caller's (and their teams') transcripts and analyses.
+
+    Pass a result page's next_cursor as `cursor` to get the following page.
+    """
+    try:
+        params = search_params(user_id, q, team_id, limit, cursor)
+        with stage_timer("search"):
+            page = await asyncio.to_thread(search_results, supabase, params)
+        return {"query": q, **page}
+    except NotTeamMember as e:
+        return JSONResponse(status_code=403, content={"message": str(e)})
+    except SearchError as e:
+        return JSONResponse(status_code=400, content={"message": str(e)})
+    except Exception as e:
+        print(f"[{current_request_id()}] Error searching: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error searching: {str(e)}"}
+        )
+
+async def is_team_member(user_id: str, team_id: str) -> bool:
+    key = (user_id, team_id)
+    member = team_membership_cache.get(key)
+    if member is None:
+        response = await asyncio.to_thread(
+            lambda: supabase.table("repspheres_team_members").select("team_id").eq("team_id", team_id).eq("user_id", user_id).limit(1).execute()
+        )
+        member = bool(response.data)
+        team_membership_cache.set(key, member)
+    return member
+
+async def serve_rollup(request: Request, user_id: str, team_id: str, params: tuple, build):
+    """Serve a rollup read for the caller's own scope or one of their teams.
+
+    The ETag comes from the scope's rollup version: a matching If-None-Match
+    gets a 304, and a built body is reused until the version changes.
+    """
+    if team_id and not await is_team_member(user_id, team_id):
+        return JSONResponse(status_code=403, content={"message": f"Not a member of team {team_id}"})
+    scope = team_scope(team_id) if team_id else user_scope(user_id)
+    
+    version = await asyncio.to_thread(rollup_service.version, scope)
+    etag = rollup_service.etag(scope, version, request.url.path, *params)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        rollup_responses_total.inc("not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    body = rollup_service.responses.get(etag)
+    if body is None:
+        with stage_timer("rollup_read"):
+            body = {"scope": scope.split(":", 1)[0], "team_id": team_id, "version": version, **await asyncio.to_thread(build, scope)}
+        rollup_service.responses.set(etag, body)
+        rollup_responses_total.inc("built")
+    else:
+        rollup_responses_total.inc("cached")
+    return JSONResponse(content=body, headers=headers)
+
+@app.get("/analytics/weekly")
+async def analytics_weekly(request: Request, team_id: str = None, weeks: int = 12,
+                           user_id: str = Depends(get_current_user)):
+    """Weekly conversation, sentiment, objection and talk-time rollups by rep and by week.
+
+    Without team_id, covers the caller's own conversations. Supports
+    If-None-Match for cheap polling.
+    """
+    try:
+        weeks = max(1, min(weeks, 104))
+        since = first_week(weeks)
+        return await serve_rollup(
+            request, user_id, team_id, (since,),
+            lambda scope: {"since": since.isoformat(), **rollup_service.weekly(scope, since)}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error getting analytics: {str(e)}"}
+        )
+
+@app.get("/analytics/objections")
+async def analytics_objections(request: Request, team_id: str = None, weeks: int = 12, limit: int = 20,
+                               user_id: str = Depends(get_current_user)):
+    """The most frequent objections over the last `weeks` weeks; supports If-None-Match."""
+    try:
+        weeks = max(1, min(weeks, 104))
+        limit = max(1, min(limit, 100))
+        since = first_week(weeks)
+        return await serve_rollup(
+            request, user_id, team_id, (since, limit),
+            lambda scope: {"since": since.isoformat(), "objections": rollup_service.top_objections(scope, since, limit)}
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"message": f"Error getting analytics: {str(e)}"}
+        )
+
 @app.post("/stripe-webhook")
 async def stripe_webhook(request: Request):
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, stripe_webhook_secret
         )
+        # The signature checked out; the handlers work on the payload as plain dicts
+        event = json.loads(payload)
         
-        # Handle subscription events
-        event_type = event["type"]
-        if event_type == "customer.subscription.created":
-            await handle_subscription_created(event)
-        elif event_type == "customer.subscription.updated":
-            await handle_subscription_updated(event)
-        elif event_type == "customer.subscription.deleted":
-            await handle_subscription_deleted(event)
+        # Hand subscription and product events to the background processor
+        try:
+            result = stripe_processor.submit(event)
+        except asyncio.QueueFull:
+            # Stripe retries non-2xx responses, so ask it to come back later
+            return JSONResponse(
+                status_code=503,
+                content={"message": "Webhook backlog full, retry later"}
+            )
         
-        return {"status": "success"}
+        return {"status": "success", "event": result}
     except Exception as e:
         return JSONResponse(
             status_code=400,
@@ -0,0 +1,44 @@
+"""
+Backfill the team analytics rollups from conversations completed before
+they existed (or whose rollup update failed).
+
+Calls the backfill_conversation_rollups RPC in batches until no completed
+conversation is left uncounted. Conversations already counted are skipped,
+so the script can be interrupted and re-run at any time, including while
+the backend is serving traffic.
+
+Usage:
+    SUPABASE_URL=... SUPABASE_KEY=... python backfill_rollups.py --batch-size 500
+"""
+
+import argparse
+import os
+import time
+
+from clients import supabase_factory
+
+
+def main(args):
+    supabase = supabase_factory(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))()
+    start = time.perf_counter()
+    total = 0
+    for batch in range(1, args.max_batches + 1):
+        batch_start = time.perf_counter()
+        counted = supabase.rpc("backfill_conversation_rollups", {"p_batch_size": args.batch_size}).execute().data or 0
+        total += counted
+        print(f"Batch {batch}: {counted} conversations in {time.perf_counter() - batch_start:.2f}s ({total} total)")
+        if counted < args.batch_size:
+            break
+        if args.pause:
+            time.sleep(args.pause)
+    else:
+        print(f"Stopped after {args.max_batches} batches; run again to continue")
+    print(f"Rolled up {total} conversations in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="conversations per RPC call (one transaction)")
+    parser.add_argument("--max-batches", type=int, default=10000, help="stop after this many batches")
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches, to go easy on the database")
+    main(parser.parse_args())
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark of analysis parsing: the single-pass parser in
+analysis_parser.py against the keyword-matching loop it replaced.
+
+Each sample is a realistic GPT-4 analysis; `--repeat` concatenates it to
+simulate long multi-section analyses.
+
+Usage:
+    python benchmark_analysis_parser.py --repeat 1 --repeat 20 --number 2000
+"""
+
+import argparse
+import timeit
+
+from analysis_parser import parse_analysis, AnalysisStreamParser
+
+SAMPLES = {
+    "numbered": """1. Key points discussed
+- Key point: Practice is evaluating new injectables for its second location
+- Key point: Current supplier contract renews in March
+2. Customer pain points
+- Pain point: Long patient wait times for consultations
+- Pain point: Staff spend hours on manual inventory
+3. Objections raised
+- Objection: Price is above the current supplier
+- Objection: Partner needs to sign off on capital purchases
+4. Next steps
+- Next step: Send ROI breakdown by Friday
+- Next step: Book an in-office demo with both partners
+5. Overall sentiment: Positive""",
+    "markdown": """Here is a detailed analysis of the conversation between the rep and Dr. Alvarez.
+
+**1. Key Points Discussed:**
+- Dr. Alvarez runs two medspa locations and sees roughly 40 filler patients per week.
+- She is unhappy with the downtime of her current laser platform.
+- The practice wants to add body contouring within the next two quarters.
+
+**2. Customer Pain Points:**
+1. Patient no-shows cost the practice significant revenue each month.
+2. Training new staff on devices takes weeks.
+3. Financing options from the current vendor are inflexible.
+
+**3. Objections Raised:**
+- Upfront cost versus leasing; she also mentioned objections from her business partner.
+- Concern about the learning curve for her injectors.
+- Skepticism about the clinical data in darker skin types.
+
+**4. Next Steps:**
+- Schedule an in-office demo next Tuesday.
+- Send the financing options and a sample lease agreement.
+- Share two peer case studies from similar practices.
+
+**5. Overall Sentiment:**
+Cautiously positive. The doctor was engaged throughout but wants hard numbers before committing.
+
+6. Recommendations:
+- Lead the demo with ROI, then address training support.
+""",
+    "json": """{"key_points": ["Practice evaluating injectables", "Contract renews in March"],
+"pain_points": ["Long wait times", "Manual inventory"],
+"objections": ["Price above current supplier"],
+"next_steps": ["Send ROI breakdown", "Book demo"],
+"sentiment": "positive"}""",
+}
+
+
+def legacy_parse_analysis(analysis_text: str):
+    # The parsing loop /webhook used before analysis_parser.py, kept for comparison
+    key_points = []
+    pain_points = []
+    objections = []
+    next_steps = []
+    sentiment = "neutral"
+    for line in analysis_text.split("\n"):
+        if line.lower().startswith("key point") or "key points" in line.lower():
+            key_points.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
+        elif line.lower().startswith("pain point") or "pain points" in line.lower():
+            pain_points.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
+        elif line.lower().startswith("objection") or "objections" in line.lower():
+            objections.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
+        elif line.lower().startswith("next step") or "next steps" in line.lower():
+            next_steps.append(line.split(":", 1)[1].strip() if ":" in line else line.strip())
+        elif "sentiment" in line.lower():
+            if "positive" in line.lower():
+                sentiment = "positive"
+            elif "negative" in line.lower():
+                sentiment = "negative"
+    return {"key_points": key_points, "pain_points": pain_points, "objections": objections,
+            "next_steps": next_steps, "sentiment": sentiment}
+
+
+def stream_parse(text: str):
+    parser = AnalysisStreamParser()
+    for i in range(0, len(text), 4):
+        parser.feed(text[i:i + 4])
+    parser.close()
+    return parser.parsed
+
+
+def bench(fn, text: str, number: int) -> float:
+    return min(timeit.repeat(lambda: fn(text), number=number, repeat=3)) / number
+
+
+def main(args):
+    print(f"{'sample':<10} {'repeat':>6} {'lines':>6} {'legacy us':>10} {'parser us':>10} {'stream us':>10}")
+    for repeat in args.repeat or [1, 20]:
+        for name, sample in SAMPLES.items():
+            # Repeating JSON would make it invalid, so it's only measured once
+            if name == "json" and repeat > 1:
+                continue
+            text = "\n".join([sample] * repeat)
+            lines = text.count("\n") + 1
+            number = max(1, args.number // repeat)
+            legacy = bench(legacy_parse_analysis, text, number) * 1e6
+            parser = bench(parse_analysis, text, number) * 1e6
+            stream = bench(stream_parse, text, number) * 1e6
+            print(f"{name:<10} {repeat:>6} {lines:>6} {legacy:>10.1f} {parser:>10.1f} {stream:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, action="append", help="times to concatenate each sample (repeatable)")
+    parser.add_argument("--number", type=int, default=2000, help="parses per timing run")
+    main(parser.parse_args())
@@ -0,0 +1,76 @@
+"""
+Per-request auth overhead of JWTVerifier with a cold and a warm token cache.
+
+Cold runs verify every token from scratch (a new session each request); warm
+runs replay the same tokens, which is what repeated requests from open
+sessions look like. RS256 uses an in-memory JWKS so no network is involved.
+
+Usage:
+    python benchmark_auth.py --users 1000 --rounds 5
+"""
+
+import argparse
+import json
+import time
+import uuid
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from auth import JWTVerifier
+
+SECRET = "benchmark-secret-benchmark-secret-0123456789"
+
+
+def make_tokens(users: int, sign):
+    expires = int(time.time()) + 3600
+    return [sign({"sub": str(uuid.uuid4()), "aud": "authenticated", "role": "authenticated", "exp": expires})
+            for _ in range(users)]
+
+
+def hs256_setup(users: int):
+    tokens = make_tokens(users, lambda claims: jwt.encode(claims, SECRET, algorithm="HS256"))
+    return tokens, lambda: JWTVerifier(secret=SECRET, cache_size=users)
+
+
+def rs256_setup(users: int):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": "bench", "use": "sig", "alg": "RS256"})
+    tokens = make_tokens(users, lambda claims: jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": "bench"}))
+
+    def verifier():
+        v = JWTVerifier(jwks_url="https://example.invalid/jwks.json", cache_size=users)
+        # Serve the JWKS from memory instead of the network
+        v._jwks.fetch_data = mock.Mock(return_value={"keys": [jwk]})
+        v.warm()
+        return v
+    return tokens, verifier
+
+
+def per_token_us(verifier, tokens) -> float:
+    start = time.perf_counter()
+    for token in tokens:
+        verifier.verify(token)
+    return (time.perf_counter() - start) / len(tokens) * 1e6
+
+
+def main(args):
+    print(f"{'alg':<6} {'users':>6} {'cold us':>9} {'warm us':>9} {'speedup':>8}")
+    for name, setup in (("HS256", hs256_setup), ("RS256", rs256_setup)):
+        tokens, new_verifier = setup(args.users)
+        cold, warm = [], []
+        for _ in range(args.rounds):
+            verifier = new_verifier()
+            cold.append(per_token_us(verifier, tokens))
+            warm.append(per_token_us(verifier, tokens))
+        cold_us, warm_us = min(cold), min(warm)
+        print(f"{name:<6} {args.users:>6} {cold_us:>9.1f} {warm_us:>9.1f} {cold_us / warm_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="distinct tokens per round")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds per algorithm (best is reported)")
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""
+Compare end-to-end transcription latency of the single-call path with the
+parallel chunked path on a synthetic recording.
+
+The recording is generated with pydub (speech-like tone bursts separated by
+short silences) and exported as WAV, so no ffmpeg is needed. Whisper is
+simulated by FakeOpenAIBackend, whose latency grows with the size of the
+uploaded audio, like the real API.
+
+Usage:
+    python benchmark_chunked_transcription.py --minutes 40 --segment-seconds 300 --parallelism 4
+"""
+
+import argparse
+import asyncio
+import io
+import time
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from chunked_transcription import ChunkingConfig, transcribe_chunked
+from openai_client import OpenAIClient, FakeOpenAIBackend
+
+
+def synthetic_recording(minutes: float, sample_rate: int = 8000) -> bytes:
+    # 9 seconds of "speech" followed by a 700 ms pause, repeated
+    speech = Sine(220).to_audio_segment(duration=9000, volume=-12).set_frame_rate(sample_rate).set_channels(1)
+    pause = AudioSegment.silent(duration=700, frame_rate=sample_rate)
+    pattern = speech + pause
+    repeats = max(1, int(minutes * 60000 / len(pattern)))
+    buffer = io.BytesIO()
+    (pattern * repeats).export(buffer, format="wav")
+    return buffer.getvalue()
+
+
+async def main(args):
+    audio = synthetic_recording(args.minutes)
+    bytes_per_second = len(audio) / (args.minutes * 60)
+    print(f"Synthetic recording: {args.minutes} min, {len(audio) / 1000000:.1f} MB")
+
+    backend = FakeOpenAIBackend(
+        transcribe_latency=1.0 * args.scale,
+        transcribe_latency_per_mb=args.latency_per_mb * args.scale,
+        audio_bytes_per_second=bytes_per_second,
+        transcript="Doctor asked about pricing. Rep explained the financing options. They agreed to a follow up.",
+    )
+    client = OpenAIClient(backend, tier_concurrency={"free": args.parallelism, "basic": args.parallelism, "pro": args.parallelism})
+
+    start = time.perf_counter()
+    await client.transcribe(audio, "recording.wav", tier="pro")
+    single = time.perf_counter() - start
+
+    config = ChunkingConfig(
+        segment_seconds=args.segment_seconds,
+        overlap_seconds=args.overlap_seconds,
+        parallelism=args.parallelism,
+        export_format="wav",
+    )
+    start = time.perf_counter()
+    result = await transcribe_chunked(client, audio, "recording.wav", config, tier="pro")
+    chunked = time.perf_counter() - start
+
+    print(f"Single call: {single:.2f}s")
+    print(
+        f"Chunked:     {chunked:.2f}s ({backend.calls['transcribe'] - 1} segments of "
+        f"{args.segment_seconds:.0f}s, parallelism {args.parallelism})"
+    )
+    print(f"Speedup:     {single / chunked:.2f}x")
+    last = result["segments"][-1] if result["segments"] else None
+    if last:
+        print(f"Stitched {len(result['segments'])} transcript segments ending at {last['end']:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=40)
+    parser.add_argument("--segment-seconds", type=float, default=300)
+    parser.add_argument("--overlap-seconds", type=float, default=2)
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--latency-per-mb", type=float, default=0.5, help="simulated Whisper seconds per MB")
+    parser.add_argument("--scale", type=float, default=0.1, help="multiplier applied to simulated latencies")
+    asyncio.run(main(parser.parse_args()))
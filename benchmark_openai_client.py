@@ -0,0 +1,90 @@
+"""
+Offline latency/throughput benchmark for the OpenAI client layer.
+
+Runs a burst of transcribe + analyze pipelines for free and pro users against
+FakeOpenAIBackend and reports per-tier latency percentiles, overall
+throughput and the worst event loop stall seen while the burst was running.
+
+Usage:
+    python benchmark_openai_client.py --free 40 --pro 10 --scale 0.01
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from openai_client import OpenAIClient, FakeOpenAIBackend, DEFAULT_TIER_CONCURRENCY
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_pipeline(client: OpenAIClient, tier: str):
+    start = time.perf_counter()
+    audio = await client.fetch_audio("https://storage.local/audio.mp3")
+    transcript = await client.transcribe(audio, "audio.mp3", tier=tier)
+    await client.chat([{"role": "user", "content": transcript}], tier=tier)
+    return tier, time.perf_counter() - start
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005):
+    worst = 0.0
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - expected)
+    return worst
+
+
+async def main(args):
+    backend = FakeOpenAIBackend(
+        transcribe_latency=2.0 * args.scale,
+        transcribe_latency_per_mb=0.5 * args.scale,
+        chat_latency=5.0 * args.scale,
+        fetch_latency=0.05 * args.scale,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    tier_concurrency = dict(DEFAULT_TIER_CONCURRENCY, free=args.free_cap, pro=args.pro_cap)
+    client = OpenAIClient(backend, tier_concurrency=tier_concurrency, backoff_base=0.05 * args.scale)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    tiers = ["free"] * args.free + ["pro"] * args.pro
+    start = time.perf_counter()
+    results = await asyncio.gather(*(run_pipeline(client, tier) for tier in tiers), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_lag = await lag_task
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    print(f"{len(tiers)} pipelines in {elapsed:.2f}s ({len(tiers) / elapsed:.1f} pipelines/s), {len(failures)} failed")
+    print(f"Backend calls: {backend.calls}")
+    print(f"Worst event loop stall: {worst_lag * 1000:.1f} ms")
+    for tier in ("free", "pro"):
+        latencies = [r[1] for r in results if not isinstance(r, Exception) and r[0] == tier]
+        if latencies:
+            print(
+                f"{tier:>5}: n={len(latencies)} mean={statistics.mean(latencies):.3f}s "
+                f"p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s "
+                f"max={max(latencies):.3f}s"
+            )
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--free", type=int, default=40, help="number of free-tier pipelines")
+    parser.add_argument("--pro", type=int, default=10, help="number of pro-tier pipelines")
+    parser.add_argument("--free-cap", type=int, default=DEFAULT_TIER_CONCURRENCY["free"])
+    parser.add_argument("--pro-cap", type=int, default=DEFAULT_TIER_CONCURRENCY["pro"])
+    parser.add_argument("--scale", type=float, default=0.01, help="multiplier applied to simulated latencies")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+"""
+Cold-start time of the backend process.
+
+Each round starts a fresh interpreter that imports backend_implementation,
+runs the FastAPI startup hooks and serves one GET /health through httpx's
+ASGI transport. The vendor URLs point nowhere and client warming is off by
+default, so only local work is timed; pass --warm to include it. --repo
+benchmarks another checkout (e.g. a git worktree of an older commit).
+
+Usage:
+    python benchmark_startup.py --rounds 10
+    python benchmark_startup.py --repo /tmp/baseline-checkout
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import backend_implementation as backend
+imported = time.perf_counter()
+import httpx
+
+async def first_request():
+    for handler in backend.app.router.on_startup:
+        await handler()
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=backend.app), base_url="http://bench") as client:
+        response = await client.get("/health")
+    served = time.perf_counter()
+    for handler in backend.app.router.on_shutdown:
+        await handler()
+    return started, served, response.status_code
+
+started, served, status = asyncio.run(first_request())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - imported) * 1000,
+    "first_request_ms": (served - started) * 1000,
+    "total_ms": (served - start) * 1000,
+    "status": status,
+    "sdks_loaded": sorted(name for name in ("supabase", "stripe") if name in sys.modules),
+}))
+"""
+
+FIELDS = ("import_ms", "startup_ms", "first_request_ms", "total_ms")
+
+
+def probe_environment(warm: bool) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": "http://supabase.invalid",
+        "SUPABASE_KEY": "benchmark",
+        "SUPABASE_JWT_SECRET": "benchmark-secret-benchmark-secret-0123456789",
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "STRIPE_WEBHOOK_SECRET": "whsec_benchmark",
+        "OPENAI_API_KEY": "benchmark",
+        "TRANSCRIPT_CACHE_DIR": "",
+        "WARM_CLIENTS": "true" if warm else "false",
+        "CLIENT_WARM_TIMEOUT": "2",
+    })
+    return env
+
+
+def run_probe(repo: str, env: dict) -> dict:
+    completed = subprocess.run([sys.executable, "-c", PROBE], cwd=repo, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Probe failed:\n{completed.stderr[-2000:]}")
+    # The backend logs to stdout too; the probe's JSON is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    repo = os.path.abspath(args.repo)
+    env = probe_environment(args.warm)
+    # Throwaway run so .pyc compilation isn't counted
+    run_probe(repo, env)
+    samples = [run_probe(repo, env) for _ in range(args.rounds)]
+
+    print(f"{repo} ({args.rounds} rounds, warm={args.warm})")
+    print(f"{'':<18} {'median':>9} {'min':>9} {'max':>9}")
+    for field in FIELDS:
+        values = [sample[field] for sample in samples]
+        print(f"{field:<18} {statistics.median(values):>9.1f} {min(values):>9.1f} {max(values):>9.1f}")
+    print(f"status {samples[0]['status']}, SDKs imported by then: {', '.join(samples[0]['sdks_loaded']) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10, help="fresh processes to time")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.abspath(__file__)), help="checkout to benchmark")
+    parser.add_argument("--warm", action="store_true", help="also warm vendor clients during startup (WARM_CLIENTS)")
+    main(parser.parse_args())
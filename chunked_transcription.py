@@ -0,0 +1,169 @@
+"""
+Parallel chunked transcription for long recordings.
+
+Whisper latency grows linearly with call length and the API rejects files
+over 25 MB, so long recordings are split into overlapping segments, cut at
+silence near each segment boundary where possible. The segments are
+transcribed concurrently with a bounded fan-out and stitched back into one
+transcript whose timestamps are relative to the start of the original file.
+
+Decoding and silence detection use pydub (and ffmpeg for compressed
+formats), which are only imported when a recording actually needs splitting.
+Recordings are decoded to mono at no more than 16 kHz, the rate Whisper
+works at, which keeps the decoded audio of a long call to a fraction of its
+native size.
+"""
+
+import asyncio
+import io
+import os
+
+# Whisper resamples to 16 kHz mono anyway
+DECODE_FRAME_RATE = 16000
+
+
+class ChunkingConfig:
+    def __init__(self, segment_seconds: float = 600, overlap_seconds: float = 2,
+                 parallelism: int = 4, threshold_bytes: int = 20000000,
+                 silence_search_seconds: float = 30, export_format: str = "mp3"):
+        self.segment_ms = int(segment_seconds * 1000)
+        self.overlap_ms = int(overlap_seconds * 1000)
+        if self.segment_ms <= 0 or not 0 <= self.overlap_ms < self.segment_ms:
+            raise ValueError(
+                f"Segment length ({segment_seconds}s) must be positive and longer than the overlap ({overlap_seconds}s)"
+            )
+        self.parallelism = max(1, parallelism)
+        self.threshold_bytes = threshold_bytes
+        self.search_ms = int(silence_search_seconds * 1000)
+        self.export_format = export_format
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            segment_seconds=float(os.environ.get("TRANSCRIBE_SEGMENT_SECONDS", "600")),
+            overlap_seconds=float(os.environ.get("TRANSCRIBE_OVERLAP_SECONDS", "2")),
+            parallelism=int(os.environ.get("TRANSCRIBE_PARALLELISM", "4")),
+            threshold_bytes=int(os.environ.get("TRANSCRIBE_CHUNK_THRESHOLD_BYTES", "20000000")),
+            silence_search_seconds=float(os.environ.get("TRANSCRIBE_SILENCE_SEARCH_SECONDS", "30")),
+            export_format=os.environ.get("TRANSCRIBE_SEGMENT_FORMAT", "mp3"),
+        )
+
+
+def plan_segments(duration_ms: int, segment_ms: int, overlap_ms: int, find_split=None):
+    """Return (start_ms, end_ms) pairs covering the recording.
+
+    `find_split(window_start, window_end)` may return a preferred cut point
+    (e.g. the middle of a silence) inside the window before each nominal
+    boundary; otherwise the segment is cut at exactly `segment_ms`.
+    Consecutive segments overlap by `overlap_ms` so no word is lost at a cut.
+    """
+    if overlap_ms >= segment_ms:
+        # Segments would never advance
+        raise ValueError("overlap_ms must be shorter than segment_ms")
+    segments = []
+    start = 0
+    while start < duration_ms:
+        end = start + segment_ms
+        if end >= duration_ms:
+            segments.append((start, duration_ms))
+            break
+        if find_split:
+            split = find_split(max(start + overlap_ms + 1, end - segment_ms // 4), end)
+            if split is not None:
+                end = split
+        segments.append((start, end))
+        start = end - overlap_ms
+    return segments
+
+
+def split_audio(audio: bytes, filename: str, config: ChunkingConfig):
+    """Decode `audio` and return a list of (start_ms, end_ms, segment_bytes)."""
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+
+    extension = os.path.splitext(filename)[1].lstrip(".").lower() or None
+    # ffmpeg downmixes and resamples while decoding; WAV is read by pydub itself, so it is
+    # converted here instead (and only ever downsampled)
+    sound = AudioSegment.from_file(
+        io.BytesIO(audio), format=extension, parameters=["-ac", "1", "-ar", str(DECODE_FRAME_RATE)]
+    )
+    sound = sound.set_channels(1)
+    if sound.frame_rate > DECODE_FRAME_RATE:
+        sound = sound.set_frame_rate(DECODE_FRAME_RATE)
+    silence_thresh = sound.dBFS - 16
+
+    def find_split(window_start, window_end):
+        # Only scan the tail of each segment for silence; whole-file detection is slow
+        window_start = max(window_start, window_end - config.search_ms)
+        window = sound[window_start:window_end]
+        silences = detect_silence(window, min_silence_len=300, silence_thresh=silence_thresh, seek_step=10)
+        if not silences:
+            return None
+        # Cut in the middle of the last silence before the boundary
+        silence_start, silence_end = silences[-1]
+        return window_start + (silence_start + silence_end) // 2
+
+    segments = []
+    for start, end in plan_segments(len(sound), config.segment_ms, config.overlap_ms, find_split):
+        buffer = io.BytesIO()
+        sound[start:end].export(buffer, format=config.export_format)
+        segments.append((start, end, buffer.getvalue()))
+    return segments
+
+
+def stitch_segments(chunks):
+    """Merge per-chunk Whisper verbose_json results into one transcript.
+
+    `chunks` is a list of (start_ms, end_ms, result) in order. Each chunk's
+    segment timestamps are shifted by its offset, and a Whisper segment in an
+    overlap belongs to whichever chunk owns its midpoint, so overlapping
+    speech is kept exactly once.
+    """
+    merged = []
+    for index, (start_ms, end_ms, result) in enumerate(chunks):
+        offset = start_ms / 1000
+        # Ownership boundaries are the midpoints of the overlaps with the neighbours
+        lower = (start_ms + chunks[index - 1][1]) / 2000 if index > 0 else float("-inf")
+        upper = (chunks[index + 1][0] + end_ms) / 2000 if index + 1 < len(chunks) else float("inf")
+        segments = result.get("segments") or [{"start": 0, "end": (end_ms - start_ms) / 1000, "text": result.get("text", "")}]
+        for segment in segments:
+            seg_start = segment["start"] + offset
+            seg_end = segment["end"] + offset
+            midpoint = (seg_start + seg_end) / 2
+            if lower <= midpoint < upper:
+                merged.append({"start": round(seg_start, 3), "end": round(seg_end, 3), "text": segment["text"].strip()})
+    text = " ".join(segment["text"] for segment in merged if segment["text"])
+    return {"text": text, "segments": merged}
+
+
+def single_transcript(result: dict):
+    """Shape one un-split verbose_json result like transcribe_chunked's, with rounded timestamps."""
+    duration_ms = int((result.get("duration") or 0) * 1000)
+    segments = stitch_segments([(0, duration_ms, result)])["segments"]
+    return {"text": (result.get("text") or "").strip(), "segments": segments}
+
+
+async def transcribe_chunked(client, audio: bytes, filename: str, config: ChunkingConfig,
+                             tier: str = "free", model: str = "whisper-1"):
+    """Transcribe `audio` in parallel segments and return {"text", "segments"}."""
+    chunks = await asyncio.to_thread(split_audio, audio, filename, config)
+    semaphore = asyncio.Semaphore(config.parallelism)
+    base_name = os.path.splitext(os.path.basename(filename))[0] or "audio"
+
+    async def transcribe_segment(index, data):
+        # Fan-out is bounded here and again by the client's per-tier cap
+        async with semaphore:
+            return await client.transcribe(
+                data,
+                f"{base_name}-{index}.{config.export_format}",
+                tier=tier,
+                model=model,
+                response_format="verbose_json"
+            )
+
+    results = await asyncio.gather(*(
+        transcribe_segment(index, data) for index, (_, _, data) in enumerate(chunks)
+    ))
+    return stitch_segments([
+        (start, end, result) for (start, end, _), result in zip(chunks, results)
+    ])
@@ -0,0 +1,122 @@
+"""
+Lazily created vendor clients and a cached deep health check.
+
+Importing the Supabase and Stripe SDKs and building their clients costs a
+few hundred milliseconds, which every autoscaled instance paid at import
+time even if it only ever answered /health. LazyClient defers both to the
+first real use, creates the client once (thread-safe, since the sync
+Supabase calls run in worker threads) and shares it. FastAPI's startup hook
+can still create them and open connections ahead of the first request.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class LazyClient:
+    """Creates a shared client on first use and forwards attribute access to it.
+
+    `factory` is called at most once, unless reset() is called. override()
+    swaps in another object (a fake, in load tests) without calling it.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.init_seconds = None
+
+    @property
+    def created(self) -> bool:
+        return self._instance is not None
+
+    def get(self):
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    self.init_seconds = time.perf_counter() - start
+                instance = self._instance
+        return instance
+
+    def override(self, instance):
+        with self._lock:
+            self._instance = instance
+
+    def reset(self):
+        with self._lock:
+            self._instance = None
+            self.init_seconds = None
+
+    def stats(self) -> dict:
+        return {
+            "created": self.created,
+            "init_ms": round(self.init_seconds * 1000, 1) if self.init_seconds is not None else None,
+        }
+
+    def __getattr__(self, name):
+        # Only reached for attributes LazyClient itself doesn't define
+        return getattr(self.get(), name)
+
+
+def supabase_factory(url: str, key: str):
+    def create():
+        if not url or not key:
+            raise RuntimeError("Supabase is not configured (SUPABASE_URL / SUPABASE_KEY)")
+        from supabase import create_client
+        return create_client(url, key)
+    return create
+
+
+def stripe_factory(api_key: str):
+    """The stripe module itself is the client; it's configured on import."""
+    def create():
+        import stripe
+        stripe.api_key = api_key
+        return stripe
+    return create
+
+
+class DeepHealthCheck:
+    """Runs named async checks against the vendors and caches the result for `ttl` seconds.
+
+    Concurrent callers share one run, so a burst of probes makes one round of
+    vendor calls. Each check gets `timeout` seconds.
+    """
+
+    def __init__(self, checks: dict, ttl: float = 30.0, timeout: float = 5.0):
+        self.checks = checks
+        self.ttl = ttl
+        self.timeout = timeout
+        self._result = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _check(self, name: str, check):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), self.timeout)
+            outcome = {"ok": True}
+        except asyncio.TimeoutError:
+            outcome = {"ok": False, "error": f"Timed out after {self.timeout}s"}
+        except Exception as e:
+            outcome = {"ok": False, "error": str(e)[:200]}
+        outcome["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return name, outcome
+
+    async def run(self) -> dict:
+        async with self._lock:
+            age = time.monotonic() - self._checked_at
+            if self._result is not None and age < self.ttl:
+                return {**self._result, "cached": True, "age_seconds": round(age, 1)}
+            outcomes = await asyncio.gather(*(self._check(name, check) for name, check in self.checks.items()))
+            self._result = {
+                "ok": all(outcome["ok"] for _, outcome in outcomes),
+                "checks": dict(outcomes),
+            }
+            self._checked_at = time.monotonic()
+            return {**self._result, "cached": False, "age_seconds": 0.0}
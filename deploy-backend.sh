@@ -33,20 +33,30 @@ fi
 if [ ! -f "requirements.txt" ]; then
     echo -e "${YELLOW}Creating requirements.txt...${NC}"
     cat > requirements.txt << EOF
-fastapi==0.95.1
-uvicorn==0.22.0
-pydantic==1.10.7
-python-multipart==0.0.6
-python-jose==3.3.0
-stripe==5.4.0
-supabase==1.0.3
-openai==0.27.6
+fastapi==0.143.0
+uvicorn==0.54.0
+pydantic==2.14.1
+python-multipart==0.0.32
+httpx==0.28.1
+stripe==16.0.0
+supabase==2.32.0
 python-dotenv==1.0.0
-pyjwt==2.6.0
+PyJWT[crypto]==2.15.1
+# Splitting long recordings (also needs the ffmpeg binary, installed in the Dockerfile)
+pydub==0.25.1
+# Optional: exact token counts for long-transcript analysis
+tiktoken>=0.7
+# Optional: admission buckets shared between workers (ADMISSION_REDIS_URL)
+redis>=5.0
 EOF
     echo -e "${GREEN}requirements.txt created.${NC}"
 fi
 
+# ffmpeg is needed to split long recordings for parallel transcription
+if ! command -v ffmpeg &> /dev/null; then
+    echo -e "${YELLOW}Warning: ffmpeg is not installed. Recordings over TRANSCRIBE_CHUNK_THRESHOLD_BYTES will fail to transcribe without it.${NC}"
+fi
+
 # Create .env.example if it doesn't exist
 if [ ! -f ".env.example" ]; then
     echo -e "${YELLOW}Creating .env.example...${NC}"
@@ -54,6 +64,9 @@ if [ ! -f ".env.example" ]; then
 # Supabase configuration
 SUPABASE_URL=your-supabase-url
 SUPABASE_KEY=your-supabase-service-role-key
+# Required if your project signs tokens with the legacy JWT secret (HS256);
+# without it tokens are verified against the project's JWKS
+SUPABASE_JWT_SECRET=your-supabase-jwt-secret
 
 # OpenAI configuration
 OPENAI_API_KEY=your-openai-api-key
@@ -81,7 +94,10 @@ fi
 if [ ! -f "Dockerfile" ]; then
     echo -e "${YELLOW}Creating Dockerfile...${NC}"
     cat > Dockerfile << EOF
-FROM python:3.9-slim
+FROM python:3.11-slim
+
+# pydub decodes and re-encodes long recordings with ffmpeg
+RUN apt-get update && apt-get install -y --no-install-recommends ffmpeg && rm -rf /var/lib/apt/lists/*
 
 WORKDIR /app
 
@@ -128,6 +144,8 @@ services:
         sync: false
       - key: SUPABASE_KEY
         sync: false
+      - key: SUPABASE_JWT_SECRET
+        sync: false
       - key: OPENAI_API_KEY
         sync: false
       - key: STRIPE_SECRET_KEY
@@ -182,6 +200,7 @@ This is the backend for the RepSpheres application, which handles audio transcri
    \`\`\`bash
    heroku config:set SUPABASE_URL=your-supabase-url
    heroku config:set SUPABASE_KEY=your-supabase-service-role-key
+   heroku config:set SUPABASE_JWT_SECRET=your-supabase-jwt-secret
    heroku config:set OPENAI_API_KEY=your-openai-api-key
    # Add other environment variables as needed
    \`\`\`
@@ -218,6 +237,8 @@ docker-compose up
 
 - \`SUPABASE_URL\`: URL of your Supabase project.
 - \`SUPABASE_KEY\`: Service role key for your Supabase project.
+- \`SUPABASE_JWT_SECRET\`: JWT secret for your Supabase project (Settings > API). Required if the project signs access tokens with the legacy HS256 secret; when unset, tokens are verified against the project's JWKS and HS256 tokens are rejected with 401.
+- \`SUPABASE_JWKS_REFRESH_INTERVAL\`: Minimum seconds between JWKS refetches for unknown key ids (default 60).
 - \`OPENAI_API_KEY\`: API key for OpenAI.
 - \`STRIPE_SECRET_KEY\`: Secret key for Stripe (if using subscriptions).
 - \`STRIPE_WEBHOOK_SECRET\`: Webhook secret for Stripe (if using subscriptions).
@@ -0,0 +1,459 @@
+"""
+In-process fakes of Supabase, Stripe and Storage for load tests and benchmarks.
+The OpenAI fake, FakeOpenAIBackend, lives in openai_client next to the real
+backend it stands in for.
+
+Each fake has a fixed latency and a seeded error rate, so runs are
+reproducible. FakeSupabase implements only the query builder calls and RPCs
+the backend makes. It sleeps synchronously, like the real (blocking) client,
+so any call made on the event loop instead of a thread shows up as lost
+throughput.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+QUOTA_BY_TIER = {"free": 10, "basic": 50, "pro": 250}
+
+
+class FakeServiceError(Exception):
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, data, count: int = None):
+        self.data = data
+        self.count = count
+
+
+class _Query:
+    def __init__(self, db, table: str):
+        self._db = db
+        self._table = table
+        self._action = "select"
+        self._payload = None
+        self._filters = []
+        self._limit = None
+
+    def select(self, columns: str = "*", count: str = None):
+        self._action = "select"
+        return self
+
+    def insert(self, rows):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict: str = None):
+        self._action, self._payload = "upsert", rows
+        return self
+
+    def update(self, payload: dict):
+        self._action, self._payload = "update", payload
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def eq(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column: str, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def in_(self, column: str, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        return self
+
+    def _matches(self, row) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def execute(self) -> FakeResponse:
+        self._db._simulate(f"{self._action}:{self._table}")
+        with self._db.lock:
+            rows = self._db.tables[self._table]
+            if self._action == "select":
+                found = [dict(row) for row in rows if self._matches(row)]
+                return FakeResponse(found[:self._limit] if self._limit else found, len(found))
+            if self._action == "delete":
+                kept = [row for row in rows if not self._matches(row)]
+                deleted = len(rows) - len(kept)
+                self._db.tables[self._table] = kept
+                return FakeResponse([], deleted)
+            if self._action == "update":
+                updated = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self._payload)
+                        updated.append(dict(row))
+                return FakeResponse(updated)
+            new_rows = self._payload if isinstance(self._payload, list) else [self._payload]
+            written = []
+            for new_row in new_rows:
+                key = self._db.primary_keys.get(self._table, "id")
+                existing = None
+                if self._action == "upsert" and key in new_row:
+                    existing = next((row for row in rows if row.get(key) == new_row[key]), None)
+                if existing is not None:
+                    existing.update(new_row)
+                    written.append(dict(existing))
+                else:
+                    row = {"id": str(uuid.uuid4()), **new_row}
+                    rows.append(row)
+                    written.append(dict(row))
+            return FakeResponse(written)
+
+
+class _RPC:
+    def __init__(self, db, name: str, params: dict):
+        self._db = db
+        self._name = name
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        self._db._simulate(f"rpc:{self._name}")
+        handler = self._db.rpcs.get(self._name)
+        if handler is None:
+            raise FakeServiceError(f"Unknown RPC {self._name}")
+        with self._db.lock:
+            return FakeResponse(handler(self._db, **self._params))
+
+
+def _usage_row(db, user_id: str) -> dict:
+    # Mirrors the user_limits row handling at the top of reserve_usage_slot(s)
+    limits = next((row for row in db.tables["user_limits"] if row["user_id"] == user_id), None)
+    if limits is None:
+        limits = {
+            "user_id": user_id,
+            "tier": "free",
+            "monthly_quota": QUOTA_BY_TIER["free"],
+            "max_file_size": 25000000,
+            "usage_count": 0,
+            "usage_reset_date": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat(),
+        }
+        db.tables["user_limits"].append(limits)
+    reset_date = datetime.fromisoformat(limits["usage_reset_date"].replace("Z", "+00:00"))
+    if reset_date.tzinfo is None:
+        reset_date = reset_date.replace(tzinfo=timezone.utc)
+    if reset_date <= datetime.now(timezone.utc):
+        limits["usage_count"] = 0
+        limits["usage_reset_date"] = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+    return limits
+
+
+def _reserve_usage_slot(db, p_user_id, p_request_type, p_file_size=0, p_enforce_quota=True, p_record_usage=True):
+    limits = _usage_row(db, p_user_id)
+    allowed = not p_enforce_quota or limits["usage_count"] < limits["monthly_quota"]
+    if allowed:
+        limits["usage_count"] += 1
+        if p_record_usage:
+            db.tables["user_usage"].append({"user_id": p_user_id, "request_type": p_request_type, "file_size": p_file_size})
+    return [{"allowed": allowed, "current_usage": limits["usage_count"], "quota": limits["monthly_quota"],
+             "reset_date": limits["usage_reset_date"]}]
+
+
+def _reserve_usage_slots(db, p_user_id, p_request_type, p_file_sizes, p_record_usage=True):
+    limits = _usage_row(db, p_user_id)
+    granted = max(0, min(len(p_file_sizes), limits["monthly_quota"] - limits["usage_count"]))
+    limits["usage_count"] += granted
+    if p_record_usage:
+        db.tables["user_usage"].extend(
+            {"user_id": p_user_id, "request_type": p_request_type, "file_size": size} for size in p_file_sizes[:granted]
+        )
+    return [{"granted": granted, "current_usage": limits["usage_count"], "quota": limits["monthly_quota"],
+             "reset_date": limits["usage_reset_date"]}]
+
+
+def _release_usage_slots(db, p_user_id, p_count=1):
+    limits = next((row for row in db.tables["user_limits"] if row["user_id"] == p_user_id), None)
+    if limits is None:
+        return []
+    limits["usage_count"] = max(0, limits["usage_count"] - max(0, p_count))
+    return [{"current_usage": limits["usage_count"], "quota": limits["monthly_quota"],
+             "reset_date": limits["usage_reset_date"]}]
+
+
+# Field weights standing in for the tsvector's A-D weights
+_SEARCH_WEIGHTS = (("objections", 1.0), ("pain_points", 1.0), ("key_points", 0.4), ("next_steps", 0.4),
+                   ("full_analysis", 0.2), ("transcription", 0.1))
+
+
+def _search_linguistics_results(db, p_user_id, p_query, p_team_id=None, p_limit=20, p_after_rank=None, p_after_id=None):
+    # Crude stand-in for the Postgres RPC: every query word must appear, ranked by weighted hits
+    teams = {row["team_id"] for row in db.tables["repspheres_team_members"] if row["user_id"] == p_user_id}
+    if p_team_id is not None and p_team_id not in teams:
+        raise FakeServiceError(f"Not a member of team {p_team_id}", code="42501")
+    conversations = {row["id"]: row for row in db.tables["repspheres_conversations"]}
+    terms = [term for term in "".join(ch.lower() if ch.isalnum() else " " for ch in p_query).split() if term != "or"]
+    found = []
+    for row in db.tables["repspheres_linguistics_results"]:
+        conversation = conversations.get(row.get("conversation_id"), {})
+        owner, team = conversation.get("user_id"), conversation.get("team_id")
+        if not (team == p_team_id if p_team_id is not None else owner == p_user_id or team in teams):
+            continue
+        texts = [(json.dumps(row.get(field) or "").lower(), weight) for field, weight in _SEARCH_WEIGHTS]
+        if not terms or not all(any(term in text for text, _ in texts) for term in terms):
+            continue
+        score = sum(text.count(term) * weight for term in terms for text, weight in texts)
+        rank = round(score / (score + 1), 6)
+        if p_after_rank is not None and (rank, row["id"]) >= (p_after_rank, p_after_id):
+            continue
+        found.append({
+            "id": row["id"], "conversation_id": row.get("conversation_id"), "user_id": owner, "team_id": team,
+            "title": conversation.get("title"), "file_name": conversation.get("file_name"),
+            "sentiment": row.get("sentiment"), "objections": row.get("objections"), "pain_points": row.get("pain_points"),
+            "created_at": row.get("created_at"), "rank": rank, "headline": (row.get("transcription") or "")[:160],
+        })
+    found.sort(key=lambda result: (result["rank"], result["id"]), reverse=True)
+    return found[:max(1, min(p_limit, 100))]
+
+
+_ROLLUP_NO_TEAM = "00000000-0000-0000-0000-000000000000"
+
+
+_ROLLUP_COUNTS = ("conversations", "duration_seconds", "positive", "neutral", "negative", "objections", "pain_points",
+                  "rep_speaking_percentage_sum", "rep_speaking_samples", "rep_questions", "prospect_questions",
+                  "rep_interruptions")
+
+
+def _apply_conversation_rollups(db, p_conversation_ids, p_durations=None):
+    # Same bookkeeping as the SQL function, minus the participants' talk-time columns
+    applied = []
+    for position, conversation_id in enumerate(p_conversation_ids or []):
+        conversation = next((row for row in db.tables["repspheres_conversations"] if row["id"] == conversation_id), None)
+        if conversation is None or not conversation.get("user_id") or conversation.get("status") != "completed":
+            continue
+        team_id = conversation.get("team_id") or _ROLLUP_NO_TEAM
+        user_id = conversation["user_id"]
+        started = datetime.fromisoformat(str(conversation.get("meeting_date") or conversation.get("created_at") or
+                                             datetime.now(timezone.utc).isoformat()).replace("Z", "+00:00"))
+        week_start = (started.date() - timedelta(days=started.weekday())).isoformat()
+
+        results = [row for row in db.tables["repspheres_linguistics_results"] if row.get("conversation_id") == conversation_id]
+        result = results[-1] if results else {}
+        sentiment = (result.get("sentiment") or "").lower()
+        objections = result.get("objections") if isinstance(result.get("objections"), list) else []
+        pain_points = result.get("pain_points") if isinstance(result.get("pain_points"), list) else []
+        duration = (p_durations[position] if p_durations and p_durations[position] is not None
+                    else conversation.get("duration_seconds") or 0)
+        new = {"conversation_id": conversation_id, "team_id": team_id, "user_id": user_id, "week_start": week_start,
+               **dict.fromkeys(_ROLLUP_COUNTS, 0), "conversations": 1, "duration_seconds": duration,
+               "objections": len(objections), "pain_points": len(pain_points),
+               "objection_keys": sorted({" ".join(str(item).lower().split())[:200] for item in objections} - {""})}
+        for polarity in ("positive", "neutral", "negative"):
+            new[polarity] = int(polarity in sentiment)
+
+        old = next((row for row in db.tables["repspheres_rollup_applied"] if row["conversation_id"] == conversation_id), None)
+        if old == new:
+            continue
+        if old is not None:
+            _add_rollup_contribution(db, old, -1)
+            db.tables["repspheres_rollup_applied"].remove(old)
+        _add_rollup_contribution(db, new, 1)
+        db.tables["repspheres_rollup_applied"].append(new)
+
+        scopes = {f"team:{team_id}", f"user:{user_id}"}
+        if old is not None:
+            scopes |= {f"team:{old['team_id']}", f"user:{old['user_id']}"}
+        for scope in scopes:
+            version = next((row for row in db.tables["repspheres_rollup_versions"] if row["scope"] == scope), None)
+            if version is None:
+                db.tables["repspheres_rollup_versions"].append({"scope": scope, "version": 1})
+            else:
+                version["version"] += 1
+        applied.append({"conversation_id": conversation_id, "team_id": team_id, "user_id": user_id, "week_start": week_start,
+                        "previous_team_id": old and old["team_id"], "previous_user_id": old and old["user_id"]})
+    return applied
+
+
+def _add_rollup_contribution(db, contribution: dict, sign: int):
+    key = (contribution["team_id"], contribution["user_id"], contribution["week_start"])
+    weekly = next((row for row in db.tables["repspheres_rollup_weekly"]
+                   if (row["team_id"], row["user_id"], row["week_start"]) == key), None)
+    if weekly is None:
+        weekly = {"team_id": key[0], "user_id": key[1], "week_start": key[2], **dict.fromkeys(_ROLLUP_COUNTS, 0)}
+        db.tables["repspheres_rollup_weekly"].append(weekly)
+    for column in _ROLLUP_COUNTS:
+        weekly[column] += sign * contribution[column]
+    if weekly["conversations"] <= 0:
+        db.tables["repspheres_rollup_weekly"].remove(weekly)
+
+    # Counted once per conversation, however often it repeats an objection
+    for objection in contribution["objection_keys"]:
+        counted = next((row for row in db.tables["repspheres_rollup_objections"]
+                        if (row["team_id"], row["user_id"], row["week_start"], row["objection"]) == (*key, objection)), None)
+        if counted is None:
+            counted = {"team_id": key[0], "user_id": key[1], "week_start": key[2], "objection": objection, "conversations": 0}
+            db.tables["repspheres_rollup_objections"].append(counted)
+        counted["conversations"] += sign
+        if counted["conversations"] <= 0:
+            db.tables["repspheres_rollup_objections"].remove(counted)
+
+
+class FakeSupabase:
+    """Stand-in for the supabase-py client, backed by in-memory tables."""
+
+    def __init__(self, latency: float = 0.02, error_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tables = defaultdict(list)
+        self.primary_keys = {"user_limits": "user_id", "stripe_customers": "customer_id", "stripe_failed_events": "event_id"}
+        self.rpcs = {
+            "reserve_usage_slot": _reserve_usage_slot,
+            "reserve_usage_slots": _reserve_usage_slots,
+            "release_usage_slots": _release_usage_slots,
+            "search_linguistics_results": _search_linguistics_results,
+            "apply_conversation_rollups": _apply_conversation_rollups,
+        }
+        self.calls = defaultdict(int)
+        self.lock = threading.RLock()
+        self._random = random.Random(seed)
+
+    def _simulate(self, name: str):
+        with self.lock:
+            self.calls[name] += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise FakeServiceError(f"Simulated Supabase failure in {name}")
+
+    def table(self, name: str) -> _Query:
+        return _Query(self, name)
+
+    def rpc(self, name: str, params: dict = None) -> _RPC:
+        return _RPC(self, name, params or {})
+
+    def seed_user(self, user_id: str, customer_id: str = None, tier: str = "pro", usage_count: int = 0,
+                  monthly_quota: int = None):
+        """Add a user_limits row (and a stripe_customers mapping when given)."""
+        self.tables["user_limits"].append({
+            "user_id": user_id,
+            "tier": tier,
+            "monthly_quota": monthly_quota or QUOTA_BY_TIER.get(tier, QUOTA_BY_TIER["free"]),
+            "max_file_size": 100000000,
+            "usage_count": usage_count,
+            "usage_reset_date": (datetime.now(timezone.utc) + timedelta(days=30)).isoformat(),
+        })
+        if customer_id:
+            self.tables["stripe_customers"].append({"customer_id": customer_id, "user_id": user_id})
+
+
+class FakeStripe:
+    """Fakes the Stripe API calls the backend makes and signs webhook payloads.
+
+    Webhooks are signed with the real scheme, so stripe.Webhook.construct_event
+    verifies them exactly as it would in production.
+    """
+
+    def __init__(self, webhook_secret: str, latency: float = 0.15, error_rate: float = 0.0,
+                 products: dict = None, seed: int = None):
+        self.webhook_secret = webhook_secret
+        self.latency = latency
+        self.error_rate = error_rate
+        self.products = products or {"prod_free": "free", "prod_basic": "basic", "prod_pro": "pro"}
+        self.calls = defaultdict(int)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._originals = None
+
+    def retrieve_product(self, product_id: str, *args, **kwargs):
+        with self._lock:
+            self.calls["Product.retrieve"] += 1
+            fail = self.error_rate and self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise FakeServiceError(f"Simulated Stripe failure retrieving {product_id}")
+        return {"id": product_id, "object": "product", "metadata": {"tier": self.products.get(product_id, "free")}}
+
+    def install(self, stripe_module):
+        """Route the SDK's API calls to this fake until uninstall()."""
+        self._originals = (stripe_module, stripe_module.Product.retrieve)
+        stripe_module.Product.retrieve = self.retrieve_product
+
+    def uninstall(self):
+        if self._originals:
+            stripe_module, retrieve = self._originals
+            stripe_module.Product.retrieve = retrieve
+            self._originals = None
+
+    def sign(self, payload: bytes, timestamp: int = None) -> str:
+        timestamp = timestamp or int(time.time())
+        signed = f"{timestamp}.".encode() + payload
+        signature = hmac.new(self.webhook_secret.encode(), signed, hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={signature}"
+
+    def subscription_event(self, customer_id: str, product_id: str, event_type: str = "customer.subscription.updated",
+                           subscription_id: str = None):
+        """Return (payload, signature header) for a signed subscription event."""
+        event = {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {"object": {
+                "id": subscription_id or f"sub_{customer_id}",
+                "object": "subscription",
+                "customer": customer_id,
+                "items": {"object": "list", "data": [{"price": {"product": product_id}}]},
+            }},
+        }
+        payload = json.dumps(event).encode()
+        return payload, self.sign(payload)
+
+
+class FakeStorage:
+    """Stand-in for storage.SupabaseStorage. Uploads are read to the end and discarded."""
+
+    def __init__(self, object_size: int = 5000000, latency: float = 0.01, url: str = "https://storage.fake"):
+        self.object_size_bytes = object_size
+        self.latency = latency
+        self.url = url
+        self.objects = {}
+        self.calls = defaultdict(int)
+
+    async def upload(self, path: str, chunks, content_type: str = "application/octet-stream"):
+        self.calls["upload"] += 1
+        size = 0
+        async for chunk in chunks:
+            size += len(chunk)
+        await asyncio.sleep(self.latency)
+        self.objects[path] = size
+
+    async def delete(self, path: str):
+        self.calls["delete"] += 1
+        self.objects.pop(path, None)
+
+    async def signed_url(self, path: str) -> str:
+        self.calls["signed_url"] += 1
+        return f"{self.url}/{path}?token=fake"
+
+    def owns(self, url: str) -> bool:
+        return url.startswith(f"{self.url}/")
+
+    async def object_size(self, url: str):
+        self.calls["object_size"] += 1
+        await asyncio.sleep(self.latency)
+        return self.object_size_bytes
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,174 @@
+"""
+In-process background job queue and worker pool for the audio pipeline.
+
+Jobs are kept in memory so their progress can be reported through
+GET /jobs/{id} while a fixed number of workers drain the per-tier queues.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+
+class Job(BaseModel):
+    id: str
+    user_id: str
+    status: str = "queued"  # 'queued', 'running', 'completed', 'failed'
+    stage: str = "queued"
+    progress: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    request_id: Optional[str] = None  # id of the HTTP request that queued the job
+    created_at: datetime = None
+    updated_at: datetime = None
+
+    def set_stage(self, stage: str, progress: int = None):
+        """Record the pipeline stage the job is currently in."""
+        self.stage = stage
+        if progress is not None:
+            self.progress = progress
+        self.updated_at = datetime.now()
+
+
+class JobQueue:
+    """A bounded pool of asyncio workers running queued pipeline jobs.
+
+    Each subscription tier has its own FIFO queue. A free worker takes the
+    next job from the highest-priority tier that is under its limit of
+    running jobs, so paid jobs don't wait behind a backlog of free ones and
+    a single tier can't occupy every worker. Unknown tiers share the last
+    tier's queue.
+    """
+
+    def __init__(self, concurrency: int = 4, max_jobs: int = 10000,
+                 tier_priority: tuple = ("pro", "basic", "free"), tier_limits: dict = None):
+        self.concurrency = max(1, concurrency)
+        self.max_jobs = max_jobs
+        self.tier_priority = tuple(tier_priority)
+        # Most workers a tier's jobs may hold at once; tiers not listed may use them all
+        self.tier_limits = dict(tier_limits or {})
+        self.jobs = OrderedDict()
+        self._queues = {tier: deque() for tier in self.tier_priority}
+        self._running = {tier: 0 for tier in self.tier_priority}
+        self._unfinished = 0
+        self._changed = None
+        self._drained = None
+        self._workers = []
+
+    async def start(self):
+        if self._workers:
+            return
+        self._changed = asyncio.Event()
+        self._drained = asyncio.Event()
+        if not self._unfinished:
+            self._drained.set()
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout: float = 30.0):
+        """Let in-flight jobs finish (up to `timeout` seconds), then stop the workers.
+
+        Returns the (job, handler, args) entries that never started, so the
+        caller can clean up after them; their jobs are marked as failed.
+        """
+        if not self._workers:
+            return []
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Job queue did not drain within {timeout}s, cancelling workers")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        dropped = []
+        for queue in self._queues.values():
+            while queue:
+                job, handler, args = queue.popleft()
+                job.status = "failed"
+                job.error = "Job dropped during shutdown"
+                job.updated_at = datetime.now()
+                dropped.append((job, handler, args))
+                self._finished()
+        return dropped
+
+    def enqueue(self, user_id: str, handler, *args, request_id: str = None, tier: str = None) -> Job:
+        """Queue `handler(job, *args)` on `tier`'s queue and return the job tracking it."""
+        if self._changed is None:
+            raise RuntimeError("Job queue has not been started")
+        now = datetime.now()
+        job = Job(id=str(uuid.uuid4()), user_id=user_id, request_id=request_id, created_at=now, updated_at=now)
+        self.jobs[job.id] = job
+        self._prune()
+        self._queues[self._tier(tier)].append((job, handler, args))
+        self._unfinished += 1
+        self._drained.clear()
+        self._changed.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _tier(self, tier: str) -> str:
+        return tier if tier in self._queues else self.tier_priority[-1]
+
+    def _prune(self):
+        # Drop the oldest finished jobs once we hold more than max_jobs
+        if len(self.jobs) <= self.max_jobs:
+            return
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].status in ("completed", "failed"):
+                del self.jobs[job_id]
+
+    def _take(self):
+        """Pop the next runnable job, highest-priority tier first; None if there is none."""
+        for tier in self.tier_priority:
+            queue = self._queues[tier]
+            if queue and self._running[tier] < self.tier_limits.get(tier, self.concurrency):
+                self._running[tier] += 1
+                return tier, queue.popleft()
+        return None
+
+    def _finished(self):
+        self._unfinished -= 1
+        if not self._unfinished:
+            self._drained.set()
+
+    async def _worker(self, worker_id: int):
+        while True:
+            taken = self._take()
+            if taken is None:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            tier, (job, handler, args) = taken
+            try:
+                job.status = "running"
+                job.updated_at = datetime.now()
+                job.result = await handler(job, *args)
+                job.status = "completed"
+                job.set_stage("completed", 100)
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.error = "Job cancelled during shutdown"
+                raise
+            except Exception as e:
+                print(f"Job {job.id} failed in stage {job.stage}: {str(e)}")
+                job.status = "failed"
+                job.error = str(e)
+                job.updated_at = datetime.now()
+            finally:
+                self._running[tier] -= 1
+                self._finished()
+                # A tier slot was freed, so a job held back by its limit may now run
+                self._changed.set()
@@ -0,0 +1,270 @@
+"""
+Offline load test of the API against in-process fakes of Supabase, OpenAI
+and Stripe (see fakes.py). No live vendor is contacted.
+
+Each scenario is driven at every --concurrency level by that many clients
+issuing requests back to back, through httpx's ASGI transport (no sockets).
+Per level, the run reports requests per second, p50/p95/p99/max latency and
+the status codes seen. /webhook levels also report how long the queued jobs
+took to finish. Results are written as JSON so runs can be compared between
+commits with --baseline.
+
+Usage:
+    python loadtest.py --concurrency 1 --concurrency 16 --concurrency 64 --requests 500
+    python loadtest.py --scenario usage --supabase-latency 0.05 --output usage.json
+    python loadtest.py --baseline loadtest-results.json --output after.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+SCENARIOS = ("usage", "webhook", "stripe")
+
+JWT_SECRET = "loadtest-jwt-secret-loadtest-jwt-secret"
+STRIPE_WEBHOOK_SECRET = "whsec_loadtest"
+
+
+def configure_environment(args):
+    # Must run before backend_implementation is imported, which reads its config at import time
+    os.environ.update({
+        "SUPABASE_URL": "http://supabase.fake",
+        "SUPABASE_KEY": "fake",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "STRIPE_SECRET_KEY": "sk_test_fake",
+        "STRIPE_WEBHOOK_SECRET": STRIPE_WEBHOOK_SECRET,
+        "OPENAI_API_KEY": "fake",
+        "TRANSCRIPT_CACHE_DIR": "",
+        "WORKER_CONCURRENCY": str(args.workers),
+        "SLOW_STAGE_SECONDS": "3600",
+        "WARM_CLIENTS": "false",  # the fakes have no connections to open
+    })
+    if not args.admission:
+        # Measure the pipeline itself, not the admission buckets
+        os.environ["ADMISSION_ENABLED"] = "false"
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return None
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(q / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Harness:
+    def __init__(self, args):
+        import jwt
+        import backend_implementation as backend
+        from fakes import FakeSupabase, FakeStripe, FakeStorage
+        from openai_client import FakeOpenAIBackend
+
+        self.args = args
+        self.backend = backend
+        self.supabase = FakeSupabase(latency=args.supabase_latency, error_rate=args.supabase_error_rate, seed=args.seed)
+        self.stripe = FakeStripe(STRIPE_WEBHOOK_SECRET, latency=args.stripe_latency, error_rate=args.stripe_error_rate, seed=args.seed)
+        self.openai = FakeOpenAIBackend(
+            transcribe_latency=args.openai_latency,
+            transcribe_latency_per_mb=0,
+            chat_latency=args.openai_latency,
+            fetch_latency=0.01,
+            error_rate=args.openai_error_rate,
+            rate_limit_rate=args.openai_429_rate,
+            audio_size=1000,
+            seed=args.seed
+        )
+        self.storage = FakeStorage(latency=args.storage_latency)
+        backend.supabase.override(self.supabase)
+        backend.audio_storage = self.storage
+        backend.openai_client.backend = self.openai
+        self.stripe.install(backend.stripe)
+
+        expires = int(time.time()) + 24 * 3600
+        self.users = []
+        for i in range(args.users):
+            user_id = f"loadtest-user-{i}"
+            customer_id = f"cus_loadtest_{i}"
+            self.supabase.seed_user(user_id, customer_id, tier="pro", monthly_quota=10 ** 9)
+            token = jwt.encode({"sub": user_id, "aud": "authenticated", "exp": expires}, JWT_SECRET, algorithm="HS256")
+            self.users.append((user_id, customer_id, {"Authorization": f"Bearer {token}"}))
+
+    async def request(self, client, scenario: str, i: int) -> int:
+        user_id, customer_id, headers = self.users[i % len(self.users)]
+        if scenario == "usage":
+            response = await client.get("/user/usage", headers=headers)
+        elif scenario == "webhook":
+            # Distinct filenames; the fake serves identical audio, so the transcript cache still applies
+            response = await client.post("/webhook", json={"filename": f"https://storage.fake/audio/{i}.mp3"}, headers=headers)
+        else:
+            payload, signature = self.stripe.subscription_event(customer_id, "prod_pro")
+            response = await client.post("/stripe-webhook", content=payload, headers={"stripe-signature": signature})
+        return response.status_code
+
+    def unfinished_jobs(self) -> int:
+        return sum(1 for job in self.backend.job_queue.jobs.values() if job.status in ("queued", "running"))
+
+    async def wait_for_background_work(self, timeout: float) -> float:
+        start = time.perf_counter()
+        while self.unfinished_jobs() or self.backend.stripe_processor.pending():
+            if time.perf_counter() - start > timeout:
+                print(f"Background work still pending after {timeout}s")
+                break
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+
+    async def run_level(self, client, scenario: str, concurrency: int, total: int) -> dict:
+        latencies = []
+        statuses = Counter()
+        indexes = iter(range(total))
+
+        async def worker():
+            for i in indexes:
+                start = time.perf_counter()
+                try:
+                    status = await self.request(client, scenario, i)
+                except Exception as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[str(status)] += 1
+
+        # The pipeline logs every request; keep that out of the report unless asked for
+        with contextlib.redirect_stdout(sys.stdout if self.args.verbose else io.StringIO()):
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+            drain = await self.wait_for_background_work(self.args.drain_timeout)
+
+        latencies.sort()
+        ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+        result = {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": total,
+            "errors": total - ok,
+            "status_codes": dict(statuses),
+            "seconds": round(elapsed, 4),
+            "rps": round(total / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+            "background_drain_seconds": round(drain, 4),
+        }
+        if scenario == "webhook":
+            result["jobs_per_second"] = round(total / (elapsed + drain), 2)
+        return result
+
+    async def run(self) -> list:
+        import httpx
+        app = self.backend.app
+        for handler in app.router.on_startup:
+            await handler()
+        results = []
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                for scenario in self.args.scenario or SCENARIOS:
+                    # Warm the caches so every level measures steady state
+                    await self.run_level(client, scenario, min(len(self.users), 32), len(self.users))
+                    for concurrency in self.args.concurrency or [1, 16, 64]:
+                        result = await self.run_level(client, scenario, concurrency, self.args.requests)
+                        print_result(result)
+                        results.append(result)
+        finally:
+            for handler in app.router.on_shutdown:
+                await handler()
+            self.stripe.uninstall()
+        return results
+
+
+def print_header():
+    print(f"{'scenario':<9} {'conc':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+
+
+def print_result(result: dict):
+    print(f"{result['scenario']:<9} {result['concurrency']:>5} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+          f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['max_ms']:>9.2f} {result['errors']:>7}")
+
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    print(f"{'scenario':<9} {'conc':>5} {'rps':>9} {'p95':>9} {'p99':>9}")
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"]))
+        if not before:
+            continue
+        change = lambda key: f"{(result[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else "n/a"
+        print(f"{result['scenario']:<9} {result['concurrency']:>5} {change('rps'):>9} {change('p95_ms'):>9} {change('p99_ms'):>9}")
+
+
+def main(args):
+    configure_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    harness = Harness(args)
+    print_header()
+    results = asyncio.run(harness.run())
+
+    report = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "fake_calls": {
+            "supabase": dict(harness.supabase.calls),
+            "stripe": dict(harness.stripe.calls),
+            "openai": dict(harness.openai.calls),
+            "storage": dict(harness.storage.calls),
+        },
+        "admission": harness.backend.admission.stats(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append", help="scenario to run (repeatable, default all)")
+    parser.add_argument("--concurrency", type=int, action="append", help="concurrent clients (repeatable, default 1, 16, 64)")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario and concurrency level")
+    parser.add_argument("--users", type=int, default=100, help="distinct users the requests are spread over")
+    parser.add_argument("--workers", type=int, default=8, help="job queue workers (WORKER_CONCURRENCY)")
+    parser.add_argument("--supabase-latency", type=float, default=0.02, help="seconds per fake Supabase call")
+    parser.add_argument("--supabase-error-rate", type=float, default=0.0)
+    parser.add_argument("--stripe-latency", type=float, default=0.15, help="seconds per fake Stripe API call")
+    parser.add_argument("--stripe-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=0.2, help="seconds per fake Whisper/GPT-4 call")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-429-rate", type=float, default=0.0, help="share of fake OpenAI calls answered with 429")
+    parser.add_argument("--storage-latency", type=float, default=0.01, help="seconds per fake storage HEAD/upload")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="max seconds to wait for queued jobs after a level")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="loadtest-results.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on (429s count as errors)")
+    parser.add_argument("--verbose", action="store_true", help="show the backend's own log output")
+    main(parser.parse_args())
@@ -0,0 +1,270 @@
+"""
+Lightweight in-process metrics served in the Prometheus text format.
+
+Counters and histograms are plain dicts behind a lock, so recording a sample
+costs a couple of perf_counter() calls and a bisect. Values that already
+live elsewhere (cache stats, queue depths) are exposed through callback
+metrics that are only evaluated when /metrics is scraped.
+
+MetricsMiddleware assigns every HTTP request an id (taken from X-Request-ID
+when the client sends one). The id is kept in a contextvar, so the stage
+timers and log lines further down can read it with current_request_id().
+"""
+
+import asyncio
+import bisect
+import contextvars
+import functools
+import threading
+import time
+import uuid
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# Raised when a caller goes away, not when the stage itself fails
+_NOT_FAILURES = (asyncio.CancelledError, GeneratorExit)
+
+
+def current_request_id():
+    return request_id_var.get()
+
+
+def set_request_id(request_id: str):
+    request_id_var.set(request_id)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labelvalues) -> int:
+        state = self._values.get(labelvalues)
+        return state[2] if state else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            values = [(labelvalues, list(state[0]), state[1], state[2]) for labelvalues, state in self._values.items()]
+        for labelvalues, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labelvalues)} {count}"
+
+
+class CallbackMetric:
+    """A counter or gauge whose samples come from `collect()` at scrape time.
+
+    `collect` returns {labelvalues tuple: value}.
+    """
+
+    def __init__(self, name: str, help: str, collect, labelnames=(), type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        try:
+            values = self.collect()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {str(e)}")
+            return
+        for labelvalues, value in values.items():
+            yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, collect, labelnames=(), type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, collect, labelnames, type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class timed:
+    """Record the duration of a block or function in `histogram`.
+
+    Works as a context manager (`with timed(h, errors, "whisper"):`) and as a
+    decorator for sync and async functions. Exceptions are counted in
+    `errors` under the same labels. Samples slower than `slow_seconds` are
+    logged with the current request id.
+    """
+
+    __slots__ = ("histogram", "errors", "labelvalues", "slow_seconds", "_start")
+
+    def __init__(self, histogram: Histogram, errors: Counter = None, *labelvalues, slow_seconds: float = None):
+        self.histogram = histogram
+        self.errors = errors
+        self.labelvalues = labelvalues
+        self.slow_seconds = slow_seconds
+
+    def record(self, elapsed: float, failed: bool = False):
+        self.histogram.observe(elapsed, *self.labelvalues)
+        if failed and self.errors is not None:
+            self.errors.inc(*self.labelvalues)
+        if self.slow_seconds is not None and elapsed >= self.slow_seconds:
+            label = "/".join(str(value) for value in self.labelvalues) or self.histogram.name
+            print(f"[{current_request_id()}] Slow stage {label}: {elapsed:.2f}s")
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        failed = exc_type is not None and not issubclass(exc_type, _NOT_FAILURES)
+        self.record(time.perf_counter() - self._start, failed)
+        return False
+
+    def __call__(self, fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return await fn(*args, **kwargs)
+                except BaseException as e:
+                    failed = not isinstance(e, _NOT_FAILURES)
+                    raise
+                finally:
+                    self.record(time.perf_counter() - start, failed)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                failed = not isinstance(e, _NOT_FAILURES)
+                raise
+            finally:
+                self.record(time.perf_counter() - start, failed)
+        return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times requests and propagates X-Request-ID."""
+
+    def __init__(self, app, requests_total: Counter, request_seconds: Histogram, header: str = "x-request-id"):
+        self.app = app
+        self.requests_total = requests_total
+        self.request_seconds = request_seconds
+        self.header = header.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == self.header:
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # The router stores the matched route in the scope; label by template to bound cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.request_seconds.observe(time.perf_counter() - start, scope["method"], route)
+            self.requests_total.inc(scope["method"], route, str(status))
+            request_id_var.reset(token)
@@ -0,0 +1,380 @@
+"""
+Non-blocking OpenAI access layer.
+
+All Whisper/GPT-4 traffic goes through a single OpenAIClient, which shares a
+keep-alive connection pool, applies timeouts, retries transient failures with
+jittered exponential backoff and caps concurrency per subscription tier so
+paying users are never queued behind free users.
+
+The transport is pluggable: HTTPOpenAIBackend talks to the real API, while
+FakeOpenAIBackend simulates latency and failures for offline benchmarks.
+"""
+
+import asyncio
+import json
+import os
+import random
+
+import httpx
+
+
+class OpenAIError(Exception):
+    def __init__(self, message: str, status_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # Network errors and timeouts carry no status code
+        return self.status_code is None or self.status_code in (408, 409, 429) or self.status_code >= 500
+
+
+class AudioTooLarge(OpenAIError):
+    """The audio download passed its byte limit; never retried."""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Audio exceeds the maximum size of {limit} bytes", status_code=413)
+        self.limit = limit
+
+
+def _parse_retry_after(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class HTTPOpenAIBackend:
+    """Talks to the OpenAI REST API over a shared httpx connection pool."""
+
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1",
+                 timeout: float = 120.0, connect_timeout: float = 10.0,
+                 max_connections: int = 50, max_keepalive: int = 20):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.TimeoutException as e:
+            raise OpenAIError(f"Request to {url} timed out: {str(e)}")
+        except httpx.TransportError as e:
+            raise OpenAIError(f"Request to {url} failed: {str(e)}")
+        if response.status_code >= 400:
+            raise OpenAIError(
+                f"{method} {url} returned {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+                retry_after=_parse_retry_after(response.headers.get("retry-after")),
+            )
+        return response
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def ping(self):
+        """Cheapest authenticated call; opens a pooled connection as a side effect."""
+        await self._request("GET", f"{self.base_url}/models", headers=self._headers())
+
+    async def fetch_audio(self, url: str, max_bytes: int = None) -> bytes:
+        """Download audio over the shared keep-alive pool, aborting once it passes `max_bytes`.
+
+        Redirects are not followed, so the download can't be bounced to another host.
+        """
+        try:
+            async with self.client.stream("GET", url, follow_redirects=False) as response:
+                if response.status_code >= 300:
+                    body = await response.aread()
+                    raise OpenAIError(
+                        f"GET {url} returned {response.status_code}: {body[:200].decode(errors='replace')}",
+                        status_code=response.status_code,
+                        retry_after=_parse_retry_after(response.headers.get("retry-after")),
+                    )
+                audio = bytearray()
+                async for chunk in response.aiter_bytes():
+                    audio.extend(chunk)
+                    if max_bytes is not None and len(audio) > max_bytes:
+                        raise AudioTooLarge(max_bytes)
+                return bytes(audio)
+        except httpx.TimeoutException as e:
+            raise OpenAIError(f"Request to {url} timed out: {str(e)}")
+        except httpx.TransportError as e:
+            raise OpenAIError(f"Request to {url} failed: {str(e)}")
+
+    async def transcribe(self, audio: bytes, filename: str, model: str = "whisper-1",
+                         response_format: str = "text"):
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/audio/transcriptions",
+            headers=self._headers(),
+            files={"file": (filename, audio)},
+            data={"model": model, "response_format": response_format},
+        )
+        return response.text if response_format == "text" else response.json()
+
+    async def chat(self, messages: list, model: str = "gpt-4", **kwargs) -> str:
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            headers=self._headers(),
+            json={"model": model, "messages": messages, **kwargs},
+        )
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def chat_stream(self, messages: list, model: str = "gpt-4", **kwargs):
+        """Yield completion tokens as the API streams them back."""
+        url = f"{self.base_url}/chat/completions"
+        try:
+            async with self.client.stream(
+                "POST",
+                url,
+                headers=self._headers(),
+                json={"model": model, "messages": messages, "stream": True, **kwargs},
+            ) as response:
+                if response.status_code >= 400:
+                    body = await response.aread()
+                    raise OpenAIError(
+                        f"POST {url} returned {response.status_code}: {body[:200].decode(errors='replace')}",
+                        status_code=response.status_code,
+                        retry_after=_parse_retry_after(response.headers.get("retry-after")),
+                    )
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    choices = json.loads(data).get("choices") or [{}]
+                    token = choices[0].get("delta", {}).get("content")
+                    if token:
+                        yield token
+        except httpx.TimeoutException as e:
+            raise OpenAIError(f"Request to {url} timed out: {str(e)}")
+        except httpx.TransportError as e:
+            raise OpenAIError(f"Request to {url} failed: {str(e)}")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeOpenAIBackend:
+    """In-process stand-in for the OpenAI API with configurable latency and error rate."""
+
+    def __init__(self, transcribe_latency: float = 2.0, transcribe_latency_per_mb: float = 0.5,
+                 chat_latency: float = 5.0, first_token_latency: float = 0.5,
+                 token_latency: float = 0.02, fetch_latency: float = 0.05, error_rate: float = 0.0,
+                 audio_size: int = 5000000, audio_bytes_per_second: int = 16000,
+                 transcript: str = None, analysis: str = None, seed: int = None,
+                 rate_limit_rate: float = 0.0, retry_after: float = None):
+        self.transcribe_latency = transcribe_latency
+        self.transcribe_latency_per_mb = transcribe_latency_per_mb
+        self.chat_latency = chat_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.fetch_latency = fetch_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.audio_size = audio_size
+        self.audio_bytes_per_second = audio_bytes_per_second
+        self.transcript = transcript or "Rep: Thanks for taking the time today. Doctor: Happy to, but pricing is a concern."
+        self.analysis = analysis or (
+            "1. Key points discussed\n"
+            "- Key point: Practice is evaluating new injectables\n"
+            "2. Customer pain points\n"
+            "- Pain point: Long patient wait times\n"
+            "3. Objections raised\n"
+            "- Objection: Price is above current supplier\n"
+            "4. Next steps\n"
+            "- Next step: Send ROI breakdown by Friday\n"
+            "5. Overall sentiment: Positive"
+        )
+        self.calls = {"fetch_audio": 0, "transcribe": 0, "chat": 0}
+        self._random = random.Random(seed)
+
+    async def _simulate(self, name: str, latency: float):
+        self.calls[name] += 1
+        await asyncio.sleep(latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise OpenAIError(f"Simulated {name} failure", status_code=503)
+        if name != "fetch_audio" and self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            raise OpenAIError(f"Simulated {name} rate limit", status_code=429, retry_after=self.retry_after)
+
+    async def ping(self):
+        pass
+
+    async def fetch_audio(self, url: str, max_bytes: int = None) -> bytes:
+        await self._simulate("fetch_audio", self.fetch_latency)
+        if max_bytes is not None and self.audio_size > max_bytes:
+            raise AudioTooLarge(max_bytes)
+        return b"\0" * self.audio_size
+
+    async def transcribe(self, audio: bytes, filename: str, model: str = "whisper-1",
+                         response_format: str = "text"):
+        latency = self.transcribe_latency + self.transcribe_latency_per_mb * len(audio) / 1000000
+        await self._simulate("transcribe", latency)
+        if response_format != "verbose_json":
+            return self.transcript
+        # Spread the transcript's sentences evenly over the audio's estimated duration
+        duration = len(audio) / self.audio_bytes_per_second
+        sentences = [sentence.strip() + "." for sentence in self.transcript.split(".") if sentence.strip()]
+        step = duration / len(sentences)
+        return {
+            "text": self.transcript,
+            "duration": duration,
+            "segments": [
+                {"start": i * step, "end": (i + 1) * step, "text": sentence}
+                for i, sentence in enumerate(sentences)
+            ],
+        }
+
+    async def chat(self, messages: list, model: str = "gpt-4", **kwargs) -> str:
+        await self._simulate("chat", self.chat_latency)
+        return self.analysis
+
+    async def chat_stream(self, messages: list, model: str = "gpt-4", **kwargs):
+        await self._simulate("chat", self.first_token_latency)
+        # Roughly one token per four characters
+        for i in range(0, len(self.analysis), 4):
+            await asyncio.sleep(self.token_latency)
+            yield self.analysis[i:i + 4]
+
+    async def aclose(self):
+        pass
+
+
+# Default concurrent OpenAI calls allowed per subscription tier
+DEFAULT_TIER_CONCURRENCY = {"free": 2, "basic": 4, "pro": 8}
+
+
+def tier_concurrency_from_env():
+    return {
+        tier: int(os.environ.get(f"OPENAI_CONCURRENCY_{tier.upper()}", default))
+        for tier, default in DEFAULT_TIER_CONCURRENCY.items()
+    }
+
+
+class OpenAIClient:
+    """Retries, backoff and per-tier concurrency caps on top of a backend."""
+
+    def __init__(self, backend, tier_concurrency: dict = None, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, on_rate_limited=None, on_success=None):
+        self.backend = backend
+        self.tier_concurrency = dict(tier_concurrency or DEFAULT_TIER_CONCURRENCY)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Optional callbacks for upstream 429s (called with Retry-After) and successful calls
+        self.on_rate_limited = on_rate_limited
+        self.on_success = on_success
+        self._semaphores = {}
+        self._in_flight = {}
+
+    def _semaphore(self, tier: str) -> asyncio.Semaphore:
+        if tier not in self._semaphores:
+            self._semaphores[tier] = asyncio.Semaphore(self.tier_concurrency[tier])
+        return self._semaphores[tier]
+
+    def _backoff(self, attempt: int, error: OpenAIError) -> float:
+        if error.retry_after is not None:
+            return min(error.retry_after, self.backoff_max)
+        # Full jitter: spread retries out so concurrent callers don't stampede
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _observe(self, operation: str, error: OpenAIError = None):
+        # Storage downloads don't touch the OpenAI rate limit
+        if operation == "fetch_audio":
+            return
+        if error is None:
+            if self.on_success:
+                self.on_success()
+        elif error.status_code == 429 and self.on_rate_limited:
+            self.on_rate_limited(error.retry_after)
+
+    async def _with_retries(self, operation: str, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                result = await getattr(self.backend, operation)(*args, **kwargs)
+                self._observe(operation)
+                return result
+            except OpenAIError as e:
+                self._observe(operation, e)
+                if not e.retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"OpenAI {operation} failed ({str(e)}), retrying in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _call(self, tier: str, operation: str, *args, **kwargs):
+        # Unknown tiers share the free tier's limit
+        if tier not in self.tier_concurrency:
+            tier = "free"
+        async with self._semaphore(tier):
+            self._in_flight[tier] = self._in_flight.get(tier, 0) + 1
+            try:
+                return await self._with_retries(operation, *args, **kwargs)
+            finally:
+                self._in_flight[tier] -= 1
+
+    async def ping(self):
+        """Check the API is reachable (and warm the connection pool); no retries."""
+        await self.backend.ping()
+
+    async def fetch_audio(self, url: str, max_bytes: int = None) -> bytes:
+        # Storage downloads are not OpenAI calls, so they don't count against the tier caps
+        return await self._with_retries("fetch_audio", url, max_bytes=max_bytes)
+
+    async def transcribe(self, audio: bytes, filename: str, tier: str = "free", **kwargs):
+        return await self._call(tier, "transcribe", audio, filename, **kwargs)
+
+    async def chat(self, messages: list, tier: str = "free", **kwargs) -> str:
+        return await self._call(tier, "chat", messages, **kwargs)
+
+    async def chat_stream(self, messages: list, tier: str = "free", **kwargs):
+        """Yield completion tokens; the tier slot is held until the stream ends."""
+        if tier not in self.tier_concurrency:
+            tier = "free"
+        async with self._semaphore(tier):
+            self._in_flight[tier] = self._in_flight.get(tier, 0) + 1
+            try:
+                attempt = 0
+                while True:
+                    started = False
+                    try:
+                        async for token in self.backend.chat_stream(messages, **kwargs):
+                            if not started:
+                                self._observe("chat_stream")
+                            started = True
+                            yield token
+                        return
+                    except OpenAIError as e:
+                        self._observe("chat_stream", e)
+                        # Tokens already forwarded can't be taken back, so only retry before the first one
+                        if started or not e.retryable or attempt >= self.max_retries:
+                            raise
+                        delay = self._backoff(attempt, e)
+                        print(f"OpenAI chat_stream failed ({str(e)}), retrying in {delay:.2f}s")
+                        attempt += 1
+                        await asyncio.sleep(delay)
+            finally:
+                self._in_flight[tier] -= 1
+
+    def stats(self) -> dict:
+        """Calls currently in flight per tier."""
+        return dict(self._in_flight)
+
+    async def aclose(self):
+        await self.backend.aclose()
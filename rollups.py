@@ -0,0 +1,131 @@
+"""
+Team analytics rollups: weekly aggregates per team and rep.
+
+The aggregates are kept in Postgres and updated by the
+apply_conversation_rollups RPC (see supabase_schema.sql), which the
+pipeline calls as each conversation completes; backfill_rollups.py counts
+conversations from before that. Each team or user scope also has a version
+number that every update bumps.
+
+Reads are keyed on that version. The ETag is derived from it, so a
+dashboard poll whose ETag still matches costs one cached version lookup and
+gets a 304, and a built response is reused until the version moves.
+Versions are cached for `version_ttl` seconds, which bounds how stale
+another worker's view can be.
+"""
+
+import hashlib
+from datetime import date, datetime, timedelta, timezone
+
+from cache import TTLCache
+
+# Rollup team_id of conversations that don't belong to a team
+NO_TEAM = "00000000-0000-0000-0000-000000000000"
+
+_COUNTS = ("conversations", "duration_seconds", "positive", "neutral", "negative", "objections", "pain_points",
+           "rep_speaking_percentage_sum", "rep_speaking_samples", "rep_questions", "prospect_questions",
+           "rep_interruptions")
+
+
+def team_scope(team_id: str) -> str:
+    return f"team:{team_id}"
+
+
+def user_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def first_week(weeks: int, today: date = None) -> date:
+    """Monday of the earliest of the last `weeks` weeks (the current one included)."""
+    today = today or datetime.now(timezone.utc).date()
+    return today - timedelta(days=today.weekday(), weeks=max(1, weeks) - 1)
+
+
+def summarize(counts: dict) -> dict:
+    """Add averages to a row of summed counts."""
+    conversations = counts.get("conversations") or 0
+    samples = counts.get("rep_speaking_samples") or 0
+    return {
+        **counts,
+        "avg_rep_speaking_percentage": round(counts["rep_speaking_percentage_sum"] / samples, 1) if samples else None,
+        "avg_rep_questions": round(counts["rep_questions"] / conversations, 2) if conversations else None,
+        "avg_duration_seconds": round(counts["duration_seconds"] / conversations) if conversations else None,
+        "objections_per_conversation": round(counts["objections"] / conversations, 2) if conversations else None,
+    }
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for it)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in (strip(tag) for tag in if_none_match.split(","))
+
+
+class RollupService:
+    """Applies and reads rollups with a (sync) Supabase client."""
+
+    def __init__(self, client, version_ttl: float = 5.0, cache_size: int = 1000):
+        self.client = client
+        self.versions = TTLCache(maxsize=cache_size, ttl=version_ttl)
+        # Keyed by ETag, which changes with the version, so entries never go stale
+        self.responses = TTLCache(maxsize=cache_size, ttl=None)
+
+    def apply(self, conversation_ids: list, durations: list = None) -> list:
+        """Count completed conversations, replacing the numbers of re-analyzed ones.
+
+        Returns the conversations whose contribution changed; unchanged ones are skipped.
+        """
+        params = {"p_conversation_ids": conversation_ids, "p_durations": durations}
+        applied = self.client.rpc("apply_conversation_rollups", params).execute().data or []
+        for row in applied:
+            self.versions.invalidate(team_scope(row["team_id"]))
+            self.versions.invalidate(user_scope(row["user_id"]))
+            # A re-analyzed conversation may have been counted under another team or rep
+            if row.get("previous_team_id"):
+                self.versions.invalidate(team_scope(row["previous_team_id"]))
+            if row.get("previous_user_id"):
+                self.versions.invalidate(user_scope(row["previous_user_id"]))
+        return applied
+
+    def version(self, scope: str) -> int:
+        version = self.versions.get(scope)
+        if version is None:
+            response = self.client.table("repspheres_rollup_versions").select("version").eq("scope", scope).limit(1).execute()
+            version = response.data[0]["version"] if response.data else 0
+            self.versions.set(scope, version)
+        return version
+
+    def etag(self, scope: str, version: int, *params) -> str:
+        digest = hashlib.sha256("|".join(str(part) for part in (scope, version, *params)).encode()).hexdigest()
+        return f'W/"{version}-{digest[:16]}"'
+
+    def _rows(self, table: str, scope: str, since: date) -> list:
+        kind, scope_id = scope.split(":", 1)
+        query = self.client.table(table).select("*").eq("team_id" if kind == "team" else "user_id", scope_id)
+        return query.gte("week_start", since.isoformat()).execute().data or []
+
+    def weekly(self, scope: str, since: date) -> dict:
+        """Per-rep rows and per-week totals from `since` on."""
+        rows = sorted(self._rows("repspheres_rollup_weekly", scope, since), key=lambda row: (row["week_start"], row["user_id"]))
+        weeks = {}
+        for row in rows:
+            totals = weeks.setdefault(row["week_start"], dict.fromkeys(_COUNTS, 0))
+            for field in _COUNTS:
+                totals[field] += row[field] or 0
+        return {
+            "by_rep": [summarize({field: row[field] for field in ("team_id", "user_id", "week_start", *_COUNTS)}) for row in rows],
+            "by_week": [summarize({"week_start": week, **totals}) for week, totals in weeks.items()],
+        }
+
+    def top_objections(self, scope: str, since: date, limit: int = 20) -> list:
+        """Most frequent objections from `since` on, with the number of conversations and reps raising each."""
+        totals = {}
+        for row in self._rows("repspheres_rollup_objections", scope, since):
+            entry = totals.setdefault(row["objection"], {"objection": row["objection"], "conversations": 0, "reps": set()})
+            entry["conversations"] += row["conversations"]
+            entry["reps"].add(row["user_id"])
+        ranked = sorted(totals.values(), key=lambda entry: (-entry["conversations"], entry["objection"]))[:limit]
+        return [{**entry, "reps": len(entry["reps"])} for entry in ranked]
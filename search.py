@@ -0,0 +1,79 @@
+"""
+Full-text search over stored transcripts and analyses.
+
+The index lives in Postgres: repspheres_linguistics_results has a generated,
+weighted tsvector column with a GIN index, so each result the pipeline
+stores is searchable as soon as its insert commits. Ranking, user/team
+scoping and keyset pagination happen in the search_linguistics_results RPC
+(see supabase_schema.sql). This module validates input, calls the RPC and
+turns the last row of a page into an opaque cursor for the next one.
+"""
+
+import base64
+import json
+
+MAX_QUERY_LENGTH = 200
+MAX_PAGE_SIZE = 50
+
+
+class SearchError(ValueError):
+    pass
+
+
+class NotTeamMember(SearchError):
+    pass
+
+
+def encode_cursor(rank: float, result_id: str) -> str:
+    raw = json.dumps([rank, result_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return (rank, id) from a cursor made by encode_cursor."""
+    try:
+        rank, result_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rank), str(result_id)
+    except Exception:
+        raise SearchError("Invalid cursor")
+
+
+def normalize_query(query: str) -> str:
+    query = " ".join((query or "").split())
+    if not query:
+        raise SearchError("Search query is empty")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise SearchError(f"Search query is longer than {MAX_QUERY_LENGTH} characters")
+    return query
+
+
+def search_params(user_id: str, query: str, team_id: str = None, limit: int = 20, cursor: str = None) -> dict:
+    """Validate a search request and build the RPC's parameters; raises SearchError."""
+    params = {
+        "p_user_id": user_id,
+        "p_query": normalize_query(query),
+        "p_team_id": team_id,
+        "p_limit": max(1, min(limit, MAX_PAGE_SIZE)),
+    }
+    if cursor:
+        params["p_after_rank"], params["p_after_id"] = decode_cursor(cursor)
+    return params
+
+
+def search_results(client, params: dict) -> dict:
+    """Run one page of a search with a (sync) Supabase client.
+
+    Returns {"results": [...], "next_cursor": str or None}. Raises
+    NotTeamMember when p_team_id isn't one of the user's teams.
+    """
+    try:
+        rows = client.rpc("search_linguistics_results", params).execute().data or []
+    except Exception as e:
+        # insufficient_privilege, raised by the RPC's membership check
+        if getattr(e, "code", None) == "42501":
+            raise NotTeamMember(f"Not a member of team {params['p_team_id']}")
+        raise
+
+    # A full page may have more behind it; a short one is the last
+    next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["id"]) if len(rows) == params["p_limit"] else None
+    return {"results": rows, "next_cursor": next_cursor}
@@ -0,0 +1,280 @@
+"""
+Streaming audio uploads to Supabase Storage.
+
+An upload is never held in memory. The multipart request body is parsed
+incrementally with python-multipart's callback parser. The file part is
+re-cut into fixed-size chunks, counted and hashed as it passes, and
+streamed straight into a Supabase Storage upload. As soon as the byte count
+passes the caller's limit the upload is abandoned with FileTooLarge, so
+memory use per upload stays at roughly one chunk whatever the file size.
+"""
+
+import hashlib
+import os
+from urllib.parse import quote
+
+import httpx
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class StorageError(UploadError):
+    """Supabase Storage rejected or failed a request."""
+
+
+class FileTooLarge(UploadError):
+    def __init__(self, limit: int):
+        super().__init__(f"File exceeds the maximum size of {limit} bytes")
+        self.limit = limit
+
+
+class MultipartFileReader:
+    """Pulls one file field out of a streamed multipart/form-data body.
+
+    file_chunks() yields the file's bytes as the body arrives. Small text
+    fields are collected into `fields` and are complete once the body has
+    been read to the end.
+    """
+
+    def __init__(self, content_type: str, file_field: str = "file", max_field_bytes: int = 65536):
+        media_type, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected a multipart/form-data body")
+        self.file_field = file_field
+        self.max_field_bytes = max_field_bytes
+        self.fields = {}
+        self.filename = None
+        self.file_content_type = None
+        self.found_file = False
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._part = None  # ("file",) or ("field", name, bytearray) for the current part
+        self._pending = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        if name == self.file_field and not self.found_file:
+            self.found_file = True
+            self.filename = options.get(b"filename", b"").decode("utf-8", errors="replace") or None
+            self.file_content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+            self._part = ("file",)
+        elif b"filename" not in options:
+            self._part = ("field", name, bytearray())
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._part is None:
+            return
+        if self._part[0] == "file":
+            self._pending.append(data[start:end])
+            return
+        value = self._part[2]
+        if len(value) + end - start > self.max_field_bytes:
+            raise UploadError(f"Form field {self._part[1]} is too large")
+        value.extend(data[start:end])
+
+    def _on_part_end(self):
+        if self._part and self._part[0] == "field":
+            self.fields[self._part[1]] = self._part[2].decode("utf-8", errors="replace")
+        self._part = None
+
+    async def file_chunks(self, body):
+        """Feed `body` (an async iterator of bytes) to the parser, yielding the file's bytes."""
+        async for data in body:
+            if data:
+                try:
+                    self._parser.write(data)
+                except UploadError:
+                    raise
+                except Exception as e:
+                    raise UploadError(f"Malformed multipart body: {str(e)}")
+            if self._pending:
+                pending, self._pending = self._pending, []
+                for piece in pending:
+                    yield piece
+        self._parser.finalize()
+        if self._pending:
+            pending, self._pending = self._pending, []
+            for piece in pending:
+                yield piece
+
+
+class UploadStream:
+    """Re-cuts a byte stream into fixed-size chunks, counting and hashing it.
+
+    Raises FileTooLarge from inside the iteration as soon as more than
+    `max_bytes` have been read, which aborts whatever is consuming it.
+    """
+
+    def __init__(self, chunks, max_bytes: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunks = chunks
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def __aiter__(self):
+        buffer = bytearray()
+        async for piece in self.chunks:
+            self.size += len(piece)
+            if self.max_bytes is not None and self.size > self.max_bytes:
+                raise FileTooLarge(self.max_bytes)
+            self._sha256.update(piece)
+            buffer.extend(piece)
+            while len(buffer) >= self.chunk_size:
+                yield bytes(buffer[:self.chunk_size])
+                del buffer[:self.chunk_size]
+        if buffer:
+            yield bytes(buffer)
+
+
+class SupabaseStorage:
+    """Minimal async client for the Supabase Storage REST API."""
+
+    def __init__(self, url: str, key: str, bucket: str = "audio-uploads", timeout: float = 300.0,
+                 signed_url_seconds: int = 86400):
+        self.url = (url or "").rstrip("/")
+        self.key = key
+        self.bucket = bucket
+        self.timeout = timeout
+        self.signed_url_seconds = signed_url_seconds
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(self.timeout, connect=10.0))
+        return self._client
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.key}", "apikey": self.key}
+
+    def _object_url(self, path: str) -> str:
+        return f"{self.url}/storage/v1/object/{self.bucket}/{quote(path)}"
+
+    async def upload(self, path: str, chunks, content_type: str = "application/octet-stream"):
+        """Stream `chunks` (an async iterator of bytes) into `path` with chunked transfer encoding."""
+        try:
+            response = await self.client.post(
+                self._object_url(path),
+                headers={**self._headers(), "Content-Type": content_type, "x-upsert": "false"},
+                content=chunks,
+            )
+        except httpx.HTTPError as e:
+            raise StorageError(f"Storage upload failed: {str(e)}")
+        if response.status_code >= 400:
+            raise StorageError(f"Storage upload returned {response.status_code}: {response.text[:200]}")
+
+    async def delete(self, path: str):
+        try:
+            await self.client.request("DELETE", f"{self.url}/storage/v1/object/{self.bucket}",
+                                      headers=self._headers(), json={"prefixes": [path]})
+        except httpx.HTTPError as e:
+            print(f"Error deleting {path} from storage: {str(e)}")
+
+    async def signed_url(self, path: str) -> str:
+        try:
+            response = await self.client.post(
+                f"{self.url}/storage/v1/object/sign/{self.bucket}/{quote(path)}",
+                headers=self._headers(),
+                json={"expiresIn": self.signed_url_seconds},
+            )
+        except httpx.HTTPError as e:
+            raise StorageError(f"Storage signing failed: {str(e)}")
+        if response.status_code >= 400:
+            raise StorageError(f"Storage signing returned {response.status_code}: {response.text[:200]}")
+        return f"{self.url}/storage/v1{response.json()['signedURL']}"
+
+    def _is_own_object(self, url: httpx.URL) -> bool:
+        """True only for an object path on this project's storage origin (scheme, host and port)."""
+        if not self.url:
+            return False
+        own = httpx.URL(self.url)
+        if url.userinfo or (url.scheme, url.host, url.port) != (own.scheme, own.host, own.port):
+            return False
+        segments = url.path.split("/")
+        return url.path.startswith(f"{own.path.rstrip('/')}/storage/v1/object/") and ".." not in segments
+
+    def owns(self, url: str) -> bool:
+        """True if `url` is an object in this project's storage, the only place audio is fetched from."""
+        try:
+            return self._is_own_object(httpx.URL(url))
+        except httpx.InvalidURL:
+            return False
+
+    async def object_size(self, url: str):
+        """Return the Content-Length of `url` from a HEAD request, or None if it can't be read.
+
+        The service key is only sent to this project's own storage objects, and
+        such a request never follows a redirect (which could carry the key elsewhere).
+        """
+        try:
+            target = httpx.URL(url)
+        except httpx.InvalidURL as e:
+            print(f"Error reading size of {url}: {str(e)}")
+            return None
+        credentialed = self._is_own_object(target)
+        try:
+            response = await self.client.head(
+                target,
+                headers=self._headers() if credentialed else {},
+                follow_redirects=not credentialed
+            )
+        except httpx.HTTPError as e:
+            print(f"Error reading size of {url}: {str(e)}")
+            return None
+        length = response.headers.get("content-length")
+        if response.status_code >= 300 or not length or not length.isdigit():
+            return None
+        return int(length)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def upload_path(user_id: str, upload_id: str, filename: str) -> str:
+    name = os.path.basename(filename or "") or "audio"
+    # Keep storage keys to a safe character set
+    safe = "".join(ch if ch.isalnum() or ch in "._-" else "_" for ch in name)[-100:]
+    return f"{user_id}/{upload_id}-{safe}"
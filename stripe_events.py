@@ -0,0 +1,196 @@
+"""
+Background processing of Stripe webhook events.
+
+/stripe-webhook only verifies the signature and hands the event to
+StripeEventProcessor, so Stripe gets its acknowledgement immediately. A
+single worker then runs the handlers in arrival order, skipping events it
+has already applied (Stripe retries deliver the same event id again) and
+subscription updates older than one already applied (Stripe does not
+guarantee delivery order).
+
+Handlers raise on failure and are retried up to `max_attempts` times in
+quick succession. Stripe has already had its 2xx by then and will not
+deliver the event again, so an event that still fails is handed to
+`save_failed` (a durable store) and retried with exponential backoff, up to
+`max_retry_delay` apart, until it succeeds; `clear_failed` removes it from
+the store once it has. Events left in the store at shutdown are passed
+back to start() on the next run.
+"""
+
+import asyncio
+
+from cache import TTLCache
+
+# Events whose `created` timestamp is tracked per subscription
+_SUBSCRIPTION_EVENTS = (
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+)
+
+
+class StripeEventProcessor:
+    def __init__(self, handlers: dict, max_queue: int = 10000, seen_events: int = 50000,
+                 max_attempts: int = 3, retry_delay: float = 1.0, retry_backoff: float = 60.0,
+                 max_retry_delay: float = 3600.0, save_failed=None, clear_failed=None):
+        # save_failed(event, error) and clear_failed(event_id) are blocking calls
+        self.handlers = handlers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_backoff = retry_backoff
+        self.max_retry_delay = max_retry_delay
+        self.save_failed = save_failed
+        self.clear_failed = clear_failed
+        self._max_queue = max_queue
+        self._seen = TTLCache(maxsize=seen_events, ttl=None)
+        # Event ids waiting in the queue or being handled
+        self._in_flight = set()
+        # Subscription id -> `created` of the newest event applied to it
+        self._latest = TTLCache(maxsize=seen_events, ttl=None)
+        # Event id -> failed rounds so far, for events that have been handed to save_failed
+        self._rounds = {}
+        # Event id -> timer handle of its next retry
+        self._retries = {}
+        self._queue = None
+        self._task = None
+        self.processed = 0
+        self.duplicates = 0
+        self.stale = 0
+        self.failed = 0
+
+    async def start(self, saved_events: list = ()):
+        """Start the worker, first queueing `saved_events` left over from a previous run."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        for event in saved_events:
+            if self.submit(event) == "queued":
+                self._rounds.setdefault(event["id"], 1)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Stripe event queue did not drain within {timeout}s")
+        for handle in self._retries.values():
+            handle.cancel()
+        if self._retries:
+            print(f"Stopping with {len(self._retries)} failed Stripe events awaiting retry")
+        self._retries = {}
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def submit(self, event) -> str:
+        """Queue a verified event. Returns 'queued', 'duplicate' or 'ignored'.
+
+        Raises asyncio.QueueFull when the backlog is full, so the caller can ask
+        Stripe to retry later.
+        """
+        if event["type"] not in self.handlers:
+            return "ignored"
+        event_id = event["id"]
+        if event_id in self._seen or event_id in self._in_flight:
+            self.duplicates += 1
+            return "duplicate"
+        self._queue.put_nowait(event)
+        self._in_flight.add(event_id)
+        return "queued"
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _is_stale(self, event) -> bool:
+        if event["type"] not in _SUBSCRIPTION_EVENTS:
+            return False
+        subscription_id = event["data"]["object"]["id"]
+        created = event.get("created") or 0
+        latest = self._latest.peek(subscription_id)
+        # A late creation or update would undo a newer change; deletions always apply
+        return latest is not None and created < latest and event["type"] != "customer.subscription.deleted"
+
+    def _mark_applied(self, event):
+        self._seen.set(event["id"], True)
+        if event["type"] not in _SUBSCRIPTION_EVENTS:
+            return
+        subscription_id = event["data"]["object"]["id"]
+        created = event.get("created") or 0
+        latest = self._latest.peek(subscription_id)
+        if latest is None or created > latest:
+            self._latest.set(subscription_id, created)
+
+    async def _run(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                if self._is_stale(event):
+                    print(f"Ignoring out-of-order Stripe event {event['id']} ({event['type']})")
+                    self.stale += 1
+                    self._seen.set(event["id"], True)
+                    await self._resolved(event)
+                    continue
+                await self._handle(event)
+            finally:
+                # An event waiting for its next retry stays in flight, so a redelivery is a duplicate
+                if event["id"] not in self._retries:
+                    self._in_flight.discard(event["id"])
+                self._queue.task_done()
+
+    async def _handle(self, event):
+        handler = self.handlers[event["type"]]
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await handler(event)
+                self._mark_applied(event)
+                self.processed += 1
+                await self._resolved(event)
+                return
+            except Exception as e:
+                error = str(e)
+                print(f"Error handling Stripe event {event['id']} (attempt {attempt}): {error}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(self.retry_delay * attempt)
+        self.failed += 1
+        await self._schedule_retry(event, error)
+
+    async def _schedule_retry(self, event, error: str):
+        event_id = event["id"]
+        rounds = self._rounds.get(event_id, 0)
+        self._rounds[event_id] = rounds + 1
+        if self.save_failed is not None:
+            try:
+                await asyncio.to_thread(self.save_failed, event, error)
+            except Exception as e:
+                print(f"Error saving failed Stripe event {event_id}: {str(e)}")
+        delay = min(self.retry_backoff * 2 ** rounds, self.max_retry_delay)
+        print(f"Stripe event {event_id} ({event['type']}) failed {self.max_attempts} attempts, retrying in {delay:.0f}s")
+        self._retries[event_id] = asyncio.get_running_loop().call_later(delay, self._retry, event)
+
+    def _retry(self, event):
+        self._retries.pop(event["id"], None)
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._retries[event["id"]] = asyncio.get_running_loop().call_later(self.retry_backoff, self._retry, event)
+
+    async def _resolved(self, event):
+        # Drop a previously failed event from the store now that it is done with
+        if self._rounds.pop(event["id"], None) is None or self.clear_failed is None:
+            return
+        try:
+            await asyncio.to_thread(self.clear_failed, event["id"])
+        except Exception as e:
+            print(f"Error clearing failed Stripe event {event['id']}: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "stale": self.stale,
+            "failed": self.failed,
+            "retrying": len(self._retries),
+        }
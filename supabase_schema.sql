@@ -108,6 +108,26 @@ CREATE TABLE IF NOT EXISTS repspheres_behavioral_analysis (
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Linguistics Results Table (written by the backend's audio pipeline)
+CREATE TABLE IF NOT EXISTS repspheres_linguistics_results (
+  id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+  conversation_id UUID REFERENCES repspheres_conversations(id) ON DELETE CASCADE,
+  filename TEXT,
+  
+  transcription TEXT,
+  key_points JSONB,
+  pain_points JSONB,
+  objections JSONB,
+  next_steps JSONB,
+  sentiment TEXT,
+  full_analysis TEXT,
+  
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Whisper segments ({start, end, text}, seconds from the start of the recording)
+ALTER TABLE repspheres_linguistics_results ADD COLUMN IF NOT EXISTS transcript_segments JSONB;
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_repspheres_conversations_user_id ON repspheres_conversations(user_id);
 CREATE INDEX IF NOT EXISTS idx_repspheres_conversations_team_id ON repspheres_conversations(team_id);
@@ -119,11 +139,474 @@ CREATE INDEX IF NOT EXISTS idx_repspheres_behavioral_analysis_indicators ON reps
 CREATE INDEX IF NOT EXISTS idx_repspheres_behavioral_analysis_profiles ON repspheres_behavioral_analysis USING GIN (psychological_profiles);
 CREATE INDEX IF NOT EXISTS idx_repspheres_behavioral_analysis_key_moments ON repspheres_behavioral_analysis USING GIN (key_moments);
 
+-- Full-text search over linguistics results
+-- The owner columns are copied from the conversation so search can filter by
+-- user and team without a join; the triggers below keep them in step.
+ALTER TABLE repspheres_linguistics_results ADD COLUMN IF NOT EXISTS user_id UUID;
+ALTER TABLE repspheres_linguistics_results ADD COLUMN IF NOT EXISTS team_id UUID;
+
+-- Objections and pain points rank highest, then key points and next steps,
+-- then the analysis text, then the transcript. Being a generated column, the
+-- vector (and its GIN index) is updated by every insert the backend makes.
+ALTER TABLE repspheres_linguistics_results ADD COLUMN IF NOT EXISTS search_vector tsvector
+  GENERATED ALWAYS AS (
+    setweight(jsonb_to_tsvector('english', COALESCE(objections, '[]'::jsonb) || COALESCE(pain_points, '[]'::jsonb), '["string"]'), 'A') ||
+    setweight(jsonb_to_tsvector('english', COALESCE(key_points, '[]'::jsonb) || COALESCE(next_steps, '[]'::jsonb), '["string"]'), 'B') ||
+    setweight(to_tsvector('english', COALESCE(full_analysis, '')), 'C') ||
+    setweight(to_tsvector('english', COALESCE(transcription, '')), 'D')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_repspheres_linguistics_results_search ON repspheres_linguistics_results USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_repspheres_linguistics_results_conversation_id ON repspheres_linguistics_results(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_repspheres_linguistics_results_user_id ON repspheres_linguistics_results(user_id);
+CREATE INDEX IF NOT EXISTS idx_repspheres_linguistics_results_team_id ON repspheres_linguistics_results(team_id);
+CREATE INDEX IF NOT EXISTS idx_repspheres_team_members_user_id ON repspheres_team_members(user_id);
+
+CREATE OR REPLACE FUNCTION set_linguistics_result_owner()
+RETURNS TRIGGER AS $$
+BEGIN
+  SELECT c.user_id, c.team_id INTO NEW.user_id, NEW.team_id
+  FROM repspheres_conversations c
+  WHERE c.id = NEW.conversation_id;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS set_linguistics_result_owner ON repspheres_linguistics_results;
+CREATE TRIGGER set_linguistics_result_owner
+  BEFORE INSERT OR UPDATE OF conversation_id ON repspheres_linguistics_results
+  FOR EACH ROW EXECUTE FUNCTION set_linguistics_result_owner();
+
+CREATE OR REPLACE FUNCTION propagate_conversation_owner()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE repspheres_linguistics_results
+  SET user_id = NEW.user_id, team_id = NEW.team_id
+  WHERE conversation_id = NEW.id;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS propagate_conversation_owner ON repspheres_conversations;
+CREATE TRIGGER propagate_conversation_owner
+  AFTER UPDATE OF user_id, team_id ON repspheres_conversations
+  FOR EACH ROW
+  WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id OR OLD.team_id IS DISTINCT FROM NEW.team_id)
+  EXECUTE FUNCTION propagate_conversation_owner();
+
+-- Backfill the owner columns of results stored before this migration
+UPDATE repspheres_linguistics_results r
+SET user_id = c.user_id, team_id = c.team_id
+FROM repspheres_conversations c
+WHERE c.id = r.conversation_id AND r.user_id IS NULL;
+
+-- Ranked search for the backend's GET /search. p_query uses web search syntax
+-- ("quoted phrases", OR, -excluded). Without p_team_id it covers the user's own
+-- results and those of every team they belong to (as the conversations policy does);
+-- with it, only that team's, and the user must be a member. Pages are keyset
+-- paginated on (rank, id): pass the last row's rank and id to get the next page.
+-- Headlines are built only for the rows on the page.
+CREATE OR REPLACE FUNCTION search_linguistics_results(
+  p_user_id UUID,
+  p_query TEXT,
+  p_team_id UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 20,
+  p_after_rank REAL DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID,
+  conversation_id UUID,
+  user_id UUID,
+  team_id UUID,
+  title TEXT,
+  file_name TEXT,
+  sentiment TEXT,
+  objections JSONB,
+  pain_points JSONB,
+  created_at TIMESTAMP WITH TIME ZONE,
+  rank REAL,
+  headline TEXT
+) AS $$
+#variable_conflict use_column
+DECLARE
+  v_query tsquery := websearch_to_tsquery('english', p_query);
+BEGIN
+  IF p_team_id IS NOT NULL AND NOT EXISTS (
+    SELECT 1 FROM repspheres_team_members m WHERE m.team_id = p_team_id AND m.user_id = p_user_id
+  ) THEN
+    RAISE EXCEPTION 'Not a member of team %', p_team_id USING ERRCODE = '42501';
+  END IF;
+
+  RETURN QUERY
+  SELECT page.id, page.conversation_id, page.user_id, page.team_id, c.title, c.file_name,
+         page.sentiment, page.objections, page.pain_points, page.created_at, page.rank,
+         ts_headline('english', COALESCE(page.full_analysis, '') || E'\n' || COALESCE(page.transcription, ''), v_query,
+                     'MaxFragments=2, MinWords=8, MaxWords=24, StartSel=**, StopSel=**')
+  FROM (
+    SELECT ranked.*
+    FROM (
+      SELECT r.id, r.conversation_id, r.user_id, r.team_id, r.sentiment, r.objections, r.pain_points,
+             r.created_at, r.full_analysis, r.transcription,
+             -- Normalization 32 maps the rank into [0, 1) so it compares across documents
+             ts_rank_cd(r.search_vector, v_query, 32)::REAL AS rank
+      FROM repspheres_linguistics_results r
+      WHERE r.search_vector @@ v_query
+        AND CASE
+          WHEN p_team_id IS NOT NULL THEN r.team_id = p_team_id
+          ELSE r.user_id = p_user_id OR r.team_id IN (
+            SELECT m.team_id FROM repspheres_team_members m WHERE m.user_id = p_user_id
+          )
+        END
+    ) ranked
+    WHERE p_after_rank IS NULL OR (ranked.rank, ranked.id) < (p_after_rank, p_after_id)
+    ORDER BY ranked.rank DESC, ranked.id DESC
+    LIMIT LEAST(GREATEST(p_limit, 1), 100)
+  ) page
+  LEFT JOIN repspheres_conversations c ON c.id = page.conversation_id
+  ORDER BY page.rank DESC, page.id DESC;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER SET search_path = public;
+
+-- The function trusts p_user_id, so only the backend (service role) may call it.
+-- Supabase grants EXECUTE on new functions to anon and authenticated by default,
+-- which would let any client search another user's transcripts.
+REVOKE EXECUTE ON FUNCTION search_linguistics_results(UUID, TEXT, UUID, INTEGER, REAL, UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION search_linguistics_results(UUID, TEXT, UUID, INTEGER, REAL, UUID) TO service_role;
+
+-- Team analytics rollups
+-- Weekly aggregates per team and rep, updated incrementally by
+-- apply_conversation_rollups() when a conversation completes and again when its
+-- participants change, so dashboards never aggregate the raw tables.
+-- Conversations without a team are rolled up under the nil UUID. Weeks start
+-- on Monday (UTC), from meeting_date when set.
+CREATE TABLE IF NOT EXISTS repspheres_rollup_weekly (
+  team_id UUID NOT NULL,
+  user_id UUID NOT NULL,
+  week_start DATE NOT NULL,
+  
+  conversations INTEGER NOT NULL DEFAULT 0,
+  duration_seconds BIGINT NOT NULL DEFAULT 0,
+  
+  -- Sentiment of the analysis; conversations without one aren't counted
+  positive INTEGER NOT NULL DEFAULT 0,
+  neutral INTEGER NOT NULL DEFAULT 0,
+  negative INTEGER NOT NULL DEFAULT 0,
+  
+  objections INTEGER NOT NULL DEFAULT 0,
+  pain_points INTEGER NOT NULL DEFAULT 0,
+  
+  -- From repspheres_participants; the rep is the 'sales_rep' participant
+  rep_speaking_percentage_sum INTEGER NOT NULL DEFAULT 0,
+  rep_speaking_samples INTEGER NOT NULL DEFAULT 0,
+  rep_questions INTEGER NOT NULL DEFAULT 0,
+  prospect_questions INTEGER NOT NULL DEFAULT 0,
+  rep_interruptions INTEGER NOT NULL DEFAULT 0,
+  
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (team_id, user_id, week_start)
+);
+
+-- How many conversations raised each (normalized) objection
+CREATE TABLE IF NOT EXISTS repspheres_rollup_objections (
+  team_id UUID NOT NULL,
+  user_id UUID NOT NULL,
+  week_start DATE NOT NULL,
+  objection TEXT NOT NULL,
+  conversations INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (team_id, user_id, week_start, objection)
+);
+
+-- What each conversation currently contributes to the rollups, so a retried
+-- job can't count it twice and a re-analysis can swap its old numbers for new ones
+CREATE TABLE IF NOT EXISTS repspheres_rollup_applied (
+  conversation_id UUID PRIMARY KEY REFERENCES repspheres_conversations(id) ON DELETE CASCADE,
+  team_id UUID NOT NULL,
+  user_id UUID NOT NULL,
+  week_start DATE NOT NULL,
+  
+  -- 0 until the conversation has been counted
+  conversations INTEGER NOT NULL DEFAULT 0,
+  duration_seconds BIGINT NOT NULL DEFAULT 0,
+  positive INTEGER NOT NULL DEFAULT 0,
+  neutral INTEGER NOT NULL DEFAULT 0,
+  negative INTEGER NOT NULL DEFAULT 0,
+  objections INTEGER NOT NULL DEFAULT 0,
+  pain_points INTEGER NOT NULL DEFAULT 0,
+  rep_speaking_percentage_sum INTEGER NOT NULL DEFAULT 0,
+  rep_speaking_samples INTEGER NOT NULL DEFAULT 0,
+  rep_questions INTEGER NOT NULL DEFAULT 0,
+  prospect_questions INTEGER NOT NULL DEFAULT 0,
+  rep_interruptions INTEGER NOT NULL DEFAULT 0,
+  -- Normalized objections counted in repspheres_rollup_objections
+  objection_keys TEXT[] NOT NULL DEFAULT '{}',
+  
+  applied_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Bumped on every change to a scope ('team:<id>' or 'user:<id>'); the read
+-- endpoints derive their ETags from it without touching the rollups
+CREATE TABLE IF NOT EXISTS repspheres_rollup_versions (
+  scope TEXT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_repspheres_rollup_weekly_user_week ON repspheres_rollup_weekly(user_id, week_start);
+CREATE INDEX IF NOT EXISTS idx_repspheres_rollup_objections_user_week ON repspheres_rollup_objections(user_id, week_start);
+
+-- Add completed conversations to the rollups. Only conversations whose status
+-- is 'completed' are counted. A conversation counted before (e.g. re-analyzed
+-- since) has its previous contribution subtracted and the current one added;
+-- one whose numbers haven't changed (a retried job) is left alone.
+-- p_durations (optional, same order) overrides duration_seconds for callers
+-- whose status update hasn't been written yet. Returns one row per
+-- conversation whose contribution changed, with the scope it was previously
+-- counted under (NULL the first time).
+DROP FUNCTION IF EXISTS apply_conversation_rollups(UUID[], INTEGER[]);
+CREATE OR REPLACE FUNCTION apply_conversation_rollups(
+  p_conversation_ids UUID[],
+  p_durations INTEGER[] DEFAULT NULL
+)
+RETURNS TABLE (conversation_id UUID, team_id UUID, user_id UUID, week_start DATE,
+               previous_team_id UUID, previous_user_id UUID) AS $$
+#variable_conflict use_column
+DECLARE
+  v_position INTEGER;
+  v_conversation repspheres_conversations%ROWTYPE;
+  v_result repspheres_linguistics_results%ROWTYPE;
+  v_old repspheres_rollup_applied%ROWTYPE;
+  v_new repspheres_rollup_applied%ROWTYPE;
+  v_team UUID;
+  v_week DATE;
+  v_sentiment TEXT;
+  v_objections JSONB;
+  v_pain_points JSONB;
+BEGIN
+  FOR v_position IN 1 .. COALESCE(array_length(p_conversation_ids, 1), 0) LOOP
+    SELECT * INTO v_conversation FROM repspheres_conversations c WHERE c.id = p_conversation_ids[v_position];
+    CONTINUE WHEN NOT FOUND OR v_conversation.user_id IS NULL OR v_conversation.status IS DISTINCT FROM 'completed';
+    
+    v_team := COALESCE(v_conversation.team_id, '00000000-0000-0000-0000-000000000000'::UUID);
+    v_week := (date_trunc('week', COALESCE(v_conversation.meeting_date, v_conversation.created_at) AT TIME ZONE 'UTC'))::DATE;
+    
+    -- Claim the conversation's row and lock it, so concurrent calls for it take turns
+    INSERT INTO repspheres_rollup_applied (conversation_id, team_id, user_id, week_start)
+    VALUES (v_conversation.id, v_team, v_conversation.user_id, v_week)
+    ON CONFLICT DO NOTHING;
+    SELECT * INTO v_old FROM repspheres_rollup_applied a WHERE a.conversation_id = v_conversation.id FOR UPDATE;
+    
+    SELECT * INTO v_result FROM repspheres_linguistics_results r
+    WHERE r.conversation_id = v_conversation.id
+    ORDER BY r.created_at DESC
+    LIMIT 1;
+    v_sentiment := lower(COALESCE(v_result.sentiment, ''));
+    v_objections := CASE WHEN jsonb_typeof(v_result.objections) = 'array' THEN v_result.objections ELSE '[]'::JSONB END;
+    v_pain_points := CASE WHEN jsonb_typeof(v_result.pain_points) = 'array' THEN v_result.pain_points ELSE '[]'::JSONB END;
+    
+    SELECT
+      v_conversation.id, v_team, v_conversation.user_id, v_week, 1,
+      COALESCE(p_durations[v_position], v_conversation.duration_seconds, 0),
+      (v_sentiment LIKE '%positive%')::INTEGER,
+      (v_sentiment LIKE '%neutral%')::INTEGER,
+      (v_sentiment LIKE '%negative%')::INTEGER,
+      jsonb_array_length(v_objections),
+      jsonb_array_length(v_pain_points),
+      COALESCE(SUM(p.speaking_percentage) FILTER (WHERE p.role = 'sales_rep'), 0),
+      COUNT(p.speaking_percentage) FILTER (WHERE p.role = 'sales_rep'),
+      COALESCE(SUM(p.question_count) FILTER (WHERE p.role = 'sales_rep'), 0),
+      COALESCE(SUM(p.question_count) FILTER (WHERE p.role <> 'sales_rep'), 0),
+      COALESCE(SUM(p.interruption_count) FILTER (WHERE p.role = 'sales_rep'), 0),
+      -- Counted once per conversation, however often it repeats an objection
+      ARRAY(
+        SELECT DISTINCT left(lower(regexp_replace(btrim(item), '\s+', ' ', 'g')), 200)
+        FROM jsonb_array_elements_text(v_objections) AS item
+        WHERE btrim(item) <> ''
+        ORDER BY 1
+      ),
+      NOW()
+    INTO v_new
+    FROM repspheres_participants p
+    WHERE p.conversation_id = v_conversation.id;
+    
+    CONTINUE WHEN v_old.conversations > 0
+      AND (v_old.team_id, v_old.user_id, v_old.week_start, v_old.duration_seconds, v_old.positive, v_old.neutral,
+           v_old.negative, v_old.objections, v_old.pain_points, v_old.rep_speaking_percentage_sum,
+           v_old.rep_speaking_samples, v_old.rep_questions, v_old.prospect_questions, v_old.rep_interruptions,
+           v_old.objection_keys)
+        = (v_new.team_id, v_new.user_id, v_new.week_start, v_new.duration_seconds, v_new.positive, v_new.neutral,
+           v_new.negative, v_new.objections, v_new.pain_points, v_new.rep_speaking_percentage_sum,
+           v_new.rep_speaking_samples, v_new.rep_questions, v_new.prospect_questions, v_new.rep_interruptions,
+           v_new.objection_keys);
+    
+    IF v_old.conversations > 0 THEN
+      UPDATE repspheres_rollup_weekly w SET
+        conversations = w.conversations - v_old.conversations,
+        duration_seconds = w.duration_seconds - v_old.duration_seconds,
+        positive = w.positive - v_old.positive,
+        neutral = w.neutral - v_old.neutral,
+        negative = w.negative - v_old.negative,
+        objections = w.objections - v_old.objections,
+        pain_points = w.pain_points - v_old.pain_points,
+        rep_speaking_percentage_sum = w.rep_speaking_percentage_sum - v_old.rep_speaking_percentage_sum,
+        rep_speaking_samples = w.rep_speaking_samples - v_old.rep_speaking_samples,
+        rep_questions = w.rep_questions - v_old.rep_questions,
+        prospect_questions = w.prospect_questions - v_old.prospect_questions,
+        rep_interruptions = w.rep_interruptions - v_old.rep_interruptions,
+        updated_at = NOW()
+      WHERE w.team_id = v_old.team_id AND w.user_id = v_old.user_id AND w.week_start = v_old.week_start;
+      DELETE FROM repspheres_rollup_weekly w
+      WHERE w.team_id = v_old.team_id AND w.user_id = v_old.user_id AND w.week_start = v_old.week_start
+        AND w.conversations <= 0;
+      
+      UPDATE repspheres_rollup_objections o SET conversations = o.conversations - 1
+      WHERE o.team_id = v_old.team_id AND o.user_id = v_old.user_id AND o.week_start = v_old.week_start
+        AND o.objection = ANY (v_old.objection_keys);
+      DELETE FROM repspheres_rollup_objections o
+      WHERE o.team_id = v_old.team_id AND o.user_id = v_old.user_id AND o.week_start = v_old.week_start
+        AND o.objection = ANY (v_old.objection_keys) AND o.conversations <= 0;
+    END IF;
+    
+    INSERT INTO repspheres_rollup_weekly AS w (
+      team_id, user_id, week_start, conversations, duration_seconds, positive, neutral, negative,
+      objections, pain_points, rep_speaking_percentage_sum, rep_speaking_samples, rep_questions,
+      prospect_questions, rep_interruptions, updated_at
+    )
+    VALUES (
+      v_new.team_id, v_new.user_id, v_new.week_start, v_new.conversations, v_new.duration_seconds,
+      v_new.positive, v_new.neutral, v_new.negative, v_new.objections, v_new.pain_points,
+      v_new.rep_speaking_percentage_sum, v_new.rep_speaking_samples, v_new.rep_questions,
+      v_new.prospect_questions, v_new.rep_interruptions, NOW()
+    )
+    ON CONFLICT (team_id, user_id, week_start) DO UPDATE SET
+      conversations = w.conversations + EXCLUDED.conversations,
+      duration_seconds = w.duration_seconds + EXCLUDED.duration_seconds,
+      positive = w.positive + EXCLUDED.positive,
+      neutral = w.neutral + EXCLUDED.neutral,
+      negative = w.negative + EXCLUDED.negative,
+      objections = w.objections + EXCLUDED.objections,
+      pain_points = w.pain_points + EXCLUDED.pain_points,
+      rep_speaking_percentage_sum = w.rep_speaking_percentage_sum + EXCLUDED.rep_speaking_percentage_sum,
+      rep_speaking_samples = w.rep_speaking_samples + EXCLUDED.rep_speaking_samples,
+      rep_questions = w.rep_questions + EXCLUDED.rep_questions,
+      prospect_questions = w.prospect_questions + EXCLUDED.prospect_questions,
+      rep_interruptions = w.rep_interruptions + EXCLUDED.rep_interruptions,
+      updated_at = NOW();
+    
+    INSERT INTO repspheres_rollup_objections AS o (team_id, user_id, week_start, objection, conversations)
+    SELECT v_new.team_id, v_new.user_id, v_new.week_start, keys.objection, 1
+    FROM unnest(v_new.objection_keys) AS keys(objection)
+    ON CONFLICT (team_id, user_id, week_start, objection) DO UPDATE SET
+      conversations = o.conversations + 1;
+    
+    UPDATE repspheres_rollup_applied a SET
+      team_id = v_new.team_id,
+      user_id = v_new.user_id,
+      week_start = v_new.week_start,
+      conversations = v_new.conversations,
+      duration_seconds = v_new.duration_seconds,
+      positive = v_new.positive,
+      neutral = v_new.neutral,
+      negative = v_new.negative,
+      objections = v_new.objections,
+      pain_points = v_new.pain_points,
+      rep_speaking_percentage_sum = v_new.rep_speaking_percentage_sum,
+      rep_speaking_samples = v_new.rep_speaking_samples,
+      rep_questions = v_new.rep_questions,
+      prospect_questions = v_new.prospect_questions,
+      rep_interruptions = v_new.rep_interruptions,
+      objection_keys = v_new.objection_keys,
+      applied_at = NOW()
+    WHERE a.conversation_id = v_conversation.id;
+    
+    INSERT INTO repspheres_rollup_versions AS v (scope, version, updated_at)
+    SELECT DISTINCT scopes.scope, 1, NOW()
+    FROM unnest(ARRAY[
+      'team:' || v_new.team_id, 'user:' || v_new.user_id,
+      'team:' || v_old.team_id, 'user:' || v_old.user_id
+    ]) AS scopes(scope)
+    ON CONFLICT (scope) DO UPDATE SET version = v.version + 1, updated_at = NOW();
+    
+    conversation_id := v_conversation.id;
+    team_id := v_new.team_id;
+    user_id := v_new.user_id;
+    week_start := v_new.week_start;
+    previous_team_id := CASE WHEN v_old.conversations > 0 THEN v_old.team_id END;
+    previous_user_id := CASE WHEN v_old.conversations > 0 THEN v_old.user_id END;
+    RETURN NEXT;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Roll up completed conversations that aren't counted yet, oldest first, at
+-- most p_batch_size per call. Returns how many were looked at; call until 0
+-- (backfill_rollups.py does). Safe to re-run at any time.
+CREATE OR REPLACE FUNCTION backfill_conversation_rollups(p_batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER AS $$
+DECLARE
+  v_ids UUID[];
+BEGIN
+  SELECT array_agg(pending.id) INTO v_ids
+  FROM (
+    SELECT c.id FROM repspheres_conversations c
+    WHERE c.status = 'completed'
+      AND c.user_id IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM repspheres_rollup_applied a WHERE a.conversation_id = c.id AND a.conversations > 0)
+    ORDER BY c.created_at
+    LIMIT p_batch_size
+  ) pending;
+  
+  PERFORM apply_conversation_rollups(v_ids);
+  RETURN COALESCE(array_length(v_ids, 1), 0);
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Participants are usually inserted by the frontend after the analysis has
+-- completed, so any change to them re-applies their conversation's rollups.
+-- Only completed conversations are affected, and an unchanged contribution is
+-- a no-op. Runs as the owner, since callers can't execute the rollup function
+-- themselves, and a rollup failure never blocks the participant write.
+CREATE OR REPLACE FUNCTION reapply_participant_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+  BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.conversation_id IS NOT NULL THEN
+      PERFORM apply_conversation_rollups(ARRAY[OLD.conversation_id]);
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.conversation_id IS NOT NULL
+       AND (TG_OP = 'INSERT' OR NEW.conversation_id IS DISTINCT FROM OLD.conversation_id) THEN
+      PERFORM apply_conversation_rollups(ARRAY[NEW.conversation_id]);
+    END IF;
+  EXCEPTION WHEN OTHERS THEN
+    RAISE WARNING 'Could not update rollups for participant %: %', COALESCE(NEW.id, OLD.id), SQLERRM;
+  END;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS reapply_participant_rollups ON repspheres_participants;
+CREATE TRIGGER reapply_participant_rollups
+  AFTER INSERT OR UPDATE OR DELETE ON repspheres_participants
+  FOR EACH ROW EXECUTE FUNCTION reapply_participant_rollups();
+
+-- Both rollup functions write every team's aggregates, so only the backend
+-- (service role) and backfill_rollups.py may call them, not anon or authenticated.
+REVOKE EXECUTE ON FUNCTION apply_conversation_rollups(UUID[], INTEGER[]) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_conversation_rollups(UUID[], INTEGER[]) TO service_role;
+REVOKE EXECUTE ON FUNCTION backfill_conversation_rollups(INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION backfill_conversation_rollups(INTEGER) TO service_role;
+
 -- Enable Row Level Security (RLS)
 ALTER TABLE repspheres_conversations ENABLE ROW LEVEL SECURITY;
 ALTER TABLE repspheres_participants ENABLE ROW LEVEL SECURITY;
 ALTER TABLE repspheres_behavioral_analysis ENABLE ROW LEVEL SECURITY;
 ALTER TABLE repspheres_team_members ENABLE ROW LEVEL SECURITY;
+ALTER TABLE repspheres_linguistics_results ENABLE ROW LEVEL SECURITY;
+-- Rollups have no policies: only the backend (service role) reads them
+ALTER TABLE repspheres_rollup_weekly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE repspheres_rollup_objections ENABLE ROW LEVEL SECURITY;
+ALTER TABLE repspheres_rollup_applied ENABLE ROW LEVEL SECURITY;
+ALTER TABLE repspheres_rollup_versions ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies
 -- Users can only see their own conversations or their team's conversations
@@ -166,6 +649,22 @@ CREATE POLICY "Users can view repspheres analysis of their conversations"
     )
   ));
 
+-- Linguistics results belong to the owner of their conversation (user_id and
+-- team_id are copied from it by set_linguistics_result_owner before the check
+-- runs), and are visible wherever the conversation is
+DROP POLICY IF EXISTS "Users can view their own repspheres linguistics results" ON repspheres_linguistics_results;
+CREATE POLICY "Users can view their own repspheres linguistics results"
+  ON repspheres_linguistics_results
+  FOR SELECT
+  USING (auth.uid() = user_id OR team_id IN (
+    SELECT team_id FROM repspheres_team_members WHERE user_id = auth.uid()
+  ));
+
+CREATE POLICY "Users can insert repspheres linguistics results for their conversations"
+  ON repspheres_linguistics_results
+  FOR INSERT
+  WITH CHECK (auth.uid() = user_id);
+
 -- Create RLS policies for team_members
 CREATE POLICY "Users can view their repspheres team memberships"
   ON repspheres_team_members
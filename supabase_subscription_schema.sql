@@ -12,10 +12,14 @@ CREATE TABLE IF NOT EXISTS user_limits (
   monthly_quota INTEGER NOT NULL DEFAULT 10, -- Number of analyses allowed per month
   max_file_size INTEGER NOT NULL DEFAULT 25000000, -- Maximum file size in bytes (25MB for free tier)
   usage_reset_date TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT (NOW() + INTERVAL '30 days'),
+  usage_count INTEGER NOT NULL DEFAULT 0, -- Analyses used in the current period (maintained by reserve_usage_slot)
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Add the usage counter to existing installs
+ALTER TABLE user_limits ADD COLUMN IF NOT EXISTS usage_count INTEGER NOT NULL DEFAULT 0;
+
 -- User Usage Table (Usage Tracking)
 CREATE TABLE IF NOT EXISTS user_usage (
   id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -39,6 +43,18 @@ CREATE TABLE IF NOT EXISTS stripe_customers (
   updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Stripe events whose handler kept failing after the webhook was acknowledged.
+-- The backend retries them with backoff, deletes each row once its event has
+-- been applied, and picks up whatever is left here when it restarts.
+CREATE TABLE IF NOT EXISTS stripe_failed_events (
+  event_id TEXT PRIMARY KEY,
+  event_type TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  last_error TEXT,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_user_usage_user_id ON user_usage(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_usage_created_at ON user_usage(created_at);
@@ -48,6 +64,8 @@ CREATE INDEX IF NOT EXISTS idx_stripe_customers_customer_id ON stripe_customers(
 ALTER TABLE user_limits ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_usage ENABLE ROW LEVEL SECURITY;
 ALTER TABLE stripe_customers ENABLE ROW LEVEL SECURITY;
+-- No policies: only the backend (service role) reads or writes failed events
+ALTER TABLE stripe_failed_events ENABLE ROW LEVEL SECURITY;
 
 -- Create RLS policies
 -- Users can only see their own limits
@@ -90,22 +108,146 @@ BEGIN
   -- Update the reset date for users whose reset date has passed
   UPDATE user_limits
   SET usage_reset_date = NOW() + INTERVAL '30 days',
+      usage_count = 0,
       updated_at = NOW()
   WHERE usage_reset_date <= NOW();
 END;
 $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+-- Atomically check the quota, bump the usage counter and record the usage row.
+-- The user's limits row is locked for the duration, so concurrent uploads cannot
+-- both get past the quota. The period rolls over once usage_reset_date has passed.
+-- Pass p_enforce_quota = FALSE to record usage without checking the quota, and
+-- p_record_usage = FALSE to only bump the counter when the caller writes the
+-- user_usage row itself later (the backend's write-behind buffer does this).
+DROP FUNCTION IF EXISTS reserve_usage_slot(UUID, TEXT, INTEGER, BOOLEAN);
+CREATE OR REPLACE FUNCTION reserve_usage_slot(
+  p_user_id UUID,
+  p_request_type TEXT,
+  p_file_size INTEGER DEFAULT 0,
+  p_enforce_quota BOOLEAN DEFAULT TRUE,
+  p_record_usage BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE (allowed BOOLEAN, current_usage INTEGER, quota INTEGER, reset_date TIMESTAMP WITH TIME ZONE) AS $$
+DECLARE
+  v_limits user_limits%ROWTYPE;
+BEGIN
+  SELECT * INTO v_limits FROM user_limits WHERE user_limits.user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN QUERY SELECT FALSE, 0, 0, NULL::TIMESTAMP WITH TIME ZONE;
+    RETURN;
+  END IF;
+
+  IF v_limits.usage_reset_date <= NOW() THEN
+    v_limits.usage_count := 0;
+    v_limits.usage_reset_date := NOW() + INTERVAL '30 days';
+  END IF;
+
+  allowed := NOT (p_enforce_quota AND v_limits.usage_count >= v_limits.monthly_quota);
+  IF allowed THEN
+    v_limits.usage_count := v_limits.usage_count + 1;
+    IF p_record_usage THEN
+      INSERT INTO user_usage (user_id, request_type, file_size)
+      VALUES (p_user_id, p_request_type, p_file_size);
+    END IF;
+  END IF;
+
+  UPDATE user_limits
+  SET usage_count = v_limits.usage_count,
+      usage_reset_date = v_limits.usage_reset_date,
+      updated_at = NOW()
+  WHERE user_limits.user_id = p_user_id;
+
+  current_usage := v_limits.usage_count;
+  quota := v_limits.monthly_quota;
+  reset_date := v_limits.usage_reset_date;
+  RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Batch variant of reserve_usage_slot: grants as many of the requested slots as
+-- the remaining quota allows (in order) and records all granted usage rows with
+-- one bulk insert (unless p_record_usage = FALSE). Returns how many of
+-- p_file_sizes were granted.
+DROP FUNCTION IF EXISTS reserve_usage_slots(UUID, TEXT, INTEGER[]);
+CREATE OR REPLACE FUNCTION reserve_usage_slots(
+  p_user_id UUID,
+  p_request_type TEXT,
+  p_file_sizes INTEGER[],
+  p_record_usage BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE (granted INTEGER, current_usage INTEGER, quota INTEGER, reset_date TIMESTAMP WITH TIME ZONE) AS $$
+DECLARE
+  v_limits user_limits%ROWTYPE;
+BEGIN
+  SELECT * INTO v_limits FROM user_limits WHERE user_limits.user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN QUERY SELECT 0, 0, 0, NULL::TIMESTAMP WITH TIME ZONE;
+    RETURN;
+  END IF;
+
+  IF v_limits.usage_reset_date <= NOW() THEN
+    v_limits.usage_count := 0;
+    v_limits.usage_reset_date := NOW() + INTERVAL '30 days';
+  END IF;
+
+  granted := GREATEST(0, LEAST(COALESCE(array_length(p_file_sizes, 1), 0), v_limits.monthly_quota - v_limits.usage_count));
+  IF granted > 0 THEN
+    v_limits.usage_count := v_limits.usage_count + granted;
+  END IF;
+  IF granted > 0 AND p_record_usage THEN
+    INSERT INTO user_usage (user_id, request_type, file_size)
+    SELECT p_user_id, p_request_type, sizes.file_size
+    FROM unnest(p_file_sizes) WITH ORDINALITY AS sizes(file_size, position)
+    WHERE sizes.position <= granted;
+  END IF;
+
+  UPDATE user_limits
+  SET usage_count = v_limits.usage_count,
+      usage_reset_date = v_limits.usage_reset_date,
+      updated_at = NOW()
+  WHERE user_limits.user_id = p_user_id;
+
+  current_usage := v_limits.usage_count;
+  quota := v_limits.monthly_quota;
+  reset_date := v_limits.usage_reset_date;
+  RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Give back slots reserved with p_record_usage = FALSE for requests that then
+-- failed before any work was queued (the backend's upload endpoint does this).
+CREATE OR REPLACE FUNCTION release_usage_slots(
+  p_user_id UUID,
+  p_count INTEGER DEFAULT 1
+)
+RETURNS TABLE (current_usage INTEGER, quota INTEGER, reset_date TIMESTAMP WITH TIME ZONE) AS $$
+BEGIN
+  RETURN QUERY
+  UPDATE user_limits
+  SET usage_count = GREATEST(0, user_limits.usage_count - GREATEST(0, p_count)),
+      updated_at = NOW()
+  WHERE user_limits.user_id = p_user_id
+  RETURNING user_limits.usage_count, user_limits.monthly_quota, user_limits.usage_reset_date;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- The reservation functions trust p_user_id, so only the backend (service role)
+-- may call them. Supabase grants EXECUTE on new functions to anon and
+-- authenticated by default, which would let any client spend another user's quota.
+REVOKE EXECUTE ON FUNCTION reserve_usage_slot(UUID, TEXT, INTEGER, BOOLEAN, BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reserve_usage_slot(UUID, TEXT, INTEGER, BOOLEAN, BOOLEAN) TO service_role;
+REVOKE EXECUTE ON FUNCTION reserve_usage_slots(UUID, TEXT, INTEGER[], BOOLEAN) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION reserve_usage_slots(UUID, TEXT, INTEGER[], BOOLEAN) TO service_role;
+REVOKE EXECUTE ON FUNCTION release_usage_slots(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION release_usage_slots(UUID, INTEGER) TO service_role;
+
 -- Example of how to query usage data:
 --
 -- -- Get a user's current usage for the current period
--- SELECT COUNT(*) as current_usage
--- FROM user_usage
--- WHERE user_id = '00000000-0000-0000-0000-000000000000'
--- AND created_at >= (
---   SELECT usage_reset_date - INTERVAL '30 days'
---   FROM user_limits
---   WHERE user_id = '00000000-0000-0000-0000-000000000000'
--- );
+-- SELECT CASE WHEN usage_reset_date <= NOW() THEN 0 ELSE usage_count END as current_usage
+-- FROM user_limits
+-- WHERE user_id = '00000000-0000-0000-0000-000000000000';
 --
 -- -- Get users approaching their quota (80% or more used)
 -- SELECT u.user_id, u.email, l.tier, l.monthly_quota, COUNT(us.*) as usage_count
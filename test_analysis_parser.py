@@ -0,0 +1,61 @@
+"""
+Golden-file tests for analysis_parser.py.
+
+Each fixtures/analysis/<name>.txt is a GPT-4 analysis in one of the shapes
+the model produces; <name>.json is what it must parse to. The streaming
+parser is fed the same text in pieces of several sizes and has to end up
+with the same result, having emitted every list item as an insight.
+
+Run with: python -m pytest test_analysis_parser.py
+"""
+
+import glob
+import json
+import os
+
+import pytest
+
+from analysis_parser import LIST_FIELDS, AnalysisStreamParser, parse_analysis
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "analysis")
+NAMES = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(FIXTURES, "*.txt")))
+
+
+def load(name: str):
+    with open(os.path.join(FIXTURES, f"{name}.txt"), encoding="utf-8") as f:
+        text = f.read()
+    with open(os.path.join(FIXTURES, f"{name}.json"), encoding="utf-8") as f:
+        expected = json.load(f)
+    return text, expected
+
+
+def test_fixtures_found():
+    assert NAMES
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_parse_analysis(name):
+    text, expected = load(name)
+    assert parse_analysis(text) == expected
+
+
+@pytest.mark.parametrize("piece", [1, 4, 17, None])
+@pytest.mark.parametrize("name", NAMES)
+def test_stream_parser(name, piece):
+    text, expected = load(name)
+    parser = AnalysisStreamParser()
+    insights = []
+    pieces = [text] if piece is None else [text[i:i + piece] for i in range(0, len(text), piece)]
+    for chunk in pieces:
+        insights.extend(parser.feed(chunk))
+    insights.extend(parser.close())
+
+    assert parser.parsed == expected
+    for field in LIST_FIELDS:
+        assert [value for name_, value in insights if name_ == field] == expected[field]
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_windows_line_endings(name):
+    text, expected = load(name)
+    assert parse_analysis(text.replace("\n", "\r\n")) == expected
@@ -0,0 +1,126 @@
+"""
+Content-addressed cache of Whisper transcripts.
+
+Transcripts are keyed by a SHA-256 of the audio bytes (plus the model that
+produced them), so a re-upload of the same recording under another name, or
+a re-analysis after a failed run, skips the transcription step entirely.
+
+Two tiers: a small in-memory LRU in front of a size-bounded directory on
+local disk. Disk entries are evicted least-recently-used first once the
+directory grows past `max_disk_bytes`.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+from cache import TTLCache
+
+
+class TranscriptCache:
+    def __init__(self, memory_items: int = 256, directory: str = None, max_disk_bytes: int = 500000000):
+        self.memory = TTLCache(maxsize=memory_items, ttl=None)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_hits = 0
+        self.disk_evictions = 0
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key_for(audio: bytes, model: str = "whisper-1") -> str:
+        return TranscriptCache.key_for_digest(hashlib.sha256(audio).hexdigest(), model)
+
+    @staticmethod
+    def key_for_digest(sha256_hex: str, model: str = "whisper-1") -> str:
+        """Key for audio whose SHA-256 is already known (e.g. hashed while uploading)."""
+        return f"{model}-{sha256_hex}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def get(self, key: str):
+        transcript = self.memory.get(key)
+        if transcript is not None or not self.directory:
+            return transcript
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                transcript = f.read()
+            # Touch the file so disk eviction is least-recently-used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"Error reading cached transcript {key}: {str(e)}")
+            return None
+        self.disk_hits += 1
+        self.memory.set(key, transcript)
+        return transcript
+
+    def set(self, key: str, transcript: str):
+        self.memory.set(key, transcript)
+        if not self.directory:
+            return
+        path = self._path(key)
+        data = transcript.encode("utf-8")
+        with self._lock:
+            current = self._current_disk_bytes()
+            try:
+                # Write to a temp file first so readers never see a partial transcript
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                previous = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Error writing cached transcript {key}: {str(e)}")
+                return
+            self._disk_bytes = current + len(data) - previous
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def invalidate(self, key: str):
+        self.memory.invalidate(key)
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+                self._disk_bytes = None
+            except FileNotFoundError:
+                pass
+
+    def _entries(self):
+        with os.scandir(self.directory) as it:
+            return [entry for entry in it if entry.is_file() and entry.name.endswith(".txt")]
+
+    def _current_disk_bytes(self) -> int:
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(entry.stat().st_size for entry in self._entries())
+        return self._disk_bytes
+
+    def _evict_disk(self):
+        # Oldest access first; stop once we're back under 90% of the limit
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        target = self.max_disk_bytes * 0.9
+        for entry in entries:
+            if self._disk_bytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self._disk_bytes -= size
+            self.disk_evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk_enabled": bool(self.directory),
+            "disk_bytes": self._disk_bytes,
+            "disk_hits": self.disk_hits,
+            "disk_evictions": self.disk_evictions,
+        }
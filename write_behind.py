@@ -0,0 +1,200 @@
+"""
+Write-behind buffer for non-critical Supabase writes.
+
+Conversation status transitions are coalesced per conversation (only the
+latest status is written, carrying any extra fields queued before it) and
+user_usage rows are batched into bulk inserts. A background task flushes
+the buffer when it grows past `max_pending` entries or every
+`flush_interval` seconds, failed writes are retried on later flushes, and
+stop() flushes whatever is left on shutdown. When a bulk write fails its
+entries are written one at a time, so a single bad row is retried (and
+eventually dropped) on its own instead of taking the batch down with it.
+
+Quota reservations are NOT buffered; they stay synchronous so the counter
+is durable before a request is admitted.
+"""
+
+import asyncio
+import json
+
+
+class WriteBehindBuffer:
+    def __init__(self, write_status_group, write_usage_rows, max_pending: int = 200,
+                 flush_interval: float = 1.0, max_attempts: int = 5):
+        # write_status_group(payload, conversation_ids) and write_usage_rows(rows) are blocking calls
+        self.write_status_group = write_status_group
+        self.write_usage_rows = write_usage_rows
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._statuses = {}
+        self._status_attempts = {}
+        self._usage_rows = []
+        self._wakeup = None
+        self._task = None
+        self._stopping = False
+        self._flush_lock = None
+        self.flushed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def update_status(self, conversation_id: str, status: str, **fields):
+        """Queue a status transition; a later one for the same conversation replaces it."""
+        self._statuses[conversation_id] = {**self._statuses.get(conversation_id, {}), "status": status, **fields}
+        self._maybe_wake()
+
+    def log_usage(self, row: dict):
+        self._usage_rows.append((0, row))
+        self._maybe_wake()
+
+    def pending(self) -> int:
+        return len(self._statuses) + len(self._usage_rows)
+
+    def _maybe_wake(self):
+        if self._wakeup is not None and self.pending() >= self.max_pending:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing write-behind buffer: {str(e)}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            statuses, self._statuses = self._statuses, {}
+            usage_rows, self._usage_rows = self._usage_rows, []
+
+            await self._write_statuses(statuses)
+
+            if usage_rows:
+                try:
+                    await asyncio.to_thread(self.write_usage_rows, [row for _, row in usage_rows])
+                    failed = []
+                except Exception as e:
+                    print(f"Error writing {len(usage_rows)} usage rows: {str(e)}")
+                    failed = await asyncio.to_thread(
+                        self._write_singly,
+                        lambda entry: self.write_usage_rows([entry[1]]),
+                        usage_rows
+                    )
+                self.flushed += len(usage_rows) - len(failed)
+                if failed:
+                    self._requeue_usage(failed)
+
+    async def flush_statuses(self, conversation_ids: list):
+        """Write the queued status updates for `conversation_ids` now, ahead of the next flush.
+
+        Updates that fail stay queued for retry like any other.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            statuses = {
+                conversation_id: self._statuses.pop(conversation_id)
+                for conversation_id in conversation_ids if conversation_id in self._statuses
+            }
+            await self._write_statuses(statuses)
+
+    async def _write_statuses(self, statuses: dict):
+        # Conversations moving to an identical payload share one bulk update
+        groups = {}
+        for conversation_id, payload in statuses.items():
+            key = json.dumps(payload, sort_keys=True, default=str)
+            groups.setdefault(key, (payload, []))[1].append(conversation_id)
+        for payload, conversation_ids in groups.values():
+            try:
+                await asyncio.to_thread(self.write_status_group, payload, conversation_ids)
+                failed = []
+            except Exception as e:
+                print(f"Error writing {len(conversation_ids)} status updates: {str(e)}")
+                failed = await asyncio.to_thread(
+                    self._write_singly,
+                    lambda conversation_id: self.write_status_group(payload, [conversation_id]),
+                    conversation_ids
+                )
+            self.flushed += len(conversation_ids) - len(failed)
+            for conversation_id in set(conversation_ids).difference(failed):
+                self._status_attempts.pop(conversation_id, None)
+            if failed:
+                self._requeue_statuses(payload, failed)
+
+    def _write_singly(self, write, entries: list):
+        """Write each entry on its own after its batch failed; return the ones that still fail."""
+        if len(entries) == 1:
+            return entries
+        failed = []
+        for entry in entries:
+            try:
+                write(entry)
+            except Exception as e:
+                print(f"Error writing buffered entry: {str(e)}")
+                failed.append(entry)
+        return failed
+
+    def _requeue_statuses(self, payload: dict, conversation_ids: list):
+        for conversation_id in conversation_ids:
+            attempts = self._status_attempts.get(conversation_id, 0) + 1
+            if conversation_id in self._statuses:
+                # A newer transition was queued meanwhile; it wins, but keep the older extra fields
+                self._statuses[conversation_id] = {**payload, **self._statuses[conversation_id]}
+            elif attempts >= self.max_attempts:
+                print(f"Dropping status update for conversation {conversation_id} after {attempts} attempts")
+                self._status_attempts.pop(conversation_id, None)
+                self.dropped += 1
+                continue
+            else:
+                self._statuses[conversation_id] = payload
+            self._status_attempts[conversation_id] = attempts
+            self.retried += 1
+
+    def _requeue_usage(self, usage_rows: list):
+        retry = []
+        for attempts, row in usage_rows:
+            if attempts + 1 >= self.max_attempts:
+                print(f"Dropping usage row for user {row.get('user_id')} after {attempts + 1} attempts")
+                self.dropped += 1
+            else:
+                retry.append((attempts + 1, row))
+        self.retried += len(retry)
+        self._usage_rows = retry + self._usage_rows
+
+    async def stop(self):
+        """Stop the background task and flush everything still pending."""
+        if self._task is not None:
+            # The task is signalled rather than cancelled, so a flush in progress
+            # finishes instead of losing the entries it has already taken
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for _ in range(self.max_attempts):
+            if not self.pending():
+                break
+            await self.flush()
+        if self.pending():
+            print(f"Write-behind buffer stopped with {self.pending()} unwritten entries")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending(),
+            "flushed": self.flushed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+        }